@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
 
+import io
+import numpy
+from AssayLib.Exceptions import AsValueError
+
 
 ################################################################################
 # this module only defines functions
@@ -11,3 +15,49 @@ def array2d2string(A, fmt = "%.4f", sep = "\t"):
 
 def array2d2string_by_row(A, row_fmt):
 	return ("\n").join([row_fmt % tuple(i) for i in A])
+
+################################################################################
+# bulk writer of 2d arrays, writes exactly the same as
+#   fh.write(array2d2string(A, fmt, sep) + "\n")
+# but formats chunk_rows rows at once, by a single '%' with a format string
+# repeated for every cell of the chunk, instead of one '%' per cell and the
+# joins; each chunk is written to fh as soon as formatted
+def write_array2d(fh, A, fmt = "%.4f", sep = "\t", chunk_rows = 512):
+	A = numpy.asarray(A)
+	if A.ndim != 2:
+		raise AsValueError("write_array2d: expected a 2d array, got shape %s"\
+			% str(A.shape))
+	nrow, ncol = A.shape
+	if nrow == 0:
+		fh.write("\n")
+		return
+	row_fmt = sep.join([fmt] * ncol) + "\n"
+	chunk_fmt = row_fmt * chunk_rows
+	for i in range(0, nrow, chunk_rows):
+		chunk = A[i:i + chunk_rows]
+		if len(chunk) < chunk_rows:
+			chunk_fmt = row_fmt * len(chunk)
+		fh.write(chunk_fmt % tuple(chunk.ravel().tolist()))
+
+################################################################################
+# same result as array2d2string, using write_array2d
+def format_array2d(A, fmt = "%.4f", sep = "\t"):
+	buf = io.StringIO()
+	write_array2d(buf, A, fmt, sep)
+	return buf.getvalue()[:-1]
+
+################################################################################
+# result table file, genes and categories in the first two lines, then the
+# table, as saved by samples and exported from results stores
+def write_table_with_genes(path, genes, categories, array2d):
+	with open(path, "w") as fh:
+		fh.write(vector2string(genes, "%s") + "\n")
+		fh.write(vector2string(categories, "%s") + "\n")
+		write_array2d(fh, array2d, "%2f")
+
+# add rows at the end of a table written by write_table_with_genes
+def append_table_rows(path, array2d):
+	if not len(array2d):
+		return
+	with open(path, "a") as fh:
+		write_array2d(fh, array2d, "%2f")
@@ -3,10 +3,20 @@
 import os
 import sys
 import numpy
-from AssayLib.Exceptions import AsRuntimeError
+from AssayLib.Exceptions import AsRuntimeError, AsValueError
 from AssayLib.Layout import Layout
+from AssayLib.LayoutRegistry import get_layout_registry
 from AssayLib.DataParser import DataParser
+from AssayLib.SharedData import SharedPlateData
+from AssayLib.PlateTensor import PlateTensor
+from AssayLib.ParameterSweep import ParameterSweep
+from AssayLib.Bootstrap import XELIBootstrap
+from AssayLib.ELinePlot import ELinePlotQueue
+from AssayLib.ResultsStore import PlateResultsStore, RESULTS_EXTENSIONS,\
+	check_results_backend
+from AssayLib.StageTimer import StageTimer
 from AssayLib.Log import Log
+from AssayLib.UtilFunctions import plate_type_to_shape
 from AssayLib.ArrayFormatting import array2d2string
 
 
@@ -15,16 +25,34 @@ from AssayLib.ArrayFormatting import array2d2string
 # organizes calculations
 # it also manages output, all end-term users is recommended to use ONLY this
 # class as an interface for command-line calculation
+# analysis_mode is the default mode used by analyze(), see below
+# plots deferred by samples are rendered at the end of analyze(), by a pool of
+# plot_processes processes
+# log_level ("summary", "debug" or "trace") and log_arrays are passed to Log
+# results_backend is "tsv" (one file per sample and result), "npz" or "hdf5"
+# (one results store per plate, see ResultsStore)
+# timing is False, True (wall and cpu time of each stage of each sample) or
+# "memory" (also allocated bytes), see enable_timing
 class AssayPlate(object):
-	def __init__(self, name, size, outdir = "./output/", **kw):
+	def __init__(self, name, size, outdir = "./output/",
+				analysis_mode = "sample", plot_processes = 1,
+				log_level = "trace", log_arrays = False,
+				results_backend = "tsv", results_compress = True,
+				timing = False, **kw):
 		super(AssayPlate, self).__init__()
 		self.name = name
+		self.analysis_mode = analysis_mode
+		self.plot_queue = ELinePlotQueue(processes = plot_processes)
 		self.outdir = outdir + name
 		self.create_output_dir(self.outdir, **kw)
-		self.create_log()
+		self.create_log(level = log_level, dump_arrays = log_arrays)
+		self.create_results_store(results_backend, results_compress)
 		self.size = size
 		self.set_plate_layout(**kw)
 		self.samples = []
+		self.timer = None
+		if timing:
+			self.enable_timing(memory = (timing == "memory"))
 		# for now only allow one untreated sample
 		self._control = None
 		self.load_data_file(**kw)
@@ -46,20 +74,60 @@ class AssayPlate(object):
 	def output_dir(self):
 		return self.outdir
 
-	def create_log(self, file = None):
+	def create_log(self, file = None, level = "trace", dump_arrays = False):
 		if file:
-			self.log_obj = Log(file = file)
+			self.log_obj = Log(file = file, level = level,
+								dump_arrays = dump_arrays)
 		else:
-			self.log_obj = Log(dir = self.outdir)
+			self.log_obj = Log(dir = self.outdir, level = level,
+								dump_arrays = dump_arrays)
 
 	def log(self):
 		return self.log_obj
 
+	def create_results_store(self, backend = "tsv", compress = True):
+		self.results = None
+		if check_results_backend(backend) != "tsv":
+			path = "%s/results%s" % (self.outdir, RESULTS_EXTENSIONS[backend])
+			self.results = PlateResultsStore(path, backend = backend,
+											compress = compress,
+											meta = dict(plate = self.name))
+
+	# path of the results store, None if results are saved as tsv files
+	def results_path(self):
+		return self.results and self.results.path
+
+	def _save_results_store(self):
+		if self.results is None:
+			return
+		self.results.meta.update(size = self.size,
+			data_file = self.data_file,
+			untreated = self.untreated_sample() and\
+				self.untreated_sample().name())
+		for sample in self.samples:
+			self.results.add_sample(sample)
+		self.results.save()
+
 	############################################################################
 	# layout functions
 	# the layout here are not position specific
 	# samples using this layout should calculate the actual coords themselves
-	def set_plate_layout(self, layout = None, **kw):
+	# layout can be a Layout object, or a layout file
+	# with layout_collection (a collection directory), a layout named as one in
+	# the collection, by name (e.g. "EColi.96.P3") or file, is the shared one
+	# from its LayoutRegistry
+	def set_plate_layout(self, layout = None, layout_collection = None, **kw):
+		if isinstance(layout, Layout):
+			self.shared_layout = layout
+			return
+		if layout_collection and layout:
+			registry = get_layout_registry(layout_collection)
+			name = os.path.basename(layout)
+			if name.endswith(".layout"):
+				name = name[:-len(".layout")]
+			if name in registry:
+				self.shared_layout = registry.get(name)
+				return
 		self.shared_layout = Layout(layout)
 
 	def plate_layout(self):
@@ -69,6 +137,7 @@ class AssayPlate(object):
 	# sample functions
 	def add_sample(self, SampleClass, name, layout = None, offset = None,
 				untreated = False, **kw):
+		self._check_sample_cells(name, layout or self.shared_layout, offset)
 		# internal _id is same as the position in the self.samples array
 		_id = len(self.samples)
 		sample = SampleClass(name = name,
@@ -77,6 +146,9 @@ class AssayPlate(object):
 							assay_data = self.data(),
 							outdir = self.output_dir(),
 							offset = offset,
+							plot_queue = self.plot_queue,
+							results = self.results,
+							timer = self.timer,
 							_id = len(self.samples), **kw)
 		self.samples.append(sample)
 		if untreated:
@@ -84,6 +156,17 @@ class AssayPlate(object):
 				raise AsRuntimeError("assign more than one sample as untreated is not allowed")
 			self._control = sample
 
+	# all cells of a sample, its layout coords plus offset, must be on the plate
+	def _check_sample_cells(self, name, layout, offset):
+		if offset is None:
+			return
+		coords = layout.all_coords() + numpy.asarray(offset, dtype = int)
+		nr, nc = plate_type_to_shape(self.size)
+		if (coords.min() < 0) or (coords[:, 0].max() >= nr) or\
+			(coords[:, 1].max() >= nc):
+			raise AsValueError("sample '%s' at offset %s does not fit on a %s-well plate" %\
+				(name, str(tuple(offset)), str(self.size)))
+
 	def get_sample(self, index):
 		return self.samples[index]
 
@@ -97,18 +180,135 @@ class AssayPlate(object):
 		control = self.untreated_sample()
 		return [i for i in self.all_samples() if (not(i is control))]
 
+	############################################################################
+	# stage timing, see StageTimer
+	# the analysis stages of all samples are recorded by one timer; stages are
+	# those of "sample" mode analyses and updates, a "tensor" mode analysis
+	# runs no stage of the samples
+	# enabling again starts a new timer, records so far are dropped
+	# disabling closes the timer and its hooks, tracemalloc started by them is
+	# stopped
+	def enable_timing(self, memory = False):
+		self.disable_timing()
+		self.timer = StageTimer(memory = memory)
+		for sample in self.samples:
+			sample.set_timer(self.timer)
+		return self.timer
+
+	def disable_timing(self):
+		if not (self.timer is None):
+			self.timer.close()
+		self.timer = None
+		for sample in self.samples:
+			sample.set_timer(None)
+
+	# attach a hook (e.g. ProfileHook or TracemallocHook) to the named stages
+	# of all samples, or all stages if stages is None; enables timing if not
+	def add_timing_hook(self, hook, stages = None):
+		if self.timer is None:
+			self.enable_timing()
+		return self.timer.add_hook(hook, stages)
+
+	# tab-delimited table of the recorded stages, see StageTimer.report
+	def timing_report(self, by_stage = False):
+		if self.timer is None:
+			raise AsRuntimeError("timing is not enabled on plate '%s'" % self.name)
+		return self.timer.report(by_stage = by_stage)
+
 	############################################################################
 	# raw data
-	def load_data_file(self, data_file = None, **kw):
-		if data_file:
-			self._data = DataParser(data_file, self.size).parse()
+	# parse_func is passed to DataParser, can be the name of a parse engine
+	# data_cache is passed to DataParser as cache, a PlateDataCache object or
+	# a cache directory
+	# with data (a _PlateData), the file is not parsed, e.g. for a plate of a
+	# multi-plate export parsed once by DataParser.parse_plates:
+	#   plates = DataParser(data_file, 96).parse_plates()
+	#   for label, data in zip(plates.labels(), plates):
+	#       assay = AssayPlate(label, 96, data_file = data_file, data = data, ...)
+	def load_data_file(self, data_file = None, parse_func = None,
+						data_cache = None, data = None, **kw):
+		self.data_file = data_file
+		self._data = data
+		if (data is None) and data_file:
+			self._data = DataParser(data_file, self.size,
+									parse_func = parse_func,
+									cache = data_cache).parse()
 
 	def data(self):
 		return self._data
 
+	############################################################################
+	# replace the raw data of the plate and all its samples, e.g. with the
+	# data() of a StreamingDataParser following a run in progress; analyze()
+	# can then be called again for preliminary results
+	def set_data(self, data):
+		self._data = data
+		for sample in self.samples:
+			sample.raw_data = data
+
+	############################################################################
+	# move the raw data into memory-mapped files (see SharedPlateData), so that
+	# it is attached rather than copied by worker processes it is sent to,
+	# with the samples or by itself
+	# returns the SharedPlateData, which the caller closes when done
+	def share_data(self, dir = None):
+		shared = SharedPlateData(self.data(), dir = dir)
+		self.set_data(shared.data())
+		return shared
+
+	############################################################################
+	# incremental analysis of growing data, e.g. of a StreamingDataParser
+	# the first call, or with refit, runs a full analyze() which also fits the
+	# e-line models; later calls keep the models and only analyze the reads
+	# added since, P, I and XELI are extended in place (see SamplePrototype)
+	# data replaced by set_data must extend the previous data, or use refit
+	# new rows are appended to the tsv tables, a results store is only written
+	# by the full analysis and by flush_results(), not by every update
+	# returns the number of reads analyzed so far
+	def update(self, data = None, refit = False):
+		if not (data is None):
+			self.set_data(data)
+		if (self.untreated_sample() is None):
+			raise AsRuntimeError("cannot canculate I with no assign of untreated sample")
+		control = self.untreated_sample()
+		if refit or (not control.is_incremental()):
+			self.analyze()
+			for sample in self.samples:
+				sample.start_incremental()
+		elif self.data().n_reads() > control.n_analyzed_reads():
+			for sample in self.samples:
+				sample.run_P_update()
+			for sample in self.get_samples_except_untreated():
+				sample.run_XELI_update(control.P())
+			self.log_obj.flush()
+			self.render_deferred_plots()
+		return control.n_analyzed_reads()
+
+	# write the results store with the results of the updates so far
+	def flush_results(self):
+		self._save_results_store()
+
 	############################################################################
 	# analysis samples
-	def analyze(self):
+	# mode "sample" runs the analysis sample by sample
+	# mode "tensor" stacks all samples and runs each stage once for the whole
+	# plate (see PlateTensor), requires all samples to share the plate layout
+	# a full analysis ends any incremental analysis, see update()
+	def analyze(self, mode = None):
+		mode = mode or self.analysis_mode
+		for sample in self.samples:
+			sample.stop_incremental()
+		if mode == "tensor":
+			self._analyze_tensor()
+		elif mode == "sample":
+			self._analyze_samples()
+		else:
+			raise AsValueError("unknown analysis mode '%s'" % mode)
+		self._save_results_store()
+		self.log_obj.flush()
+		self.render_deferred_plots()
+
+	def _analyze_samples(self):
 		# analyze P
 		for sample in self.samples:
 			sample.run_P_analysis()
@@ -119,6 +319,58 @@ class AssayPlate(object):
 		for sample in self.get_samples_except_untreated():
 			sample.run_XELI_analysis(untreated_P)
 
+	############################################################################
+	# analyze again with changed sample parameters, e.g. retune(sd_factor = 3)
+	# or retune(samples = [...], eline_selector = "mad"), see set_params of
+	# the sample classes
+	# this always runs in "sample" mode, each sample recomputes only the
+	# stages of its stage graph depending on the changed parameters; I and
+	# XELI are cheap and always recomputed
+	def retune(self, samples = None, **params):
+		for sample in (self.samples if samples is None else samples):
+			sample.set_params(**params)
+		self.analyze(mode = "sample")
+
+	############################################################################
+	# P, I and XELI for all combinations of sd_factors and e-line selections,
+	# without writing results, see ParameterSweep; returns a SweepResult
+	# e.g. sweep([1.5, 2, 3], {"all": "all", "no_A1": [False] + [True] * 7})
+	def sweep(self, sd_factors, eline_selections = None):
+		if (self.untreated_sample() is None):
+			raise AsRuntimeError("cannot canculate I with no assign of untreated sample")
+		return ParameterSweep(self.samples, self.untreated_sample(),
+							sd_factors, eline_selections).run()
+
+	############################################################################
+	# bootstrap confidence intervals of XELI of an analyzed plate, see
+	# XELIBootstrap for the keywords (seed, resample, alpha, chunk_size and
+	# processes); each sample saves them as <name>.XELI_CI.tsv (or in the
+	# results store), lower bounds in the first row and upper in the second
+	# returns {sample name: (2, well) bounds}
+	def bootstrap(self, n_replicates = 1000, **kw):
+		if (self.untreated_sample() is None):
+			raise AsRuntimeError("cannot canculate I with no assign of untreated sample")
+		boot = XELIBootstrap(self.samples, self.untreated_sample(),
+							n_replicates = n_replicates, **kw)
+		ret = boot.run()
+		for sample in self.get_samples_except_untreated():
+			sample.save_XELI_CI(ret[sample.name()])
+			self.log_obj.write(boot.message(sample))
+		self._save_results_store()
+		self.log_obj.flush()
+		return ret
+
+	def _analyze_tensor(self):
+		if (self.untreated_sample() is None):
+			raise AsRuntimeError("cannot canculate I with no assign of untreated sample")
+		return PlateTensor(self.samples, self.untreated_sample()).run()
+
+	############################################################################
+	# render plots deferred by samples, returns number of rendered and skipped
+	# (unchanged since last rendering) plots
+	def render_deferred_plots(self):
+		return self.plot_queue.render()
+
 
 
 
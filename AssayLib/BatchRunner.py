@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+
+import os
+import glob
+import time
+import queue
+import functools
+import multiprocessing
+from AssayLib.Exceptions import AsRuntimeError, AsValueError
+from AssayLib.AssayPlate import AssayPlate
+from AssayLib.DataParser import DataParser
+from AssayLib.SharedData import SharedPlateData
+from AssayLib.EColiSample import EColiSample
+
+
+################################################################################
+# PlateJob object describes everything needed to analyze one plate without any
+# user interaction: data file, layout, sample offsets and the untreated sample
+# it only holds plain values, so it can be sent to worker processes
+# plates is for multi-plate exports (see DataParser.parse_plates): "*" for
+# all plates, or a list of plate labels, e.g. ["Plate 1", "Plate 3"]; each
+# plate is analyzed with the same layout and samples, as plate
+# '<name>.<label>' (spaces in labels replaced by '_'); None (default) for
+# an export of one plate
+class PlateJob(object):
+	def __init__(self, name, plate_type, data_file, layout, offsets,
+				untreated = 0, sample_names = None, plates = None):
+		super(PlateJob, self).__init__()
+		self.name = name
+		self.plate_type = int(plate_type)
+		self.data_file = data_file
+		self.layout = layout
+		self.offsets = [tuple(i) for i in offsets]
+		self.untreated = int(untreated)
+		# follow the naming of the GUI, C1, C2, ... if not assigned
+		self.sample_names = sample_names or\
+			["C%d" % (i + 1) for i in range(len(self.offsets))]
+		if len(self.sample_names) != len(self.offsets):
+			raise AsValueError("plate '%s': %d sample names for %d offsets"\
+				% (name, len(self.sample_names), len(self.offsets)))
+		if not (0 <= self.untreated < len(self.offsets)):
+			raise AsValueError("plate '%s': untreated sample index %d out of range"\
+				% (name, self.untreated))
+		self.plates = parse_plate_labels(plates)
+
+	def __repr__(self):
+		return "<PlateJob name='%s' samples='%d'>" % (self.name,
+													len(self.offsets))
+
+
+################################################################################
+# PlateResult object is what a worker sends back after running a PlateJob
+# error is None if the plate finished successfully
+class PlateResult(object):
+	def __init__(self, name, wall_time, error = None):
+		super(PlateResult, self).__init__()
+		self.name = name
+		self.wall_time = wall_time
+		self.error = error
+
+	def __repr__(self):
+		return "<PlateResult name='%s' status='%s'>" % (self.name,
+														self.status())
+
+	def ok(self):
+		return self.error is None
+
+	def status(self):
+		return "OK" if self.ok() else "FAILED"
+
+
+################################################################################
+# offsets are written as "row,col" pairs separated by ";", e.g. "0,0;0,1;0,2"
+def parse_offsets(text):
+	offsets = []
+	for pair in text.split(";"):
+		pair = pair.strip()
+		if not pair:
+			continue
+		try:
+			r, c = pair.split(",")
+			offsets.append((int(r), int(c)))
+		except ValueError:
+			raise AsValueError("bad sample offset '%s', expect 'row,col'" % pair)
+	if not offsets:
+		raise AsValueError("no sample offset found in '%s'" % text)
+	return offsets
+
+
+################################################################################
+# plates of a multi-plate export, "*" or labels as a list or separated by ";"
+# e.g. "Plate 1;Plate 3"; None or empty for a single-plate export
+def parse_plate_labels(plates):
+	if isinstance(plates, str):
+		plates = plates.strip()
+		if plates == "*":
+			return plates
+		plates = [i.strip() for i in plates.split(";") if i.strip()]
+	return list(plates) if plates else None
+
+
+################################################################################
+# load jobs from a tab-delimited manifest file
+# first line is the header, naming the columns below (any order):
+#   name, plate_type, data_file, layout, offsets, untreated
+# sample_names is optional, and separated by ";" like offsets
+# plates is optional, the plates of a multi-plate export (see PlateJob and
+# parse_plate_labels)
+# empty lines and lines starting with '#' are ignored
+# relative paths are resolved against the directory of the manifest
+MANIFEST_COLUMNS = ("name", "plate_type", "data_file", "layout", "offsets",
+					"untreated")
+
+def read_manifest(file, sep = "\t"):
+	base_dir = os.path.dirname(os.path.abspath(file))
+	with open(file, "r") as fh:
+		lines = [l.rstrip("\r\n") for l in fh]
+	lines = [l for l in lines if l.strip() and not l.startswith("#")]
+	if not lines:
+		raise AsRuntimeError("manifest '%s' is empty" % file)
+	header = [i.strip() for i in lines[0].split(sep)]
+	missing = [i for i in MANIFEST_COLUMNS if not (i in header)]
+	if missing:
+		raise AsRuntimeError("manifest '%s' missing column(s): %s"\
+			% (file, ", ".join(missing)))
+
+	jobs = []
+	for line_no, line in enumerate(lines[1:], 2):
+		fields = line.split(sep)
+		if len(fields) != len(header):
+			raise AsRuntimeError("manifest '%s': expect %d fields, got %d in record %d"\
+				% (file, len(header), len(fields), line_no))
+		rec = dict(zip(header, [i.strip() for i in fields]))
+		names = rec.get("sample_names")
+		jobs.append(PlateJob(name = rec["name"],
+							plate_type = rec["plate_type"],
+							data_file = os.path.join(base_dir, rec["data_file"]),
+							layout = os.path.join(base_dir, rec["layout"]),
+							offsets = parse_offsets(rec["offsets"]),
+							untreated = rec["untreated"],
+							sample_names = names and names.split(";") or None,
+							plates = rec.get("plates")))
+	return jobs
+
+################################################################################
+# create one job per reader export found in a directory, all plates share the
+# same layout and sample mapping; plate name is the file name without extension
+# plates is passed to every job, for multi-plate exports
+def jobs_from_directory(data_dir, plate_type, layout, offsets, untreated = 0,
+						pattern = "*.txt", plates = None):
+	files = sorted(glob.glob(os.path.join(data_dir, pattern)))
+	if not files:
+		raise AsRuntimeError("no file matches '%s' in '%s'" % (pattern,
+																data_dir))
+	return [PlateJob(name = os.path.splitext(os.path.basename(f))[0],
+					plate_type = plate_type,
+					data_file = f,
+					layout = layout,
+					offsets = offsets,
+					untreated = untreated,
+					plates = plates) for f in files]
+
+
+################################################################################
+# the plates of a job, as tasks (job, plate name, data, error) for
+# run_plate_task; a single-plate export is one task named by the job, its
+# data None (parsed by the task); a multi-plate export is read here once, and
+# gives one task per plate, named '<name>.<label>', with the plate data
+# an export or a plate that cannot be parsed gives a task with the error
+# tasks are made lazily, the export is read when the first task of the job
+# is asked for
+def plate_tasks(job):
+	if job.plates is None:
+		yield (job, job.name, None, None)
+		return
+	try:
+		plates = DataParser(job.data_file, job.plate_type).parse_plates()
+		labels = plates.labels() if job.plates == "*" else job.plates
+	except Exception as err:
+		yield (job, job.name, None, _error_message(err))
+		return
+	for label in labels:
+		name = "%s.%s" % (job.name, label.replace(" ", "_"))
+		try:
+			data = plates[label]
+		except Exception as err:
+			yield (job, name, None, _error_message(err))
+			continue
+		yield (job, name, data, None)
+
+def _error_message(err):
+	return "%s: %s" % (err.__class__.__name__, str(err))
+
+
+################################################################################
+# run a single plate, this is the function executed by worker processes
+# exceptions (any Exception, not only those of AssayLib) are caught and
+# reported back, one bad plate should not break the whole batch
+# with bootstrap_kw, AssayPlate.bootstrap(**bootstrap_kw) is run after the
+# analysis
+def run_plate_task(task, outdir = "./output/", overwrite = False,
+				SampleClass = EColiSample, plate_kw = None, sample_kw = None,
+				bootstrap_kw = None):
+	job, name, data, error = task
+	t0 = time.perf_counter()
+	if error is None:
+		try:
+			_run_plate(job, name, data, outdir, overwrite, SampleClass,
+						plate_kw or {}, sample_kw, bootstrap_kw)
+		except Exception as err:
+			error = _error_message(err)
+	return PlateResult(name, time.perf_counter() - t0, error)
+
+# all plates of a job, one PlateResult each, in the current process
+def run_plate_job(job, **kw):
+	return [run_plate_task(task, **kw) for task in plate_tasks(job)]
+
+# analyze one plate of a job, with data already parsed or None
+def _run_plate(job, name, data, outdir, overwrite, SampleClass, plate_kw,
+				sample_kw, bootstrap_kw):
+	assay = AssayPlate(name, job.plate_type,
+						outdir = os.path.join(outdir, ""),
+						overwrite = overwrite,
+						layout = job.layout,
+						data_file = job.data_file, data = data, **plate_kw)
+	for i, (sample, offset) in enumerate(zip(job.sample_names, job.offsets)):
+		assay.add_sample(SampleClass, name = sample, offset = offset,
+						untreated = (i == job.untreated), **(sample_kw or {}))
+	assay.analyze()
+	if bootstrap_kw:
+		assay.bootstrap(**bootstrap_kw)
+
+# a task run by the pool, its result is returned with its index
+def _run_indexed_plate_task(index, task, kw):
+	return index, run_plate_task(task, **kw)
+
+# error callback of a pool task, an error not caught by run_plate_task (e.g.
+# the task could not be sent to the worker) is still the result of the plate
+def _indexed_task_error(done, index, name, err):
+	done.put((index, PlateResult(name, 0.0, _error_message(err))))
+
+
+################################################################################
+# BatchRunner object works through a list of PlateJob's, either in the current
+# process (processes = 1) or with a process pool
+# each plate of a multi-plate export is a task of its own (see plate_tasks),
+# the export is read once, and its plates are sent to the pool as shared data
+# (see SharedPlateData); at most tasks_per_process x processes tasks are in
+# the pool at a time, so that only the data of their plates is shared at once
+# per-plate result is reported as soon as a plate is done, by the callbacks
+# passed as 'report'
+# plate_kw is passed to every AssayPlate, bootstrap_kw to every
+# AssayPlate.bootstrap (no bootstrap if None), other keywords to every sample
+class BatchRunner(object):
+	def __init__(self, jobs, outdir = "./output/", processes = 1,
+				overwrite = False, SampleClass = EColiSample, plate_kw = None,
+				bootstrap_kw = None, tasks_per_process = 2, **sample_kw):
+		super(BatchRunner, self).__init__()
+		self.jobs = list(jobs)
+		self.outdir = outdir
+		self.processes = max(1, int(processes or 1))
+		self.tasks_per_process = max(1, int(tasks_per_process))
+		self.run_kw = dict(outdir = outdir, overwrite = overwrite,
+						SampleClass = SampleClass, plate_kw = plate_kw,
+						sample_kw = sample_kw, bootstrap_kw = bootstrap_kw)
+		self.results = []
+		self.total_wall_time = 0.0
+
+	def __repr__(self):
+		return "<BatchRunner plates='%d' processes='%d'>" % (len(self.jobs),
+															self.processes)
+
+	def _iter_results(self):
+		if self.processes == 1:
+			for job in self.jobs:
+				for task in plate_tasks(job):
+					yield run_plate_task(task, **self.run_kw)
+			return
+		# a new task is only made and sent when one in the pool is done, the
+		# shared data of a plate is kept by task index, and removed once its
+		# result is back
+		tasks = enumerate(task for job in self.jobs for task in plate_tasks(job))
+		window = self.tasks_per_process * self.processes
+		done = queue.Queue()
+		shared = {}
+		running = 0
+		try:
+			with multiprocessing.Pool(self.processes) as pool:
+				for index, task in tasks:
+					if running >= window:
+						yield self._next_result(done, shared)
+						running -= 1
+					task = self._share_task(index, task, shared)
+					pool.apply_async(_run_indexed_plate_task,
+						(index, task, self.run_kw), callback = done.put,
+						error_callback = functools.partial(_indexed_task_error,
+															done, index, task[1]))
+					running += 1
+				while running:
+					yield self._next_result(done, shared)
+					running -= 1
+		finally:
+			for i in list(shared.values()):
+				i.close()
+
+	# the data of a task is put in a SharedPlateData, so that the task sent to
+	# a worker process only carries a handle of it
+	@staticmethod
+	def _share_task(index, task, shared):
+		job, name, data, error = task
+		if data is None:
+			return task
+		try:
+			shared[index] = SharedPlateData(data)
+		except Exception as err:
+			return (job, name, None, _error_message(err))
+		return (job, name, shared[index].data(), error)
+
+	@staticmethod
+	def _next_result(done, shared):
+		index, result = done.get()
+		if index in shared:
+			shared.pop(index).close()
+		return result
+
+	def run(self, report = None):
+		self.results = []
+		t0 = time.perf_counter()
+		for result in self._iter_results():
+			self.results.append(result)
+			if report:
+				report(result)
+		self.total_wall_time = time.perf_counter() - t0
+		return self.results
+
+	############################################################################
+	# throughput summary of the last run
+	def failed(self):
+		return [i for i in self.results if not i.ok()]
+
+	def summary(self):
+		n = len(self.results)
+		wall = self.total_wall_time
+		plate_time = sum([i.wall_time for i in self.results])
+		m = """plates: %d (%d failed)
+processes: %d
+total wall time: %.3f s
+mean per-plate time: %.3f s
+throughput: %.3f plates/s (%.1f plates/h)"""
+		return m % (n, len(self.failed()), self.processes, wall,
+					(plate_time / n) if n else 0.0,
+					(n / wall) if wall else 0.0,
+					(n / wall * 3600) if wall else 0.0)
+
+	# one line per plate, tabs and newlines in error messages (e.g. of the
+	# DataParser) are escaped as '\\t' and '\\n'
+	def save_report(self, path):
+		with open(path, "w") as fh:
+			fh.write("name\tstatus\twall_time\terror\n")
+			for i in self.results:
+				fh.write("%s\t%s\t%f\t%s\n" % (i.name, i.status(), i.wall_time,
+												self._escape(i.error or "")))
+
+	@staticmethod
+	def _escape(text):
+		return text.replace("\\", "\\\\").replace("\t", "\\t").\
+			replace("\r", "\\r").replace("\n", "\\n")
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.BatchRunner
+if __name__ == "__main__":
+	import filecmp
+	import tempfile
+	import unittest
+
+	class test(unittest.TestCase):
+		def setUp(self):
+			self.tmp = tempfile.TemporaryDirectory()
+
+		def tearDown(self):
+			self.tmp.cleanup()
+
+		def test_parse_offsets(self):
+			self.assertEqual(parse_offsets("0,0; 0,1;"), [(0, 0), (0, 1)])
+			with self.assertRaises(AsValueError):
+				parse_offsets("0;1")
+
+		def test_manifest(self):
+			manifest = os.path.join(self.tmp.name, "manifest.tsv")
+			with open(manifest, "w") as fh:
+				fh.write("name\tplate_type\tdata_file\tlayout\toffsets\tuntreated\n")
+				for name in ["P1", "P2"]:
+					fh.write("%s\t96\t%s\t%s\t0,0;0,1\t0\n" % (name,
+						os.path.abspath("./example/plate_data.txt"),
+						os.path.abspath("./example/EColi.96.P2.layout")))
+			jobs = read_manifest(manifest)
+			self.assertEqual([i.name for i in jobs], ["P1", "P2"])
+			self.assertEqual(jobs[0].sample_names, ["C1", "C2"])
+
+			jobs.append(PlateJob("bad", 96, "./example/missing.txt",
+								"./example/EColi.96.P2.layout", [(0, 0)]))
+			outdirs = []
+			for processes in [1, 2]:
+				outdir = os.path.join(self.tmp.name, "out%d" % processes)
+				runner = BatchRunner(jobs, outdir = outdir,
+									processes = processes, eline_selector = "all")
+				results = runner.run()
+				self.assertEqual(sorted([i.name for i in results]),
+								["P1", "P2", "bad"])
+				self.assertEqual([i.name for i in runner.failed()], ["bad"])
+				outdirs.append(outdir)
+			for name in ["P1", "P2"]:
+				cmp = filecmp.dircmp(os.path.join(outdirs[0], name),
+									os.path.join(outdirs[1], name))
+				tables = [i for i in cmp.common_files if i.endswith(".tsv")]
+				self.assertTrue(tables)
+				match, mismatch, errors = filecmp.cmpfiles(cmp.left, cmp.right,
+														tables, shallow = False)
+				self.assertEqual(mismatch + errors, [])
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+import warnings
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+from AssayLib.Exceptions import AsRuntimeError, AsValueError
+from AssayLib.EColiSample import EColiSample
+from AssayLib.ParameterSweep import corrected_P
+
+
+################################################################################
+# bootstrap confidence intervals of XELI
+# resample:
+#   time:  time points (reads) are drawn with replacement, the same draw for
+#          all samples of a replicate, since I pairs each sample with the
+#          untreated sample at the same reads
+#   eline: the selected e-line slopes and intercepts of each sample (also the
+#          untreated) are drawn with replacement, giving a new e-line model,
+#          from which P is corrected again
+#   both:  both of above (default)
+# all replicate index arrays are drawn at once by a numpy Generator seeded
+# with 'seed', in a fixed order, so that the intervals only depend on the seed
+# and not on chunk_size or processes
+# replicates are evaluated chunk_size at a time as one broadcasted operation,
+# with processes > 1 the replicates are split into that many shards evaluated
+# by a process pool (not inside daemonic workers, e.g. of multiprocessing.Pool)
+# intervals are percentile intervals, (alpha / 2, 1 - alpha / 2) of the
+# replicates of each well, replicates giving nan are left out
+BOOTSTRAP_RESAMPLE = ("time", "eline", "both")
+
+def check_bootstrap_resample(resample):
+	if not (resample in BOOTSTRAP_RESAMPLE):
+		raise AsValueError("unknown bootstrap resampling '%s', choose from: %s" %\
+			(str(resample), ", ".join(BOOTSTRAP_RESAMPLE)))
+	return resample
+
+
+################################################################################
+# (stop - start) replicates of P of a sample, from its data record (see
+# XELIBootstrap._sample_data) and e-line indices (None if not resampled)
+def _replicate_P(data, eline_idx, start, stop):
+	if eline_idx is None:
+		return data["P"][numpy.newaxis]
+	slope_idx, inter_idx = eline_idx
+	slopes = data["slopes"][slope_idx[start:stop]]
+	inters = data["inters"][inter_idx[start:stop]]
+	models = numpy.stack([slopes.mean(axis = 1), inters.mean(axis = 1),
+						inters.std(axis = 1)], axis = 1)
+	return corrected_P(data["OD"], data["GFP"], models,
+						[data["sd_factor"]])[:, 0]
+
+################################################################################
+# XELI replicates start:stop of all samples, {name: (stop - start, well)}
+# indices are those of start:stop only, replicates are evaluated by chunks
+# nan and inf of empty wells are expected, as in the analysis
+def _evaluate(data, untreated, indices, start, stop, chunk_size):
+	ret = {name: [] for name in data if name != untreated}
+	time_idx = indices["time"]
+	for a in range(0, stop - start, chunk_size):
+		b = min(a + chunk_size, stop - start)
+		with numpy.errstate(divide = "ignore", invalid = "ignore"):
+			untreated_P = _replicate_P(data[untreated], indices[untreated],
+										a, b)
+			for name in ret:
+				I = _replicate_P(data[name], indices[name], a, b) / untreated_P
+				I = numpy.broadcast_to(I, (b - a,) + I.shape[1:]).copy()
+				I[I < 1] = (1 / I[I < 1])
+				if not (time_idx is None):
+					I = numpy.take_along_axis(I,
+						time_idx[a:b, :, numpy.newaxis], axis = 1)
+				ret[name].append(I.sum(axis = 1) / I.shape[1])
+	return {k: numpy.concatenate(v) for k, v in ret.items()}
+
+def _evaluate_star(args):
+	return _evaluate(*args)
+
+
+################################################################################
+# XELIBootstrap object makes the bootstrap intervals of all samples of an
+# analyzed plate; the blank corrected data, e-line regressions and selections
+# are taken from the stage graph of each sample
+class XELIBootstrap(object):
+	def __init__(self, samples, untreated, n_replicates = 1000, seed = 0,
+				resample = "both", alpha = 0.05, chunk_size = 64,
+				processes = 1):
+		super(XELIBootstrap, self).__init__()
+		self.samples = list(samples)
+		for s in self.samples:
+			if not isinstance(s, EColiSample):
+				raise AsRuntimeError("XELI bootstrap only supports EColiSample")
+		if not any([i is untreated for i in self.samples]):
+			raise AsRuntimeError("cannot canculate I with no assign of untreated sample")
+		self.untreated = untreated
+		self.n_replicates = int(n_replicates)
+		if self.n_replicates < 1:
+			raise AsValueError("XELI bootstrap requires at least one replicate")
+		self.seed = seed
+		self.resample = check_bootstrap_resample(resample)
+		if not (0 < alpha < 1):
+			raise AsValueError("alpha must be between 0 and 1")
+		self.alpha = alpha
+		self.chunk_size = max(1, int(chunk_size))
+		self.processes = max(1, int(processes or 1))
+
+	def __repr__(self):
+		return "<XELIBootstrap replicates='%d' seed='%s' resample='%s'>" %\
+			(self.n_replicates, str(self.seed), self.resample)
+
+	############################################################################
+	# everything of a sample needed to evaluate replicates, picklable
+	@staticmethod
+	def _sample_data(sample):
+		blanked = sample.stages.run(sample, "blank")
+		model = sample.stages.run(sample, "eline_model")
+		all_regs = model["all_regs"]
+		return dict(OD = blanked["OD"], GFP = blanked["GFP"],
+					P = sample.stages.run(sample, "P"),
+					slopes = all_regs[model["slope_index"], 0],
+					inters = all_regs[model["inter_index"], 1],
+					sd_factor = sample.stages.param("sd_factor"))
+
+	############################################################################
+	# replicate index arrays, drawn in bulk: 'time' is (replicate, time) or
+	# None, each sample has (slope indices, intercept indices), each as
+	# (replicate, selected), or None
+	def indices(self, data):
+		rng = numpy.random.default_rng(self.seed)
+		ret = {"time": None}
+		if self.resample in ("time", "both"):
+			n_reads = len(data[self.untreated.name()]["P"])
+			ret["time"] = rng.integers(0, n_reads,
+										size = (self.n_replicates, n_reads))
+		for s in self.samples:
+			ret[s.name()] = None
+			if self.resample in ("eline", "both"):
+				ns = len(data[s.name()]["slopes"])
+				ni = len(data[s.name()]["inters"])
+				ret[s.name()] = (rng.integers(0, ns, (self.n_replicates, ns)),
+								rng.integers(0, ni, (self.n_replicates, ni)))
+		return ret
+
+	@staticmethod
+	def _slice_indices(indices, start, stop):
+		ret = {}
+		for k, v in indices.items():
+			if v is None:
+				ret[k] = None
+			elif isinstance(v, tuple):
+				ret[k] = tuple([i[start:stop] for i in v])
+			else:
+				ret[k] = v[start:stop]
+		return ret
+
+	############################################################################
+	# XELI of all replicates, {name: (replicate, well)}, not for the untreated
+	def replicates(self):
+		data = {s.name(): self._sample_data(s) for s in self.samples}
+		indices = self.indices(data)
+		n = self.n_replicates
+		bounds = numpy.linspace(0, n, min(self.processes, n) + 1).astype(int)
+		args = [(data, self.untreated.name(),
+				self._slice_indices(indices, a, b), a, b, self.chunk_size)
+				for a, b in zip(bounds[:-1], bounds[1:])]
+		if len(args) == 1:
+			shards = [_evaluate_star(args[0])]
+		else:
+			with ProcessPoolExecutor(max_workers = len(args)) as pool:
+				shards = list(pool.map(_evaluate_star, args))
+		return {k: numpy.concatenate([i[k] for i in shards])
+				for k in shards[0]}
+
+	############################################################################
+	# {name: (2, well)} lower and upper bounds of XELI
+	def run(self):
+		q = [100 * self.alpha / 2, 100 * (1 - self.alpha / 2)]
+		ret = {}
+		for name, reps in self.replicates().items():
+			# wells of only nan replicates stay nan, without warning
+			with warnings.catch_warnings():
+				warnings.simplefilter("ignore", RuntimeWarning)
+				ret[name] = numpy.nanpercentile(reps, q, axis = 0)
+		return ret
+
+	############################################################################
+	# log message of the bootstrap of a sample
+	def message(self, sample):
+		return "%s\nreplicates: %d\tseed: %s\tresample: %s\talpha: %g\n" %\
+			(sample.stage_header("XELI_BOOTSTRAP"), self.n_replicates,
+			str(self.seed), self.resample, self.alpha)
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.Bootstrap
+if __name__ == "__main__":
+	import tempfile
+	import unittest
+	from AssayLib.AssayPlate import AssayPlate
+
+	class test(unittest.TestCase):
+		def test_reproducible(self):
+			with tempfile.TemporaryDirectory() as tmp:
+				assay = AssayPlate("boot", 96, outdir = tmp + "/",
+							layout = "./example/EColi.96.P2.layout",
+							data_file = "./example/plate_data.txt",
+							log_level = "summary")
+				assay.add_sample(EColiSample, name = "S1", offset = (0, 0),
+								untreated = True, eline_selector = "all",
+								eline_plot = "off")
+				assay.add_sample(EColiSample, name = "S2", offset = (0, 1),
+								eline_selector = "all", eline_plot = "off")
+				assay.analyze()
+				a = assay.bootstrap(200, seed = 1, chunk_size = 7)
+				b = assay.bootstrap(200, seed = 1, processes = 2)
+				c = assay.bootstrap(200, seed = 2)
+			n_wells = assay.get_sample(1).XELI().shape[1]
+			self.assertEqual(a["S2"].shape, (2, n_wells))
+			self.assertTrue(numpy.array_equal(a["S2"], b["S2"],
+											equal_nan = True))
+			self.assertFalse(numpy.array_equal(a["S2"], c["S2"],
+											equal_nan = True))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
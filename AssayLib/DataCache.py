@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy
+from AssayLib.Exceptions import AsValueError
+
+
+################################################################################
+# PlateDataCache object keeps parsed plate data (the values and mask arrays of
+# _PlateData) in a cache directory, as binary .npy files, so that the same
+# reader export does not need to be parsed again; names and dtypes of the
+# channels are kept in meta.json
+# each entry is a sub-directory named by its key, which is the hash of the file
+# content together with everything affecting the parse result (parser version,
+# parse engine, plate shape, separator and encoding)
+#   cache_dir/<key>/values.npy
+#   cache_dir/<key>/mask.npy
+#   cache_dir/<key>/meta.json
+# entries are loaded back as read-only memory maps
+#
+# invalidation:
+#   a changed file has a different key, the entry previously stored for the
+#   same file path and parse context is removed when the new one is stored;
+#   entries written by another parser version are removed as well
+# eviction:
+#   whenever total size exceeds max_bytes, least recently used entries are
+#   removed (entry directory mtime is updated on each hit)
+class PlateDataCache(object):
+	ARRAYS = ("values", "mask")
+
+	def __init__(self, cache_dir, max_bytes = 1 << 30):
+		super(PlateDataCache, self).__init__()
+		if max_bytes <= 0:
+			raise AsValueError("PlateDataCache: max_bytes must be positive")
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		os.makedirs(cache_dir, exist_ok = True)
+
+	def __repr__(self):
+		return "<PlateDataCache dir='%s'>" % self.cache_dir
+
+	############################################################################
+	# key of a file, 'context' is a list of anything else affecting parsing
+	@staticmethod
+	def file_key(file, context = (), chunk_size = 1 << 20):
+		h = hashlib.sha1()
+		with open(file, "rb") as fh:
+			for chunk in iter(lambda: fh.read(chunk_size), b""):
+				h.update(chunk)
+		h.update(repr(tuple(context)).encode())
+		return h.hexdigest()
+
+	@staticmethod
+	def context_key(context):
+		return hashlib.sha1(repr(tuple(context)).encode()).hexdigest()
+
+	def _entry_dir(self, key):
+		return os.path.join(self.cache_dir, key)
+
+	def _all_entries(self):
+		ret = []
+		for key in os.listdir(self.cache_dir):
+			path = self._entry_dir(key)
+			# skip temporary directories of unfinished stores
+			if key.startswith(".") or not os.path.isdir(path):
+				continue
+			ret.append(key)
+		return ret
+
+	@staticmethod
+	def _read_meta(entry_dir):
+		try:
+			with open(os.path.join(entry_dir, "meta.json"), "r") as fh:
+				return json.load(fh)
+		except (OSError, ValueError):
+			return None
+
+	@staticmethod
+	def _entry_size(entry_dir):
+		return sum([os.path.getsize(os.path.join(entry_dir, i))
+					for i in os.listdir(entry_dir)])
+
+	############################################################################
+	# returns a (values, mask, channels, dtypes) tuple, the arrays as read-only
+	# memory maps, None if missed
+	def load(self, key, version = None):
+		entry_dir = self._entry_dir(key)
+		meta = self._read_meta(entry_dir)
+		if meta is None:
+			return None
+		if (version is not None) and (meta.get("version") != version):
+			self._remove(key)
+			return None
+		try:
+			arrays = tuple([numpy.load(os.path.join(entry_dir, i + ".npy"),
+										mmap_mode = "r") for i in self.ARRAYS])
+		except (OSError, ValueError):
+			self._remove(key)
+			return None
+		os.utime(entry_dir)
+		return arrays + (meta.get("channels"), meta.get("dtypes"))
+
+	############################################################################
+	# store arrays under key, written into a temporary directory first and then
+	# renamed, so concurrent workers never see a half-written entry
+	def store(self, key, values, mask, channels = None, dtypes = None,
+				source = None, context = (), version = None):
+		entry_dir = self._entry_dir(key)
+		if os.path.isdir(entry_dir):
+			return
+		tmp_dir = os.path.join(self.cache_dir, ".%s.%d" % (key, os.getpid()))
+		os.makedirs(tmp_dir, exist_ok = True)
+		for name, arr in zip(self.ARRAYS, (values, mask)):
+			numpy.save(os.path.join(tmp_dir, name + ".npy"), arr)
+		meta = dict(source = source and os.path.abspath(source),
+					context = self.context_key(context),
+					version = version, created = time.time(),
+					channels = channels and list(channels),
+					dtypes = dtypes and list(dtypes))
+		with open(os.path.join(tmp_dir, "meta.json"), "w") as fh:
+			json.dump(meta, fh)
+		try:
+			os.rename(tmp_dir, entry_dir)
+		except OSError:
+			# another process stored the same entry first
+			shutil.rmtree(tmp_dir, ignore_errors = True)
+		self._invalidate_stale(key, meta["source"], meta["context"], version)
+		self.evict(keep = key)
+
+	def _remove(self, key):
+		shutil.rmtree(self._entry_dir(key), ignore_errors = True)
+
+	############################################################################
+	# remove entries of the same source file and context but with a different
+	# key, i.e. the file has changed since; and entries from other versions
+	def _invalidate_stale(self, key, source, context, version):
+		for other in self._all_entries():
+			if other == key:
+				continue
+			meta = self._read_meta(self._entry_dir(other))
+			if (meta is None) or (meta.get("version") != version):
+				self._remove(other)
+			elif source and (meta.get("source") == source) and\
+				(meta.get("context") == context):
+				self._remove(other)
+
+	############################################################################
+	# remove least recently used entries until total size is under max_bytes
+	# the entry 'keep' is never removed
+	def evict(self, keep = None):
+		entries = []
+		for key in self._all_entries():
+			entry_dir = self._entry_dir(key)
+			try:
+				entries.append((os.path.getmtime(entry_dir),
+								self._entry_size(entry_dir), key))
+			except OSError:
+				continue
+		total = sum([i[1] for i in entries])
+		for mtime, size, key in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			if key == keep:
+				continue
+			self._remove(key)
+			total -= size
+		return total
+
+	def clear(self):
+		for key in self._all_entries():
+			self._remove(key)
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.DataCache
+if __name__ == "__main__":
+	import tempfile
+	import unittest
+	from AssayLib.DataParser import DataParser
+
+	class test(unittest.TestCase):
+		def setUp(self):
+			self.tmp = tempfile.mkdtemp()
+			self.file = os.path.join(self.tmp, "plate_data.txt")
+			shutil.copy("./example/plate_data.txt", self.file)
+			self.cache = PlateDataCache(os.path.join(self.tmp, "cache"))
+
+		def tearDown(self):
+			shutil.rmtree(self.tmp, ignore_errors = True)
+
+		def test_store_and_load(self):
+			A = numpy.zeros((2, 3, 8, 12))
+			self.cache.store("k", A, A.astype(bool), ["OD", "GFP"], version = 1)
+			self.assertEqual(self.cache.load("k", version = 1)[0].shape, A.shape)
+			self.assertIsNone(self.cache.load("k", version = 2))
+
+		def test_hit(self):
+			ref = DataParser(self.file, 96).parse()
+			DataParser(self.file, 96, cache = self.cache).parse()
+			data = DataParser(self.file, 96, cache = self.cache).parse()
+			# loaded back as memory maps
+			self.assertIsNotNone(data.handle())
+			for dset in ["OD", "GFP", "MASK"]:
+				self.assertTrue(numpy.array_equal(data.dataset(dset),
+												ref.dataset(dset)))
+
+		def test_changed_file(self):
+			parser = DataParser(self.file, 96, cache = self.cache)
+			parser.parse()
+			old_key = self.cache.file_key(self.file, parser.cache_context())
+			with open(self.file, "r", encoding = "cp1252") as fh:
+				text = fh.read()
+			with open(self.file, "w", encoding = "cp1252") as fh:
+				fh.write(text.replace("\t0.365\t", "\t0.366\t", 1))
+			data = parser.parse()
+			self.assertEqual(data.cell_data("OD", (0, 0))[0], 0.366)
+			# the entry of the old content is removed
+			self.assertEqual(self.cache._all_entries(),
+				[self.cache.file_key(self.file, parser.cache_context())])
+			self.assertIsNone(self.cache.load(old_key))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
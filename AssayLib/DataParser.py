@@ -1,35 +1,197 @@
 #!/usr/bin/env python3
 
+import re
+import time
+import codecs
 import numpy
 from AssayLib.Exceptions import AsRuntimeError, AsValueError
 from AssayLib.UtilFunctions import plate_type_to_shape
+from AssayLib.DataCache import PlateDataCache
 
 
 ################################################################################
 # _PlateData object is used for storing the raw data parsed by the DataParser
-# data strored in a 3-d array: (time, row, column) in order
+# data of all read channels (e.g. OD at 600 nm and GFP at 485/20,528/20) is
+# strored in one 4-d array: (channel, time, row, column) in order, so that
+# cells of any set of channels are gathered by one indexing operation
 # it also handles basic indexing, but be careful, this object is intended to be
 # used only internally, the major operation should be conducted through other
 # objects
-# note this contains three arrays, OD, GFP and mask
+# note this contains two arrays, the values and the mask, of the same shape
 # mask stands for invalid data that should be masked
+# channels are named by their read (e.g. "600" of a 'Read 1:600' section), each
+# has the dtype its values are returned as (see DataParser.channel_dtype);
+# values are stored as float
+# aliases name channels by what they measure, "OD" is the first channel and
+# "GFP" the second by default, and "MASK" is the mask of the "GFP" channel;
+# the channel aliased "OD" is always returned as float
+# the arrays are not copied but set read-only, the raw data is shared by all
+# samples of a plate, any modification must be done on extracted data
+# if both arrays are memory-mapped files (e.g. from PlateDataCache or
+# SharedPlateData), the object is pickled as a PlateDataHandle, and unpickled
+# by mapping the same files again, so that worker processes share the data
+# with no copy and no serialization
 class _PlateData(object):
-	def __init__(self, _OD, _GFP, MASK):
+	ALIASES = {"OD": 0, "GFP": 1}
+	MASK_ALIAS = "GFP"
+	# dtype of the channel set to an alias, whatever was parsed
+	ALIAS_DTYPES = {"OD": float}
+
+	def __init__(self, values, mask, channels = None, dtypes = None,
+				aliases = None):
 		super(_PlateData, self).__init__()
-		self._OD = numpy.copy(_OD)
-		self._GFP = numpy.copy(_GFP)
-		self._MASK = numpy.copy(MASK)
+		self._sources = PlateDataHandle.sources(values, mask)
+		self._values = self._readonly(values)
+		self._mask = self._readonly(mask)
+		if (self._values.ndim != 4) or (self._mask.shape != self._values.shape):
+			raise AsValueError("_PlateData: values and mask must be (channel, time, row, column) arrays of the same shape")
+		n = len(self._values)
+		self._channels = [str(i) for i in channels] if channels\
+			else ["Read %d" % (i + 1) for i in range(n)]
+		self._dtypes = [numpy.dtype(i) for i in dtypes] if dtypes\
+			else [numpy.dtype(float)] * n
+		if (len(self._channels) != n) or (len(self._dtypes) != n):
+			raise AsValueError("_PlateData: %d channels but %d names and %d dtypes"\
+				% (n, len(self._channels), len(self._dtypes)))
+		self._aliases = {}
+		for alias, channel in self.ALIASES.items():
+			if channel < n:
+				self.set_alias(alias, channel)
+		for alias, channel in (aliases or {}).items():
+			self.set_alias(alias, channel)
+
+	############################################################################
+	# the separate OD, GFP and MASK (of GFP) arrays of a plate, as parsed
+	# before the data had channels
+	@classmethod
+	def from_OD_GFP(cls, OD, GFP, MASK):
+		OD = numpy.asarray(OD)
+		GFP = numpy.asarray(GFP)
+		values = numpy.stack([OD, GFP]).astype(float, copy = False)
+		mask = numpy.stack([numpy.ones(OD.shape, dtype = bool),
+							numpy.asarray(MASK, dtype = bool)])
+		return cls(values, mask, channels = ["OD", "GFP"],
+					dtypes = [OD.dtype, GFP.dtype])
+
+	def __repr__(self):
+		return "<_PlateData channels='%s' reads='%d'>" %\
+			(";".join(self._channels), self.n_reads())
+
+	def __reduce__(self):
+		handle = self.handle()
+		if handle is None:
+			return (_PlateData, (self._values, self._mask, self._channels,
+								[i.str for i in self._dtypes], self._aliases))
+		return (PlateDataHandle.attach, (handle,))
+
+	# PlateDataHandle of the mapped files, None if not memory-mapped
+	def handle(self):
+		if self._sources is None:
+			return None
+		return PlateDataHandle(self._sources, self._channels,
+								[i.str for i in self._dtypes], self._aliases)
+
+	@staticmethod
+	def _readonly(arr):
+		arr = numpy.asarray(arr)
+		if arr.flags.writeable:
+			arr.flags.writeable = False
+		return arr
+
+	############################################################################
+	# channels, by name, alias or position
+	def channels(self):
+		return list(self._channels)
+
+	def n_channels(self):
+		return len(self._channels)
+
+	def channel_dtypes(self):
+		return list(self._dtypes)
+
+	def aliases(self):
+		return dict(self._aliases)
+
+	def set_alias(self, alias, channel):
+		index = self.channel_index(channel)
+		self._aliases[alias] = index
+		if alias in self.ALIAS_DTYPES:
+			self._dtypes[index] = numpy.dtype(self.ALIAS_DTYPES[alias])
+
+	def channel_index(self, channel):
+		if isinstance(channel, str):
+			if channel in self._aliases:
+				channel = self._aliases[channel]
+			elif channel in self._channels:
+				return self._channels.index(channel)
+		if isinstance(channel, (int, numpy.integer)) and\
+			(0 <= channel < len(self._channels)):
+			return int(channel)
+		raise AsValueError("DataParser: no channel '%s' in plate data, channels are: %s"\
+			% (str(channel), ", ".join(self._channels)))
+
+	# (channel index, whether the mask is meant) of a dset
+	def _resolve(self, dset):
+		if dset == "MASK":
+			return self.channel_index(self.MASK_ALIAS), True
+		try:
+			return self.channel_index(dset), False
+		except AsValueError:
+			raise AsValueError("DataParser: don't know how to handle '%s' of argument 'dset'" % dset)
+
+	def _as_dtype(self, arr, channel):
+		return arr.astype(self._dtypes[channel], copy = False)
+
+	############################################################################
+	# (time, row, column) array of a channel, or of the "MASK"; read-only,
+	# a view into the values unless the channel is returned as integers
+	def dataset(self, dset):
+		c, is_mask = self._resolve(dset)
+		if is_mask:
+			return self._mask[c]
+		return self._readonly(self._as_dtype(self._values[c], c))
 
 	def cell_data(self, dset, coords):
 		pos_row, pos_col = coords
-		if dset == "OD":
-			return self._OD[:, pos_row, pos_col]
-		elif dset == "GFP":
-			return self._GFP[:, pos_row, pos_col]
-		elif dset == "MASK":
-			return self._MASK[:, pos_row, pos_col]
-		else:
-			raise AsValueError("DataParser: don't know how to handle '%s' of argument 'dset'" % dset)
+		return self.cells_data(dset, pos_row, pos_col)
+
+	############################################################################
+	# gather a set of cells in one fancy-indexing operation
+	# rows and cols are integer arrays of the same length (plate coords)
+	# only time points from 'start' on are gathered
+	# returns a new (time, cell) array, owned by the caller
+	def cells_data(self, dset, rows, cols, start = 0):
+		# channel selected first, so that the cells stay the last axes
+		c, is_mask = self._resolve(dset)
+		if is_mask:
+			return self._mask[c][start:, rows, cols]
+		return self._as_dtype(self._values[c][start:, rows, cols], c)
+
+	############################################################################
+	# the same cells of several channels (names, aliases or positions) in one
+	# fancy-indexing operation, rows and cols as of cells_data (1-d)
+	# returns a new (channel, time, cell) array of the common dtype of these
+	# channels, or of their masks if mask = True
+	def channels_data(self, channels, rows, cols, start = 0, mask = False):
+		index = numpy.asarray([self.channel_index(i) for i in channels],
+								dtype = int)
+		times = numpy.arange(start, self.n_reads())
+		rows = numpy.asarray(rows)[numpy.newaxis, numpy.newaxis]
+		cols = numpy.asarray(cols)[numpy.newaxis, numpy.newaxis]
+		sel = (index[:, numpy.newaxis, numpy.newaxis],
+				times[numpy.newaxis, :, numpy.newaxis], rows, cols)
+		if mask:
+			return self._mask[sel]
+		dtype = numpy.result_type(*[self._dtypes[i] for i in index])\
+			if len(index) else float
+		return self._values[sel].astype(dtype, copy = False)
+
+	def n_reads(self):
+		return self._values.shape[1]
+
+	# (rows, columns) of the plate
+	def plate_shape(self):
+		return self._values.shape[2:]
 
 	def OD(self, coords):
 		return self.cell_data("OD", coords)
@@ -41,23 +203,103 @@ class _PlateData(object):
 		return self.cell_data("MASK", coords)
 
 
+################################################################################
+# PlateDataHandle object locates the memory-mapped arrays of a _PlateData, as
+# (file, offset, shape, dtype, fortran order) of its values and mask, with
+# the names, dtypes and aliases of its channels; it is small and picklable,
+# attach() maps the files read-only
+class PlateDataHandle(object):
+	def __init__(self, arrays, channels, dtypes, aliases):
+		super(PlateDataHandle, self).__init__()
+		self.arrays = tuple([tuple(i) for i in arrays])
+		self.channels = list(channels)
+		self.dtypes = list(dtypes)
+		self.aliases = dict(aliases)
+
+	def __repr__(self):
+		return "<PlateDataHandle file='%s'>" % self.arrays[0][0]
+
+	@staticmethod
+	def _source(arr):
+		if not (isinstance(arr, numpy.memmap) and getattr(arr, "filename", None)):
+			return None
+		# only whole mapped arrays, not views into them
+		if isinstance(arr.base, numpy.ndarray) or\
+			not (arr.flags.c_contiguous or arr.flags.f_contiguous):
+			return None
+		return (arr.filename, arr.offset, arr.shape, arr.dtype.str,
+				not arr.flags.c_contiguous)
+
+	# sources of the arrays, None if any is not a whole mapped file
+	@classmethod
+	def sources(cls, *arrays):
+		sources = [cls._source(i) for i in arrays]
+		if any([i is None for i in sources]):
+			return None
+		return sources
+
+	def attach(self):
+		return _PlateData(*[numpy.memmap(f, dtype = numpy.dtype(dtype),
+										mode = "r", offset = offset,
+										shape = tuple(shape),
+										order = "F" if fortran else "C")
+							for f, offset, shape, dtype, fortran in self.arrays],
+						channels = self.channels, dtypes = self.dtypes,
+						aliases = self.aliases)
+
+
 ################################################################################
 # DataParser object is used for parsing data from raw file
 # since raw file is from windows and contains unicode characters .SUCKS..
 # thus in python3 it is processed with encoding
+# parse_func can be either a function, or the name of a built-in parse engine
+# listed in DataParser.parse_engines ("default" or "vectorized")
+# cache can be a PlateDataCache object or a cache directory, if set, parsed
+# data is saved there and later loaded without parsing the file again
 class DataParser(object):
+	# increase this whenever a change of parsing alters the parsed arrays, so
+	# that cached data from older versions will not be used
+	VERSION = 3
+	# overflowed reads are replaced by this value, and masked in MASK
+	OVERFLOW_TOKEN = "OVRFLW"
+	OVERFLOW_VALUE = 100000
+	# header line starting each plate of an export
+	PLATE_KEY = "Plate Number"
+	# read of a section, in the second field of its 'Time' header line, e.g.
+	# "T\xb0 Read 2:485/20,528/20" is read 2, channel "485/20,528/20"
+	READ_PATTERN = re.compile(r"Read (\d+):(.*)$")
+	# channel of a fluorescence read, named by its excitation and emission
+	# filters, e.g. "485/20,528/20"
+	FLUORESCENCE_PATTERN = re.compile(r"^\d+(/\d+)?,\d+(/\d+)?$")
+
 	def __init__(self, file, size, sep = "\t", encoding = "cp1252",
-				 parse_func = None):
+				 parse_func = None, cache = None, aliases = None):
 		super(DataParser, self).__init__()
 		self.file = file
 		self._shape = plate_type_to_shape(size)
 		self.sep = sep
 		self.encoding = encoding
-		self.parse_func = parse_func or self._default_parse_func
+		self.parse_func = self._resolve_parse_func(parse_func)
+		if isinstance(cache, str):
+			cache = PlateDataCache(cache)
+		self.cache = cache
+		# {alias: channel} set on parsed data, e.g. {"GFP": "485/20,528/20"}
+		self.aliases = aliases
 
 	def __repr__(self):
 		return "<DataParser file='%s'>" % self.file
 
+	@classmethod
+	def _resolve_parse_func(cls, parse_func):
+		if parse_func is None:
+			return cls._default_parse_func
+		if isinstance(parse_func, str):
+			try:
+				return cls.parse_engines[parse_func]
+			except KeyError:
+				raise AsValueError("DataParser: unknown parse engine '%s'" % parse_func)
+		return parse_func
+
 	############################################################################
 	# this function is called if no specific function is assigned to parse_func
 	# when constructing
@@ -66,70 +308,656 @@ class DataParser(object):
 	# the same context as below, self.Parser() will wrap it further as a method
 	@staticmethod
 	def _default_parse_func(file, shape, sep, encoding):
-		data = []
+		# [header, rows] of each read section
+		sections = []
 		nr, nc = shape
 		rxc = nr * nc
+		n_plates = 0
+		plate_key = DataParser.PLATE_KEY + sep
 		with open(file, "r", encoding = encoding) as fh:
 			for line in fh:
-				splitted = line.replace("\n", "").split(sep)[2:]
+				line = line.replace("\n", "")
+				splitted = line.split(sep)[2:]
 				if (len(splitted) == rxc):
-					data.append(splitted)
+					if line.startswith("Time" + sep):
+						sections.append([line, []])
+					elif sections:
+						sections[-1][1].append(splitted)
+				elif line.startswith(plate_key):
+					n_plates += 1
+		DataParser._check_single_plate(n_plates)
 
-		if not data:
+		if not any([rows for header, rows in sections]):
 			raise AsRuntimeError("""DataParser: parse failed, no any valid line found
 make sure data file is in correct format""")
-		if (len(data) % 2):
-			raise AsRuntimeError("""DataParser: parse failed, uneven GFP and OD sections
+
+		channels = []
+		for header, rows in sections:
+			data = numpy.asarray(rows, dtype = object).reshape(-1, rxc)
+			# replace overflow with 100000
+			data[data == DataParser.OVERFLOW_TOKEN] = DataParser.OVERFLOW_VALUE
+			channels.append((header, data.reshape(-1, nr, nc).astype(float)))
+		return DataParser._stack_channels(channels, sep)
+
+	############################################################################
+	# vectorized parse engine, same context as _default_parse_func
+	# instead of splitting every line in python, the section boundaries are
+	# located once in the whole text: each read section starts with a 'Time'
+	# header line having exactly rows x cols + 2 fields, and ends at the first
+	# empty line; each section is then converted in bulk by numpy.loadtxt
+	# overflow tokens are replaced by the sentinel on the section text before
+	# conversion, so that no object array is ever created
+	# sections are returned as (header line, start, end)
+	@staticmethod
+	def _find_data_sections(text, n_fields, sep):
+		sections = []
+		key = "\nTime" + sep
+		pos = text.find(key)
+		while pos != -1:
+			head_start = pos + 1
+			head_end = text.find("\n", head_start)
+			if head_end == -1:
+				break
+			end = text.find("\n\n", head_end)
+			if end == -1:
+				end = len(text)
+			if text.count(sep, head_start, head_end) == n_fields - 1:
+				sections.append((text[head_start:head_end], head_end + 1, end))
+				pos = text.find(key, end)
+			else:
+				pos = text.find(key, head_end)
+		return sections
+
+	@staticmethod
+	def _load_section(text, n_fields, sep, dtype):
+		text = text.replace(DataParser.OVERFLOW_TOKEN,
+							str(DataParser.OVERFLOW_VALUE))
+		try:
+			return numpy.loadtxt(text.splitlines(), delimiter = sep,
+								usecols = range(2, n_fields), dtype = dtype,
+								ndmin = 2)
+		except ValueError as err:
+			raise AsRuntimeError("""DataParser: parse failed, bad value in data section (%s)
+make sure data file is in correct format""" % str(err))
+
+	@staticmethod
+	def _vectorized_parse_func(file, shape, sep, encoding):
+		nr, nc = shape
+		n_fields = nr * nc + 2
+		# universal newline mode already turns '\r\n' into '\n'
+		with open(file, "r", encoding = encoding) as fh:
+			text = "\n" + fh.read()
+
+		DataParser._check_single_plate(text.count("\n" + DataParser.PLATE_KEY +\
+			sep))
+		sections = DataParser._find_data_sections(text, n_fields, sep)
+		if not sections:
+			raise AsRuntimeError("""DataParser: parse failed, no any valid line found
 make sure data file is in correct format""")
+		return DataParser._stack_channels([(header,
+			DataParser._load_section(text[start:end], n_fields, sep,
+				float).reshape(-1, nr, nc)) for header, start, end in sections],
+			sep)
 
-		data = numpy.asarray(data, dtype = object)
-		sz_d1 = len(data) // 2
+	############################################################################
+	# (read number, channel name) of the section at 'position' (from 0) of a
+	# plate, by its header line; if the header does not name the read, it is
+	# read position + 1, named "Read <n>"
+	@staticmethod
+	def _section_channel(header, sep, position):
+		fields = header.split(sep, 2)
+		match = DataParser.READ_PATTERN.search(fields[1].strip())\
+			if len(fields) > 1 else None
+		if match is None:
+			return position + 1, "Read %d" % (position + 1)
+		return int(match.group(1)), match.group(2).strip()
 
-		# replace overflow with 100000
-		data[data == "OVRFLW"] = 100000
-		OD  = data[1:sz_d1, :].reshape(-1, nr, nc).astype(float)
-		GFP = data[sz_d1 + 1:].reshape(-1, nr, nc).astype(int)
-		MASK = (GFP != 100000)
+	############################################################################
+	# dtype of a channel, by what it reads and not by the values read so far:
+	# fluorescence (e.g. "485/20,528/20") is int, absorbance (e.g. "600") is
+	# float; unnamed channels ("Read <n>") are the OD first, then fluorescence
+	@staticmethod
+	def channel_dtype(name, position):
+		if DataParser.FLUORESCENCE_PATTERN.match(name):
+			return int
+		if name == "Read %d" % (position + 1):
+			return float if position == 0 else int
+		return float
 
-		return _PlateData(OD, GFP, MASK)
+	############################################################################
+	# _PlateData of the read sections of a plate, given as (header line,
+	# (time, row, column) float array), one channel per section, in the order
+	# of their read numbers; dtypes are set by channel_dtype, and overflowed
+	# reads are masked
+	@staticmethod
+	def _stack_channels(sections, sep, label = None):
+		reads = []
+		for i, (header, data) in enumerate(sections):
+			read, name = DataParser._section_channel(header, sep, i)
+			reads.append((read, name, data))
+		reads.sort(key = lambda x: x[0])
+		if len(set([len(data) for read, name, data in reads])) > 1:
+			raise AsRuntimeError("""DataParser: parse failed, uneven read sections%s (%s reads)
+make sure data file is in correct format""" % (" in '%s'" % label if label else "",
+				", ".join(["%s: %d" % (name, len(data))
+							for read, name, data in reads])))
+		values = numpy.stack([data for read, name, data in reads])
+		dtypes = [DataParser.channel_dtype(name, i)
+				for i, (read, name, data) in enumerate(reads)]
+		return _PlateData(values, (values != DataParser.OVERFLOW_VALUE),
+						channels = [name for read, name, data in reads],
+						dtypes = dtypes)
+
+	############################################################################
+	# the parse engines read one plate, an export of several plates (e.g. of
+	# a stacker run) would be read as one plate of all their reads
+	@staticmethod
+	def _check_single_plate(n_plates):
+		if n_plates > 1:
+			raise AsRuntimeError("""DataParser: parse failed, %d plates found in one export
+use DataParser.parse_plates() for multi-plate exports""" % n_plates)
+
+	############################################################################
+	# locate the plates of an export and their read sections, in one scan of
+	# the text for both plate header lines and 'Time' header lines
+	# a plate starts at a 'Plate Number' line, labeled by its value (e.g.
+	# "Plate 2"); read sections are found as by _find_data_sections, those
+	# before any plate header (or in an export without one) belong to a first
+	# plate labeled "Plate 1"
+	# returns a list of (label, [(header line, start, end) of each section])
+	@staticmethod
+	def _find_plate_sections(text, n_fields, sep):
+		pattern = re.compile("\n(%s|Time)%s" % (re.escape(DataParser.PLATE_KEY),
+												re.escape(sep)))
+		plates = []
+		match = pattern.search(text)
+		while match:
+			head_start = match.start() + 1
+			head_end = text.find("\n", head_start)
+			if head_end == -1:
+				head_end = len(text)
+			pos = head_end
+			if match.group(1) != "Time":
+				plates.append((text[match.end():head_end].strip(), []))
+			elif text.count(sep, head_start, head_end) == n_fields - 1:
+				end = text.find("\n\n", head_end)
+				if end == -1:
+					end = len(text)
+				if not plates:
+					plates.append(("Plate 1", []))
+				plates[-1][1].append((text[head_start:head_end], head_end + 1,
+									end))
+				pos = end
+			match = pattern.search(text, pos)
+		return [i for i in plates if i[1]]
+
+	############################################################################
+	# parse an export of one or more plates, returns a PlateDataSequence of
+	# one _PlateData per plate, in the order of the export
+	# the file is read and scanned once, the sections of each plate are only
+	# converted when the plate is first accessed (by the vectorized engine,
+	# parse_func is not used); the cache is not used either
+	def parse_plates(self):
+		nr, nc = self._shape
+		n_fields = nr * nc + 2
+		with open(self.file, "r", encoding = self.encoding) as fh:
+			text = "\n" + fh.read()
+		plates = self._find_plate_sections(text, n_fields, self.sep)
+		if not plates:
+			raise AsRuntimeError("""DataParser: parse failed, no any valid line found
+make sure data file is in correct format""")
+		return PlateDataSequence(text, plates, self._shape, self.sep,
+								file = self.file, aliases = self.aliases)
 
 	############################################################################
 	# major interface called to run parse
 	def parse(self):
-		return self.parse_func(self.file, self._shape, self.sep, self.encoding)
+		if self.cache is None:
+			return self._set_aliases(self.parse_func(self.file, self._shape,
+									self.sep, self.encoding))
+		context = self.cache_context()
+		key = self.cache.file_key(self.file, context)
+		cached = self.cache.load(key, version = self.VERSION)
+		if cached:
+			return self._set_aliases(_PlateData(*cached))
+		data = self.parse_func(self.file, self._shape, self.sep, self.encoding)
+		self.cache.store(key, data._values, data._mask, data.channels(),
+						[i.str for i in data.channel_dtypes()],
+						source = self.file, context = context,
+						version = self.VERSION)
+		return self._set_aliases(data)
+
+	# aliases do not change the parsed arrays, they are set after parsing
+	# (or loading from the cache)
+	def _set_aliases(self, data):
+		for alias, channel in (self.aliases or {}).items():
+			data.set_alias(alias, channel)
+		return data
+
+	############################################################################
+	# besides the file content, everything else that changes the parse result
+	# is included in the cache key
+	def cache_context(self):
+		func = self.parse_func
+		func_name = "%s.%s" % (getattr(func, "__module__", ""),
+								getattr(func, "__qualname__", repr(func)))
+		return (self.VERSION, func_name, self._shape, self.sep, self.encoding)
 
 
 
+################################################################################
+# PlateDataSequence object holds the plates of a multi-plate export, made by
+# DataParser.parse_plates; it is a sequence of _PlateData, indexed by position
+# or by label ("Plate 2"), each plate is converted from the export text on its
+# first access and kept; the text is dropped once all plates are converted
+class PlateDataSequence(object):
+	def __init__(self, text, plates, shape, sep, file = None, aliases = None):
+		super(PlateDataSequence, self).__init__()
+		self.file = file
+		self.aliases = aliases
+		self._text = text
+		self._shape = shape
+		self._sep = sep
+		self._labels = [label for label, sections in plates]
+		self._sections = [sections for label, sections in plates]
+		self._data = [None] * len(plates)
+
+	def __repr__(self):
+		return "<PlateDataSequence file='%s' plates='%d'>" % (self.file,
+															len(self))
+
+	def __len__(self):
+		return len(self._labels)
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def labels(self):
+		return list(self._labels)
+
+	def index(self, label):
+		if not (label in self._labels):
+			raise AsValueError("no plate '%s' in export '%s'" % (str(label),
+																self.file))
+		return self._labels.index(label)
+
+	def is_parsed(self, key):
+		return not (self._data[self._position(key)] is None)
+
+	def _position(self, key):
+		if isinstance(key, str):
+			return self.index(key)
+		return range(len(self))[key]
+
+	def __getitem__(self, key):
+		i = self._position(key)
+		if self._data[i] is None:
+			self._data[i] = self._parse(i)
+			if all([not (d is None) for d in self._data]):
+				self._text = None
+		return self._data[i]
+
+	############################################################################
+	# the read sections of a plate, same as the vectorized engine
+	def _parse(self, i):
+		nr, nc = self._shape
+		n_fields = nr * nc + 2
+		data = DataParser._stack_channels([(header,
+			DataParser._load_section(self._text[start:end], n_fields,
+				self._sep, float).reshape(-1, nr, nc))
+			for header, start, end in self._sections[i]],
+			self._sep, label = self._labels[i])
+		for alias, channel in (self.aliases or {}).items():
+			data.set_alias(alias, channel)
+		return data
+
+
+
+################################################################################
+# _GrowingArray object keeps rows of a fixed shape in a preallocated buffer,
+# appending is amortized O(1): when full, the buffer grows to twice its size
+# (at least 'chunk' rows), and existing rows are copied once
+# view() returns a read-only view of the rows so far, rows already appended
+# are never modified, so old views stay valid after later appends
+class _GrowingArray(object):
+	def __init__(self, row_shape, dtype, chunk = 32):
+		super(_GrowingArray, self).__init__()
+		self.chunk = chunk
+		self._data = numpy.empty((chunk,) + tuple(row_shape), dtype = dtype)
+		self._n = 0
+
+	def __len__(self):
+		return self._n
+
+	def capacity(self):
+		return len(self._data)
+
+	def extend(self, rows):
+		need = self._n + len(rows)
+		if need > len(self._data):
+			grown = numpy.empty((max(need, 2 * len(self._data), self.chunk),) +\
+				self._data.shape[1:], dtype = self._data.dtype)
+			grown[:self._n] = self._data[:self._n]
+			self._data = grown
+		self._data[self._n:need] = rows
+		self._n = need
+
+	def view(self, n = None):
+		ret = self._data[:self._n if n is None else n]
+		ret.flags.writeable = False
+		return ret
+
+
+################################################################################
+# _GrowingChannels object keeps reads of several channels in one preallocated
+# (channel, time, row, column) buffer, the reads of each channel are appended
+# on their own; appending is amortized O(1): when a channel is full, the
+# buffer grows to twice its length in time (at least 'chunk' reads), existing
+# reads are copied once, as they are when a channel is added
+# view() returns a read-only view of the first reads of all channels, reads
+# already appended are never modified, so old views stay valid after later
+# appends
+class _GrowingChannels(object):
+	def __init__(self, row_shape, dtype, chunk = 32):
+		super(_GrowingChannels, self).__init__()
+		self.chunk = chunk
+		self._data = numpy.empty((0, chunk) + tuple(row_shape), dtype = dtype)
+		self._n = []
+
+	# number of reads of each channel
+	def lengths(self):
+		return list(self._n)
+
+	def capacity(self):
+		return self._data.shape[1]
+
+	def add_channel(self):
+		grown = numpy.empty((len(self._n) + 1,) + self._data.shape[1:],
+							dtype = self._data.dtype)
+		grown[:len(self._n)] = self._data
+		self._data = grown
+		self._n.append(0)
+
+	def extend(self, channel, rows):
+		n = self._n[channel]
+		need = n + len(rows)
+		if need > self.capacity():
+			grown = numpy.empty(self._data.shape[:1] +\
+				(max(need, 2 * self.capacity(), self.chunk),) +\
+				self._data.shape[2:], dtype = self._data.dtype)
+			grown[:, :self.capacity()] = self._data
+			self._data = grown
+		self._data[channel, n:need] = rows
+		self._n[channel] = need
+
+	def view(self, n):
+		ret = self._data[:, :n]
+		ret.flags.writeable = False
+		return ret
+
+
+################################################################################
+# StreamingDataParser object tails a reader export that is still being written
+# by a kinetic run, and parses the lines appended since last poll()
+# the export has one section per read channel (e.g. an OD section then a GFP
+# section), each a 'Time' header line of rows x cols + 2 fields followed by
+# one line per read, ended by an empty line (the same lines used by the other
+# parse engines); rows of each section are appended to a growing buffer, a
+# time point is complete once it is read in all 'channels' channels, data()
+# returns a _PlateData of all complete time points
+# channels is the number of read sections of the export, None if not known
+# (then time points are complete once read in all channels started so far,
+# and the export is never seen as finished)
+# only complete lines are parsed, a line being written is kept until its end
+# note: if the reader writes the whole OD section before the GFP section,
+# no time point is complete until the GFP section starts
+class StreamingDataParser(object):
+	def __init__(self, file, size, sep = "\t", encoding = "cp1252",
+				chunk_reads = 32, read_size = 1 << 20, channels = 2,
+				aliases = None):
+		super(StreamingDataParser, self).__init__()
+		self.file = file
+		self._shape = plate_type_to_shape(size)
+		self.sep = sep
+		self.encoding = encoding
+		self.read_size = read_size
+		self.channels = channels
+		self.aliases = aliases
+		nr, nc = self._shape
+		self._n_fields = nr * nc + 2
+		self._decoder = codecs.getincrementaldecoder(encoding)()
+		self._offset = 0
+		self._rest = ""
+		# header lines of the sections started, and whether inside one
+		self._headers = []
+		self._in_section = False
+		self._reads = _GrowingChannels(self._shape, float, chunk_reads)
+
+	def __repr__(self):
+		return "<StreamingDataParser file='%s' reads='%d'>" % (self.file,
+															self.n_reads())
+
+	# number of complete time points
+	def n_reads(self):
+		lengths = self._reads.lengths()
+		if (not lengths) or ((self.channels is not None) and\
+			(len(lengths) < self.channels)):
+			return 0
+		return min(lengths)
+
+	# all sections seen and the last one ended
+	def finished(self):
+		return (self.channels is not None) and\
+			(len(self._headers) >= self.channels) and (not self._in_section)
+
+	############################################################################
+	# read and parse what is appended to the file since last call
+	# returns the number of new complete time points
+	def poll(self):
+		before = self.n_reads()
+		with open(self.file, "rb") as fh:
+			fh.seek(self._offset)
+			while True:
+				chunk = fh.read(self.read_size)
+				if not chunk:
+					break
+				self._offset += len(chunk)
+				self._feed(self._decoder.decode(chunk))
+		return self.n_reads() - before
+
+	def _feed(self, text):
+		lines = (self._rest + text).split("\n")
+		# the last piece is an unfinished line (or empty)
+		self._rest = lines.pop()
+		rows = []
+		for line in lines:
+			line = line.rstrip("\r")
+			if self._in_section:
+				if not line:
+					self._end_section(rows)
+					rows = []
+					continue
+				if line.count(self.sep) == self._n_fields - 1:
+					rows.append(line)
+			elif line.startswith("Time" + self.sep) and\
+				(line.count(self.sep) == self._n_fields - 1):
+				self._headers.append(line)
+				self._in_section = True
+		if self._in_section:
+			self._append_rows(rows)
+
+	def _end_section(self, rows):
+		self._append_rows(rows)
+		self._in_section = False
+
+	############################################################################
+	# the export is complete: its last line is parsed even with no newline at
+	# its end, and a section still open is ended
+	# returns the number of new complete time points
+	def finish(self):
+		before = self.n_reads()
+		self._feed(self._decoder.decode(b"", final = True))
+		if self._rest:
+			self._feed("\n")
+		if self._in_section:
+			self._end_section([])
+		return self.n_reads() - before
+
+	def _append_rows(self, rows):
+		if not rows:
+			return
+		channel = len(self._headers) - 1
+		if (self.channels is not None) and (channel >= self.channels):
+			raise AsRuntimeError("""DataParser: parse failed, more than %d read sections
+make sure data file is in correct format""" % self.channels)
+		while len(self._reads.lengths()) <= channel:
+			self._reads.add_channel()
+		# rows are converted in bulk, as sections of the vectorized engine
+		nr, nc = self._shape
+		data = DataParser._load_section("\n".join(rows), self._n_fields,
+										self.sep, float).reshape(-1, nr, nc)
+		self._reads.extend(channel, data)
+
+	############################################################################
+	# _PlateData of all complete time points, channels in the order of the
+	# export; values are a read-only view into the growing buffer, later polls
+	# do not change them
+	def data(self):
+		values = self._reads.view(self.n_reads())
+		channels = [DataParser._section_channel(header, self.sep, i)[1]
+					for i, header in enumerate(self._headers[:len(values)])]
+		data = _PlateData(values, (values != DataParser.OVERFLOW_VALUE),
+						channels = channels,
+						dtypes = [DataParser.channel_dtype(name, i)
+								for i, name in enumerate(channels)])
+		for alias, channel in (self.aliases or {}).items():
+			data.set_alias(alias, channel)
+		return data
+
+	############################################################################
+	# poll every 'interval' seconds, and yield data() whenever there are new
+	# complete time points, until the export is finished, or nothing is
+	# appended for 'idle_timeout' seconds (None waits forever); in the latter
+	# case the export is taken as complete (see finish()), and data() is
+	# yielded once more if its last line made new complete time points
+	def follow(self, interval = 5.0, idle_timeout = None):
+		idle_since = time.monotonic()
+		while True:
+			offset = self._offset
+			if self.poll():
+				yield self.data()
+			if self.finished():
+				return
+			if self._offset != offset:
+				idle_since = time.monotonic()
+			elif (idle_timeout is not None) and\
+				(time.monotonic() - idle_since >= idle_timeout):
+				if self.finish():
+					yield self.data()
+				return
+			time.sleep(interval)
+
+	############################################################################
+	# parse engine of a complete export, same context as the other engines
+	@staticmethod
+	def parse_func(file, shape, sep, encoding):
+		parser = StreamingDataParser(file, shape[0] * shape[1], sep = sep,
+									encoding = encoding, channels = None)
+		parser.poll()
+		parser.finish()
+		if (not parser._headers) or (parser.n_reads() == 0):
+			raise AsRuntimeError("""DataParser: parse failed, no any valid line found
+make sure data file is in correct format""")
+		lengths = parser._reads.lengths()
+		if (len(lengths) != len(parser._headers)) or (len(set(lengths)) > 1):
+			raise AsRuntimeError("""DataParser: parse failed, uneven read sections
+make sure data file is in correct format""")
+		return parser.data()
+
+
+DataParser.parse_engines = {
+	"default": DataParser._default_parse_func,
+	"vectorized": DataParser._vectorized_parse_func,
+	"streaming": StreamingDataParser.parse_func,
+}
+
+
 
 
 ################################################################################
 # test
 ################################################################################
-# if __name__ == "__main__":
-# 	import unittest
-
-# 	class test(unittest.TestCase):
-# 		@unittest.expectedFailure
-# 		def test_uneven_fail(self):
-# 			DataParser("../.devel/test_data/DataParser_96_bad.txt",
-# 				size = 96).parse()
-
-# 		@unittest.expectedFailure
-# 		def test_nofound_fail(self):
-# 			DataParser("../.devel/test_data/DataParser_96.txt",
-# 				size = 384).parse()
-
-# 		@unittest.expectedFailure
-# 		def test_invalid_size(self):
-# 			DataParser("../.devel/test_data/DataParser_96.txt",
-# 				size = 1).parse()
-
-# 		def test_ok(self):
-# 			cell = DataParser("../.devel/test_data/DataParser_96.txt",
-# 				size = 96).parse()
-# 			self.assertEqual(cell.cell_data("OD", (0, 0))[0], 0.365)
-# 			self.assertEqual(cell.cell_data("OD", (1, 3))[7], 0.429)
-# 			self.assertEqual(cell.cell_data("GFP", (7, 11))[23], 100000)
-
-# 	suite = unittest.TestLoader().loadTestsFromTestCase(test)
-# 	unittest.TextTestRunner(verbosity = 2).run(suite)
+# run from the repository root: python3 -m AssayLib.DataParser
+if __name__ == "__main__":
+	import os
+	import tempfile
+	import unittest
+
+	EXAMPLE = "./example/plate_data.txt"
+
+	class test(unittest.TestCase):
+		def test_uneven_fail(self):
+			with open(EXAMPLE, "r", encoding = "cp1252") as fh:
+				lines = fh.readlines()
+			# drop the first read of the first section
+			first = [i for i, line in enumerate(lines)
+					if line.startswith("Time\t") and ("Read 1:" in line)][0] + 1
+			with tempfile.TemporaryDirectory() as tmp:
+				bad = os.path.join(tmp, "bad.txt")
+				with open(bad, "w", encoding = "cp1252") as fh:
+					fh.writelines(lines[:first] + lines[first + 1:])
+				for engine in DataParser.parse_engines:
+					with self.assertRaises(AsRuntimeError):
+						DataParser(bad, size = 96, parse_func = engine).parse()
+
+		def test_nofound_fail(self):
+			for engine in DataParser.parse_engines:
+				with self.assertRaises(AsRuntimeError):
+					DataParser(EXAMPLE, size = 384, parse_func = engine).parse()
+
+		def test_invalid_size(self):
+			with self.assertRaises(ValueError):
+				DataParser(EXAMPLE, size = 1).parse()
+
+		def test_ok(self):
+			cell = DataParser(EXAMPLE, size = 96).parse()
+			self.assertEqual(cell.cell_data("OD", (0, 0))[0], 0.365)
+			self.assertEqual(cell.cell_data("OD", (1, 3))[7], 0.429)
+			self.assertEqual(cell.cell_data("GFP", (7, 11))[23], 100000)
+
+		def test_vectorized_same_as_default(self):
+			ref = DataParser(EXAMPLE, size = 96).parse()
+			data = DataParser(EXAMPLE, size = 96,
+							parse_func = "vectorized").parse()
+			self.assertEqual(data.channels(), ref.channels())
+			self.assertEqual(data.channel_dtypes(), ref.channel_dtypes())
+			for dset in ["OD", "GFP", "MASK"]:
+				self.assertTrue(numpy.array_equal(data.dataset(dset),
+												ref.dataset(dset)))
+
+		def test_streaming_same_as_default(self):
+			ref = DataParser(EXAMPLE, size = 96).parse()
+			with open(EXAMPLE, "rb") as fh:
+				# no newline at the end, as an export still being written
+				text = fh.read().rstrip(b"\r\n")
+			with tempfile.TemporaryDirectory() as tmp:
+				path = os.path.join(tmp, "growing.txt")
+				parser = StreamingDataParser(path, 96, read_size = 4096)
+				# appended in pieces ending within lines
+				for end in range(0, len(text), 7919):
+					with open(path, "ab") as fh:
+						fh.write(text[end:end + 7919])
+					parser.poll()
+					self.assertLessEqual(parser.n_reads(), ref.n_reads())
+				parser.finish()
+			data = parser.data()
+			self.assertTrue(parser.finished())
+			self.assertEqual(data.channels(), ref.channels())
+			self.assertEqual(data.channel_dtypes(), ref.channel_dtypes())
+			for dset in ["OD", "GFP", "MASK"]:
+				self.assertTrue(numpy.array_equal(data.dataset(dset),
+												ref.dataset(dset)))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
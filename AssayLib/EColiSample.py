@@ -4,30 +4,88 @@ import numpy
 from AssayLib.Exceptions import AsRuntimeError
 from AssayLib.SamplePrototype import SamplePrototype
 from AssayLib.ELineCorre import ELineCorre
-from AssayLib.ArrayFormatting import array2d2string
+from AssayLib.ELineSelector import get_eline_selector
+from AssayLib.Log import Log
 
 
 ################################################################################
 # sample handling class only used by E-Coli assays
 # it has a special method for eline correction, which is unique in E-Coli assays
+# eline_selector chooses the e-line regressions used for the model, it can be
+# an ELineSelector object or a name ("gui", "all", "r2" or "mad"), by default
+# the interactive GUI is used
+# eline_plot is the e-line plot policy, "eager", "deferred" or "off"; deferred
+# plots are added to plot_queue, which is passed by the AssayPlate
+# run_P_analysis runs the stage graph (see _build_stages), so after changing
+# sd_factor or eline_selector by set_params() only the stages depending on
+# them are recomputed
 class EColiSample(SamplePrototype):
-	def __init__(self, blank = "BLANK", eline = "ELINE", sd_factor = 2.0, **kw):
+	def __init__(self, blank = "BLANK", eline = "ELINE", sd_factor = 2.0,
+				eline_selector = None, eline_plot = "eager", plot_queue = None,
+				**kw):
 		super(EColiSample, self).__init__(**kw)
 		# these two should be the same as in layout files to distinguish these
 		# special categories from ordinary genes
-		self._blank = blank
-		self._eline = eline
-		self._create_eline_corrector()
+		self.set_blank(blank)
+		self.set_eline(eline)
+		self._create_eline_corrector(eline_selector, eline_plot, plot_queue)
+		# e-line regressions the model is selected from, see _eline_correction
+		self._eline_regs = None
+		self.stages.set_param("eline_selector", self.eline_corre.selector)
 		# this is used in _OD_Correction
 		# a threshold to determine 'significe' if varies farther than 'n' times
 		# of sd, basically
-		self._sd_factor = sd_factor
+		self.set_sd_factor(sd_factor)
 
 	def __repr__(self):
 		return "<EColiSample name='%s' id=%d>" % (self.name(), self.id())
 
-	def _create_eline_corrector(self):
-		self.eline_corre = ELineCorre(parent = self)
+	def _create_eline_corrector(self, selector = None, plot = "eager",
+								plot_queue = None):
+		self.eline_corre = ELineCorre(parent = self, selector = selector,
+									plot = plot, plot_queue = plot_queue)
+
+	############################################################################
+	# analysis parameters, see SamplePrototype.set_params
+	def set_blank(self, blank):
+		self._blank = blank
+		self.stages.set_param("blank", blank)
+
+	def set_eline(self, eline):
+		self._eline = eline
+		self.stages.set_param("eline", eline)
+
+	def set_sd_factor(self, sd_factor):
+		self._sd_factor = sd_factor
+		self.stages.set_param("sd_factor", sd_factor)
+
+	def set_eline_selector(self, selector):
+		self.eline_corre.selector = get_eline_selector(selector)
+		self.stages.set_param("eline_selector", self.eline_corre.selector)
+
+	def eline_mask(self):
+		eline_where = self.layout.mask_by_category(self._eline)
+		if not eline_where.any():
+			raise AsRuntimeError("e-line correction requires at least one 'ELINE' category in layout")
+		return eline_where
+
+	############################################################################
+	# keep the e-line model selected by the eline corrector
+	# returns the log message of the e-line correction stage
+	def _set_eline_model(self, slope, inter, inter_sd, msg):
+		self.model_slope = slope
+		self.model_inter = inter
+		self.model_inter_sd = inter_sd
+		return self.stage_message("ELINE_CORRECTION", msg)
+
+	############################################################################
+	# e-line model and all e-line regressions, with the selected ones
+	def result_params(self):
+		ret = super(EColiSample, self).result_params()
+		ret.update(self.eline_corre.result_params())
+		ret["eline_model"] = numpy.array([self.model_slope, self.model_inter,
+										self.model_inter_sd])
+		return ret
 
 	############################################################################
 	# define an E-Coli assay unique method
@@ -35,6 +93,76 @@ class EColiSample(SamplePrototype):
 	def onELineCorrection(cls, func):
 		cls._bind_method("_eline_correction", func)
 
+	############################################################################
+	# stage graph of the P analysis
+	#   extract -> blank -> eline_regress -> eline_model
+	#   (blank, eline_model) -> OD_correction
+	#   (blank, OD_correction) -> P
+	# a new sd_factor reruns only the OD correction and P
+	# the stages call the bound corrections on copies of their inputs, the
+	# e-line plot is made by eline_regress, eline_model calls the bound e-line
+	# correction, which runs the selector
+	def _build_stages(self, graph):
+		super(EColiSample, self)._build_stages(graph)
+		graph.add_stage("blank", EColiSample._stage_blank,
+						inputs = ("extract",), params = ("blank",))
+		graph.add_stage("eline_regress", EColiSample._stage_eline_regress,
+						inputs = ("extract", "blank"), params = ("eline",))
+		graph.add_stage("eline_model", EColiSample._stage_eline_model,
+						inputs = ("eline_regress",),
+						params = ("eline_selector",))
+		graph.add_stage("OD_correction", EColiSample._stage_OD_correction,
+						inputs = ("blank", "eline_model"),
+						params = ("sd_factor",))
+		graph.add_stage("P", EColiSample._stage_P,
+						inputs = ("blank", "OD_correction"))
+
+	def _stage_blank(self, extracted, blank):
+		self._OD = extracted["OD"].copy()
+		self._GFP = extracted["GFP"].copy()
+		self._blank_correction()
+		return dict(OD = self._OD, GFP = self._GFP)
+
+	def _stage_eline_regress(self, extracted, blanked, eline):
+		eline_where = self.eline_mask()
+		OD_el = blanked["OD"][:, eline_where]
+		GFP_el = blanked["GFP"][:, eline_where]
+		MASK_el = extracted["MASK"][:, eline_where]
+		nr, nc = self.eline_corre.auto_fit_subplots(OD_el.shape[1])
+		all_regs = self.eline_corre.regress(OD_el, GFP_el, MASK_el)
+		self.eline_corre.plot(nr, nc, OD_el, GFP_el, MASK_el, all_regs)
+		return all_regs
+
+	def _stage_eline_model(self, all_regs, eline_selector):
+		self._eline_regs = all_regs
+		self._eline_correction()
+		return dict(slope = self.model_slope, inter = self.model_inter,
+					inter_sd = self.model_inter_sd,
+					all_regs = self.eline_corre.all_regs,
+					slope_index = self.eline_corre.slope_index,
+					inter_index = self.eline_corre.inter_index)
+
+	# model and selections of a (maybe memoized) eline_model output
+	def _use_eline_model(self, model):
+		self.model_slope = model["slope"]
+		self.model_inter = model["inter"]
+		self.model_inter_sd = model["inter_sd"]
+		self.eline_corre.all_regs = model["all_regs"]
+		self.eline_corre.slope_index = model["slope_index"]
+		self.eline_corre.inter_index = model["inter_index"]
+
+	def _stage_OD_correction(self, blanked, model, sd_factor):
+		self._use_eline_model(model)
+		self._OD = blanked["OD"]
+		self._GFP = blanked["GFP"].copy()
+		self._OD_correction()
+		return self._GFP
+
+	def _stage_P(self, blanked, GFP):
+		self._OD = blanked["OD"]
+		self._GFP = GFP
+		return self._calculate_P()
+
 
 ################################################################################
 # specific method definition
@@ -44,56 +172,57 @@ def _blank_correction(self):
 	where_blank = self.layout.mask_by_category(self._blank)
 	if not where_blank.any():
 		raise AsRuntimeError("background correction requires at least one 'BLANK' category in layout")
+	# subtract in place, extracted data is owned by the sample
+	# GFP keeps its integer type, as if assigned by GFP[:] = GFP - GFP_blank
 	OD_blank = self.OD()[:, where_blank].mean(axis = 1, keepdims = True)
-	self.OD()[:] = self.OD() - OD_blank
+	numpy.subtract(self.OD(), OD_blank, out = self.OD())
 
 	GFP_blank = self.GFP()[:, where_blank].mean(axis = 1, keepdims = True)
-	self.GFP()[:] = self.GFP() - GFP_blank
+	numpy.subtract(self.GFP(), GFP_blank, out = self.GFP(), casting = "unsafe")
 
-	m = ">%s:BLANK_CORRECTION\n%s\n"
-	return m % (self.name(), self.cat_OD_GFP_tables())
+	self.log_tables("BLANK_CORRECTION", self.OD_GFP_tables())
 
+# selects the e-line model from the regressions of the eline_regress stage
 @EColiSample.onELineCorrection
 def _eline_correction(self):
-	eline_where = self.layout.mask_by_category(self._eline)
-	if not eline_where.any():
-		raise AsRuntimeError("e-line correction requires at least one 'ELINE' category in layout")
-	OD_el = self.OD()[:, eline_where]
-	GFP_el = self.GFP()[:, eline_where]
-	MASK_el = self.MASK()[:, eline_where]
-
+	nr, nc = self.eline_corre.auto_fit_subplots(len(self._eline_regs))
 	# use a linear model for eline correction
 	# the background gfp signal is estimated to be (slope * OD + intercept)
-
-	slope, inter, inter_sd, msg = self.eline_corre.feed(OD_el, GFP_el, MASK_el)
-	self.model_slope = slope
-	self.model_inter = inter
-	self.model_inter_sd = inter_sd
-
-	m = ">%s:ELINE_CORRECTION\n%s\n"
-	return m % (self.name(), msg)
+	return Log.SUMMARY, self._set_eline_model(*self.eline_corre.\
+		select_slope_and_intercept(nr, nc, self._eline_regs))
 
 @EColiSample.onODCorrection
 def _OD_correction(self):
-	# subtract the GFP signal by real-time OD
-	bg_GFP = self.OD() * self.model_slope + self.model_inter
-	self.GFP()[:] = self.GFP() - bg_GFP
+	# subtract the GFP signal by real-time OD, in place on self._GFP
+	bg_GFP = self.OD() * self.model_slope
+	bg_GFP += self.model_inter
+	numpy.subtract(self.GFP(), bg_GFP, out = self.GFP(), casting = "unsafe")
 	# the sd of intercepts got will be used as a threshold
 	# to determine whether a 'significant' GFP signal is detected, otherwise set
 	# it to 2 * sd in order to prevent zero-division
 	threshold = self._sd_factor * self.model_inter_sd
 	self.GFP()[self.GFP() < threshold] = threshold
+	self.log_tables("OD_CORRECTION", [("GFP", self.GFP(), "%.2f")], Log.DEBUG)
 
-	m = ">%s:OD_CORRECTION\nGFP:\n%s\n"
-	return m % (self.name(),  array2d2string(self.GFP(), "%.2f"))
-
+# runs the stage graph, memoized stages are not computed (nor logged) again
+# the sample keeps the outputs: blank corrected OD, corrected GFP and P
 @EColiSample.onRunPAnalysis
 def _run_P_analysis(self):
-	self.extract_data()
+	self._P = self.stages.run(self, "P")
+	self._use_eline_model(self.stages.run(self, "eline_model"))
+	self._MASK = self.stages.run(self, "extract")["MASK"]
+	self._OD = self.stages.run(self, "blank")["OD"]
+	self._GFP = self.stages.run(self, "OD_correction")
+	self._save_result_table("P", self._P)
+
+# blank and OD corrections are per read, so new reads are corrected on their
+# own, with the e-line model of the last full analysis
+@EColiSample.onRunPUpdate
+def _run_P_update(self):
+	self.extract_data(start = self.n_analyzed_reads())
 	self._blank_correction()
-	self._eline_correction()
 	self._OD_correction()
-	self._calculate_and_save_P()
+	self._append_and_save_P()
 
 
 
@@ -1,27 +1,38 @@
 #!/usr/bin/env python3
 
 import numpy
-from scipy import stats
-from matplotlib import pyplot
 from AssayLib.Exceptions import AsRuntimeError
-from AssayLib.ELineCorreGUI import ELineCorreGUI
+from AssayLib.ELineSelector import get_eline_selector
+from AssayLib.ELinePlot import ELinePlotJob, check_plot_policy
+from AssayLib.LinRegress import batched_linregress
 from AssayLib.ArrayFormatting import array2d2string_by_row, vector2string
 
 
 class NoValueSelectedError(RuntimeError):
 	pass
 
+################################################################################
+# selector decides which regressions are used in the e-line model, it can be
+# an ELineSelector object or its name, see ELineSelector.get_eline_selector
+# by default the interactive selector is used, all instances of ELineCorre share
+# only one selector dialog, it is expected no two eline corrections from the
+# same assay plate will run simultaneously
+# plot is the plot policy, "eager", "deferred" or "off", see ELinePlot, deferred
+# plots are added to plot_queue, an ELinePlotQueue object
 class ELineCorre(object):
-	# all instances of ELineCorre need only one selector
-	# it is expected no two eline corrections from the same assay plate will run 
-	# simultaneously
-	selector = ELineCorreGUI()
-
-	def __init__(self, parent):
+	def __init__(self, parent, selector = None, plot = "eager",
+				plot_queue = None):
 		super(ELineCorre, self).__init__()
 		self.sample_name = parent.name()
 		self.plot_path = "%s/%s_eline.png" % (parent.output_dir(),
 											parent.name())
+		self.selector = get_eline_selector(selector)
+		self.plot_policy = check_plot_policy(plot)
+		self.plot_queue = plot_queue
+		# regressions and selections of the last feed
+		self.all_regs = None
+		self.slope_index = None
+		self.inter_index = None
 
 	############################################################################
 	# thif func attempts a 4x (horizontal) by 3 (vertical) layout for all plots
@@ -41,84 +52,70 @@ class ELineCorre(object):
 		return int(nr), int(nc)
 
 	############################################################################
-	# draw the regression line based on reg result 'reg' on the 'axes'
+	# lin regression of all e-line wells in one call, returns the 'all_regs'
+	# array, one (slope, intercept, r, p, stderr) row per well
+	# OD, GFP and mask can have leading batch axes, see batched_linregress
 	@staticmethod
-	def _plot_regression_line(axes, reg):
-		slope, intercept, r, p, se = reg
-		x1, x2 = axes.get_xlim()
-		y1, y2 = x1 * slope + intercept, x2 * slope + intercept
-		axes.plot([x1, x2], [y1, y2], ls = "-", lw = 1, color = "#FF8000")
+	def regress(OD, GFP, mask):
+		return batched_linregress(OD, GFP, mask)
 
 	############################################################################
-	# print the lin regssion equaions, including r_val, p_val and std.err etc.,
-	# to the 'axes'
-	@staticmethod
-	def _write_regression_equation(axes, reg):
-		slope, intercept, r, p, se = reg
-		xmin, xmax = axes.get_xlim()
-		ymin, ymax = axes.get_ylim()
-		x_text = xmin + 0.01
-		y_step = (ymax - ymin) * 0.07
-
-		axes.text(x_text, ymax - y_step * 1, "GFP = %.1f * OD + %.1f" % (
-				slope, intercept), color = "#FF8000", weight = "semibold")
-		axes.text(x_text, ymax - y_step * 3, r"r = %.8f" % (r ** 2))
-		axes.text(x_text, ymax - y_step * 4, "p = %.5e" % p)
-		axes.text(x_text, ymax - y_step * 5, "s.e = %.4f" % se)
+	# make the multi-plots of all regressions according to the plot policy
+	# saved to png file, which is also used by the interactive select GUI, so
+	# if the selector needs it, the plot is always rendered right away
+	# a deferred plot is rendered eagerly as well if there is no plot queue
+	# returns the ELinePlotJob, or None if not plotted
+	def plot(self, nr, nc, OD, GFP, mask, all_regs):
+		policy = self.plot_policy
+		if self.selector.needs_plot() or\
+			((policy == "deferred") and (self.plot_queue is None)):
+			policy = "eager"
+		if policy == "off":
+			return None
+		job = ELinePlotJob(self.plot_path, OD, GFP, mask, all_regs, nr, nc)
+		if policy == "deferred":
+			self.plot_queue.add(job)
+		else:
+			job.render()
+		return job
 
 	############################################################################
-	# do lin regression and make multi-plots
-	# save to png file, which will be used later, by the interactive select GUI
-	def run_linreg_and_plot(self, _pyplot, save_path, nr, nc, OD, GFP, mask,
-								plot_w = 4.5, plot_h = 4.5):
-		fig, ax = _pyplot.subplots(nrows = nr, ncols = nc,
-									figsize = (plot_w * nc, plot_h * nr))
-		ax_1d = ax.flatten()
-		all_regs = []
-		for od, gfp, m, axes in zip(OD.T, GFP.T, mask.T, ax_1d):
-			od_msk, gfp_msk = od[m], gfp[m]
-
-			axes.scatter(od_msk, gfp_msk, s = 10, c = "#0040FF", marker = None)
-			reg = tuple(stats.linregress(od_msk, gfp_msk))
-			all_regs.append(reg)
-			self._plot_regression_line(axes, reg)
-			self._write_regression_equation(axes, reg)
-			axes.set_xlabel("OD")
-			axes.set_ylabel("GFP")
-		_pyplot.tight_layout()
-		_pyplot.savefig(save_path)
-		_pyplot.close()
-		return numpy.asarray(all_regs, dtype = float)
+	# e-line model (slope, intercept, sd of intercepts) of the selected
+	# slopes and intercepts, each is the mean of selected values
+	@staticmethod
+	def eline_model(all_regs, slope_i, inter_i):
+		slopes = all_regs[slope_i, 0]
+		inters = all_regs[inter_i, 1]
+		if not len(slopes):
+			raise NoValueSelectedError("slopes cannot be null selection")
+		if not len(inters):
+			raise NoValueSelectedError("intercepts cannot be null selection")
+		if len(inters) == 1:
+			raise AsRuntimeError("must be at least 2 intercepts (this exception is thrown due to not implemented yet)")
+		return slopes.mean(), inters.mean(), inters.std()
 
 	############################################################################
-	# launch an interative selector if needed
+	# launch the selector (may be interactive) if needed
 	# and return the values chosen for slope and intercept for final model
 	# each is the mean of selected values
 	def select_slope_and_intercept(self, nr, nc, all_regs):
-		# select slope and intercept by interactive selector
-		# however if only one, no need for interactive select
+		# select slope and intercept by the selector
+		# however if only one, no need for select
 		# you have to use that
 		n = len(all_regs)
 		if n == 1:
 			slope_i, inter_i = [0], [0]
 		else:
-			slope_i, inter_i = self.selector.launch(n, nr, nc,
+			slope_i, inter_i = self.selector.select(all_regs, nr, nc,
 													self.plot_path,
 													self.sample_name)
 
-		if not slope_i:
-			raise NoValueSelectedError("slopes cannot be null selection")
-		if not inter_i:
-			raise NoValueSelectedError("intercepts cannot be null selection")
-
+		slope, inter, inter_sd = self.eline_model(all_regs, slope_i, inter_i)
 		slopes = all_regs[slope_i, 0]
 		inters = all_regs[inter_i, 1]
-		if len(inters) == 1:
-			raise AsRuntimeError("must be at least 2 intercepts (this exception is thrown due to not implemented yet)")
-
-		slope = slopes.mean()
-		inter = inters.mean()
-		inter_sd = inters.std()
+		self.all_regs = numpy.asarray(all_regs)
+		self.slope_index = numpy.arange(n)[slope_i]
+		self.inter_index = numpy.arange(n)[inter_i]
 
 		ret_msg = """Raw regressions:
 Slope\tIntercept\tr^2\tp\tStd.err
@@ -136,15 +133,26 @@ Inter.SD: %f""" % (array2d2string_by_row(all_regs.tolist(), "%f\t%f\t%f\t%.8e\t%
 
 		return slope, inter, inter_sd, ret_msg
 
+	############################################################################
+	# regressions and selected indices of the last feed, for results stores
+	def result_params(self):
+		if self.all_regs is None:
+			return {}
+		return dict(eline_regressions = self.all_regs,
+					eline_slope_index = self.slope_index,
+					eline_inter_index = self.inter_index)
+
 	############################################################################
 	# Feed the ELineCorre object with OD and GFP data
 	# it should contain only the OD and GFP for 'ELINE' category of the layout
 	# linear regression is used to figure out the slope and intercept
-	def feed(self, OD, GFP, mask):
+	# all_regs can be passed if regressions are already done in batch
+	def feed(self, OD, GFP, mask, all_regs = None):
 		_, num_eline_samples = OD.shape
 		nr, nc = self.auto_fit_subplots(num_eline_samples)
-		all_regs = self.run_linreg_and_plot(pyplot, self.plot_path,
-												nr, nc, OD, GFP, mask)
+		if all_regs is None:
+			all_regs = self.regress(OD, GFP, mask)
+		self.plot(nr, nc, OD, GFP, mask, all_regs)
 		return self.select_slope_and_intercept(nr, nc, all_regs)
 
 
@@ -5,10 +5,22 @@ from PyQt5 import QtCore
 from PyQt5 import QtGui
 
 
-app = QtWidgets.QApplication([])
+################################################################################
+# the QApplication is created on first use rather than on import, so that the
+# analysis modules never need a display unless the dialog is actually shown
+# an existing QApplication (e.g. of XELICalculator) is reused
+app = None
+
+def get_application():
+	global app
+	if app is None:
+		app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+	return app
+
 
 class ELineCorreGUI(QtWidgets.QDialog):
 	def __init__(self):
+		get_application()
 		super(ELineCorreGUI, self).__init__()
 		self.setModal(True)
 		self.setStyleSheet("QDialog{background-color:white;}")
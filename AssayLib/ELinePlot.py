@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import hashlib
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+from AssayLib.Exceptions import AsValueError
+
+
+################################################################################
+# e-line plots show the scatter and regression line of each e-line well
+# plotting policies:
+#   eager:    plot as soon as the regressions are done (default)
+#   deferred: queue the plot, render all queued plots after the analysis,
+#             maybe by a process pool
+#   off:      no plot at all
+# plots are drawn on a bare Agg canvas, no pyplot and no interactive backend
+# is involved, so rendering works in worker processes; matplotlib is imported
+# on the first rendering, not with this module
+# each png records a hash of the plotted content, a plot whose content did not
+# change since last rendering is not rendered again
+PLOT_POLICIES = ("off", "deferred", "eager")
+# increase this whenever the appearance of plots changes
+PLOT_VERSION = 1
+
+def check_plot_policy(policy):
+	if not (policy in PLOT_POLICIES):
+		raise AsValueError("unknown e-line plot policy '%s', choose from: %s" %\
+			(str(policy), ", ".join(PLOT_POLICIES)))
+	return policy
+
+
+################################################################################
+# draw the regression line based on reg result 'reg' on the 'axes'
+def _plot_regression_line(axes, reg):
+	slope, intercept, r, p, se = reg
+	x1, x2 = axes.get_xlim()
+	y1, y2 = x1 * slope + intercept, x2 * slope + intercept
+	axes.plot([x1, x2], [y1, y2], ls = "-", lw = 1, color = "#FF8000")
+
+################################################################################
+# print the lin regssion equaions, including r_val, p_val and std.err etc.,
+# to the 'axes'
+def _write_regression_equation(axes, reg):
+	slope, intercept, r, p, se = reg
+	xmin, xmax = axes.get_xlim()
+	ymin, ymax = axes.get_ylim()
+	x_text = xmin + 0.01
+	y_step = (ymax - ymin) * 0.07
+
+	axes.text(x_text, ymax - y_step * 1, "GFP = %.1f * OD + %.1f" % (
+			slope, intercept), color = "#FF8000", weight = "semibold")
+	axes.text(x_text, ymax - y_step * 3, r"r = %.8f" % (r ** 2))
+	axes.text(x_text, ymax - y_step * 4, "p = %.5e" % p)
+	axes.text(x_text, ymax - y_step * 5, "s.e = %.4f" % se)
+
+
+################################################################################
+# read the text chunks of a png file, which are all before the image data
+def read_png_text(path):
+	ret = {}
+	try:
+		with open(path, "rb") as fh:
+			if fh.read(8) != b"\x89PNG\r\n\x1a\n":
+				return ret
+			while True:
+				head = fh.read(8)
+				if len(head) < 8:
+					break
+				length, ctype = struct.unpack(">I4s", head)
+				if ctype in (b"IDAT", b"IEND"):
+					break
+				data = fh.read(length)
+				fh.seek(4, 1)
+				if ctype == b"tEXt":
+					key, _, value = data.partition(b"\x00")
+					ret[key.decode("latin-1")] = value.decode("latin-1")
+	except OSError:
+		pass
+	return ret
+
+
+################################################################################
+# ELinePlotJob object holds everything needed to draw the e-line plot of one
+# sample, it is sent to worker processes when rendered in a pool
+class ELinePlotJob(object):
+	HASH_KEY = "Comment"
+
+	def __init__(self, save_path, OD, GFP, mask, all_regs, nr, nc,
+				plot_w = 4.5, plot_h = 4.5):
+		super(ELinePlotJob, self).__init__()
+		self.save_path = save_path
+		self.OD = numpy.ascontiguousarray(OD)
+		self.GFP = numpy.ascontiguousarray(GFP)
+		self.mask = numpy.ascontiguousarray(mask)
+		self.all_regs = numpy.ascontiguousarray(all_regs, dtype = float)
+		self.nr, self.nc = nr, nc
+		self.plot_w, self.plot_h = plot_w, plot_h
+
+	def __repr__(self):
+		return "<ELinePlotJob path='%s'>" % self.save_path
+
+	def content_hash(self):
+		h = hashlib.sha1()
+		h.update(repr((PLOT_VERSION, self.nr, self.nc, self.plot_w,
+					self.plot_h)).encode())
+		for arr in (self.OD, self.GFP, self.mask, self.all_regs):
+			h.update(repr((arr.dtype.str, arr.shape)).encode())
+			h.update(arr.tobytes())
+		return "eline:" + h.hexdigest()
+
+	def is_up_to_date(self):
+		if not os.path.isfile(self.save_path):
+			return False
+		text = read_png_text(self.save_path)
+		return text.get(self.HASH_KEY) == self.content_hash()
+
+	############################################################################
+	# returns True if rendered, False if skipped since up to date
+	def render(self, force = False):
+		if (not force) and self.is_up_to_date():
+			return False
+		from matplotlib.figure import Figure
+		from matplotlib.backends.backend_agg import FigureCanvasAgg
+		nr, nc = self.nr, self.nc
+		fig = Figure(figsize = (self.plot_w * nc, self.plot_h * nr))
+		FigureCanvasAgg(fig)
+		ax = fig.subplots(nrows = nr, ncols = nc, squeeze = False)
+		for od, gfp, m, reg, axes in zip(self.OD.T, self.GFP.T, self.mask.T,
+										self.all_regs, ax.flatten()):
+			axes.scatter(od[m], gfp[m], s = 10, c = "#0040FF", marker = None)
+			reg = tuple(reg)
+			_plot_regression_line(axes, reg)
+			_write_regression_equation(axes, reg)
+			axes.set_xlabel("OD")
+			axes.set_ylabel("GFP")
+		fig.tight_layout()
+		fig.savefig(self.save_path,
+					metadata = {self.HASH_KEY: self.content_hash()})
+		return True
+
+def _render_job(job):
+	return job.render()
+
+
+################################################################################
+# ELinePlotQueue object collects deferred plots, and renders them at once
+# processes > 1 renders with a process pool, this is not allowed if called
+# inside a daemonic worker process (e.g. of multiprocessing.Pool), use 1 there
+class ELinePlotQueue(object):
+	def __init__(self, processes = 1):
+		super(ELinePlotQueue, self).__init__()
+		self.processes = max(1, int(processes or 1))
+		self._jobs = []
+
+	def __repr__(self):
+		return "<ELinePlotQueue pending='%d'>" % len(self._jobs)
+
+	def __len__(self):
+		return len(self._jobs)
+
+	def add(self, job):
+		self._jobs.append(job)
+
+	############################################################################
+	# render and clear all queued plots
+	# returns the number of plots rendered and skipped (up to date)
+	def render(self):
+		jobs, self._jobs = self._jobs, []
+		if not jobs:
+			return 0, 0
+		if (self.processes == 1) or (len(jobs) == 1):
+			rendered = [i.render() for i in jobs]
+		else:
+			with ProcessPoolExecutor(max_workers = self.processes) as pool:
+				rendered = list(pool.map(_render_job, jobs))
+		n = sum(rendered)
+		return n, len(jobs) - n
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.ELinePlot
+if __name__ == "__main__":
+	import tempfile
+	import unittest
+
+	class test(unittest.TestCase):
+		def setUp(self):
+			self.tmp = tempfile.TemporaryDirectory()
+			rng = numpy.random.RandomState(0)
+			self.OD = rng.rand(10, 2)
+			self.regs = numpy.ones((2, 5))
+
+		def tearDown(self):
+			self.tmp.cleanup()
+
+		def job(self, GFP):
+			return ELinePlotJob(os.path.join(self.tmp.name, "eline.png"),
+								self.OD, GFP, self.OD > 0, self.regs, 1, 2)
+
+		def test_skip_unchanged(self):
+			self.assertTrue(self.job(self.OD).render())
+			self.assertFalse(self.job(self.OD).render())
+			self.assertTrue(self.job(self.OD * 2).render())
+
+		def test_queue(self):
+			queue = ELinePlotQueue(processes = 2)
+			queue.add(self.job(self.OD))
+			self.assertEqual(queue.render(), (1, 0))
+			queue.add(self.job(self.OD))
+			self.assertEqual(queue.render(), (0, 1))
+			self.assertEqual(len(queue), 0)
+
+		def test_policy(self):
+			self.assertEqual(check_plot_policy("deferred"), "deferred")
+			with self.assertRaises(AsValueError):
+				check_plot_policy("lazy")
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
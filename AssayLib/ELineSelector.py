@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import numpy
+from AssayLib.Exceptions import AsValueError
+
+
+################################################################################
+# e-line selectors decide which e-line regressions (slopes and intercepts,
+# separately) are used for the final e-line model of a sample
+# a selector is called by ELineCorre with all regressions of a sample
+#   select(all_regs, nr, nc, plot_path, sample_name)
+# all_regs is the (n, 5) array of (slope, intercept, r, p, stderr)
+# nr, nc and plot_path describe the e-line plot, only used by the GUI selector
+# returns two lists of bool, selected slopes and selected intercepts
+class ELineSelectorPrototype(object):
+	name = None
+
+	def __init__(self, **kw):
+		super(ELineSelectorPrototype, self).__init__()
+
+	def __repr__(self):
+		return "<%s>" % self.__class__.__name__
+
+	# whether the e-line plot must exist when select is called
+	def needs_plot(self):
+		return False
+
+	def select(self, all_regs, nr, nc, plot_path, sample_name):
+		raise NotImplementedError("derived class must implement this method")
+
+	############################################################################
+	# make sure at least 'n' values are selected, by adding the best ones by
+	# 'score' (larger is better) to the selection
+	@staticmethod
+	def _keep_at_least(keep, score, n):
+		keep = numpy.array(keep, dtype = bool)
+		n = min(n, len(keep))
+		if keep.sum() < n:
+			score = numpy.where(numpy.isnan(score), -numpy.inf, score)
+			keep[numpy.argsort(-score, kind = "stable")[:n]] = True
+		return keep.tolist()
+
+
+################################################################################
+# interactive selection by check boxes on the e-line plot
+# all ELineCorre's share one dialog, created on first use; Qt is imported only
+# then as well
+class ELineSelectGUI(ELineSelectorPrototype):
+	name = "gui"
+	_dialog = None
+
+	def needs_plot(self):
+		return True
+
+	@classmethod
+	def dialog(cls):
+		if cls._dialog is None:
+			from AssayLib.ELineCorreGUI import ELineCorreGUI
+			cls._dialog = ELineCorreGUI()
+		return cls._dialog
+
+	def select(self, all_regs, nr, nc, plot_path, sample_name):
+		return self.dialog().launch(len(all_regs), nr, nc, plot_path,
+									sample_name)
+
+
+################################################################################
+# use all regressions, same as leaving all check boxes of the GUI checked
+class ELineSelectAll(ELineSelectorPrototype):
+	name = "all"
+
+	def select(self, all_regs, nr, nc, plot_path, sample_name):
+		n = len(all_regs)
+		return [True] * n, [True] * n
+
+
+################################################################################
+# reject regressions with r^2 below min_r2, for both slope and intercept
+# if less than 'min_keep' pass, the ones with best r^2 are kept
+class ELineSelectByRSquared(ELineSelectorPrototype):
+	name = "r2"
+
+	def __init__(self, min_r2 = 0.9, min_keep = 2, **kw):
+		super(ELineSelectByRSquared, self).__init__(**kw)
+		self.min_r2 = min_r2
+		self.min_keep = min_keep
+
+	def select(self, all_regs, nr, nc, plot_path, sample_name):
+		r2 = numpy.asarray(all_regs, dtype = float)[:, 2] ** 2
+		with numpy.errstate(invalid = "ignore"):
+			keep = self._keep_at_least(r2 >= self.min_r2, r2, self.min_keep)
+		return keep, list(keep)
+
+
+################################################################################
+# reject outliers of slopes and intercepts separately, a value is an outlier if
+# it is farther than n_mad scaled MAD's (median absolute deviation) from the
+# median; if less than 'min_keep' pass, the ones closest to median are kept
+class ELineSelectByMAD(ELineSelectorPrototype):
+	name = "mad"
+	# scale MAD to be consistent with sd for normal distribution
+	MAD_SCALE = 1.4826
+
+	def __init__(self, n_mad = 3.0, min_keep = 2, **kw):
+		super(ELineSelectByMAD, self).__init__(**kw)
+		self.n_mad = n_mad
+		self.min_keep = min_keep
+
+	def _select_values(self, values):
+		dev = numpy.abs(values - numpy.median(values))
+		mad = numpy.median(dev) * self.MAD_SCALE
+		keep = (dev <= self.n_mad * mad)
+		return self._keep_at_least(keep, -dev, self.min_keep)
+
+	def select(self, all_regs, nr, nc, plot_path, sample_name):
+		all_regs = numpy.asarray(all_regs, dtype = float)
+		return (self._select_values(all_regs[:, 0]),
+				self._select_values(all_regs[:, 1]))
+
+
+################################################################################
+# a fixed selection of e-line wells, given as a bool mask or indices in the
+# order of the e-line wells of the layout; inters defaults to the same wells
+# as slopes
+# not listed by name below since it needs the selection
+class ELineSelectMask(ELineSelectorPrototype):
+	name = "mask"
+
+	def __init__(self, slopes, inters = None, **kw):
+		super(ELineSelectMask, self).__init__(**kw)
+		self.slopes = numpy.asarray(slopes)
+		self.inters = self.slopes if inters is None else numpy.asarray(inters)
+
+	def __repr__(self):
+		return "<%s slopes='%s' inters='%s'>" % (self.__class__.__name__,
+			self.slopes.tolist(), self.inters.tolist())
+
+	@staticmethod
+	def _as_mask(sel, n):
+		if sel.dtype == bool:
+			if len(sel) != n:
+				raise AsValueError("e-line mask of length %d, but %d e-line wells" % (len(sel), n))
+			return sel.tolist()
+		keep = numpy.zeros(n, dtype = bool)
+		keep[sel.astype(int)] = True
+		return keep.tolist()
+
+	def select(self, all_regs, nr, nc, plot_path, sample_name):
+		n = len(all_regs)
+		return self._as_mask(self.slopes, n), self._as_mask(self.inters, n)
+
+
+################################################################################
+# returns a selector object from a selector, or a name listed below
+ELINE_SELECTORS = {i.name: i for i in [ELineSelectGUI, ELineSelectAll,
+										ELineSelectByRSquared, ELineSelectByMAD]}
+
+def get_eline_selector(selector = None, **kw):
+	if selector is None:
+		selector = "gui"
+	if isinstance(selector, ELineSelectorPrototype):
+		return selector
+	try:
+		return ELINE_SELECTORS[selector](**kw)
+	except (KeyError, TypeError):
+		raise AsValueError("unknown e-line selector '%s', choose from: %s" %\
+			(str(selector), ", ".join(sorted(ELINE_SELECTORS))))
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+if __name__ == "__main__":
+	import unittest
+
+	class test(unittest.TestCase):
+		def test_mad(self):
+			regs = numpy.zeros((4, 5))
+			regs[:, 0] = [1.0, 1.1, 0.9, 10.0]
+			regs[:, 1] = [5.0, 5.0, 5.0, 5.0]
+			slope_i, inter_i = ELineSelectByMAD().select(regs, 2, 2, None, "s")
+			self.assertEqual(slope_i, [True, True, True, False])
+			self.assertEqual(inter_i, [True, True, True, True])
+
+		def test_r2_keeps_best(self):
+			regs = numpy.zeros((4, 5))
+			regs[:, 2] = [0.99, 0.5, numpy.nan, 0.8]
+			slope_i, inter_i = ELineSelectByRSquared().select(regs, 2, 2,
+															None, "s")
+			# only one passes, the next best is kept as well
+			self.assertEqual(slope_i, [True, False, False, True])
+			self.assertEqual(inter_i, slope_i)
+
+		def test_mask(self):
+			regs = numpy.zeros((4, 5))
+			selector = ELineSelectMask([0, 2], [True, True, False, False])
+			slope_i, inter_i = selector.select(regs, 2, 2, None, "s")
+			self.assertEqual(slope_i, [True, False, True, False])
+			self.assertEqual(inter_i, [True, True, False, False])
+			with self.assertRaises(AsValueError):
+				ELineSelectMask([True, False]).select(regs, 2, 2, None, "s")
+
+		def test_by_name(self):
+			self.assertIsInstance(get_eline_selector("all"), ELineSelectAll)
+			self.assertEqual(get_eline_selector("mad", n_mad = 2).n_mad, 2)
+			with self.assertRaises(AsValueError):
+				get_eline_selector("best")
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
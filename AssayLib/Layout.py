@@ -22,6 +22,11 @@ from AssayLib.Exceptions import AsRuntimeError
 # must in tab-delimited format
 # it can also build such information from pair-wise gene to category mappings,
 # and also save the result into a *.layout file for furthur use
+################################################################################
+# selection by gene or category is by exact match, through an index from each
+# gene and category to its cell indices, built once the layout is loaded; masks
+# are cached on first use, all returned arrays are shared and read-only
+# substring matching is still available by search_genes/search_categories
 class Layout(object):
 	def __init__(self, layout = None, layout_maps = None, **kw):
 		super(Layout, self).__init__()
@@ -50,6 +55,7 @@ class Layout(object):
 		self._genes = loaded[:, 2].astype(str)
 		self._cates = loaded[:, 3].astype(str)
 		self._set_extension_size()
+		self._build_index()
 		return self
 
 	############################################################################
@@ -65,8 +71,36 @@ class Layout(object):
 		self._coords, self._genes, self._cates = self._parse_maps(gene_map,
 																cate_map)
 		self._set_extension_size()
+		self._build_index()
+		return self
+
+	############################################################################
+	# set from arrays, e.g. of a compiled layout, see LayoutRegistry
+	def set_all(self, coords, genes, cates):
+		self._coords = numpy.asarray(coords, dtype = int)
+		self._genes = numpy.asarray(genes, dtype = str)
+		self._cates = numpy.asarray(cates, dtype = str)
+		self._set_extension_size()
+		self._build_index()
+		return self
+
+	# make the arrays read-only, for layouts shared by many plates
+	def set_readonly(self):
+		for i in (self._coords, self._genes, self._cates):
+			i.setflags(write = False)
 		return self
 
+	############################################################################
+	# layouts handed out by a LayoutRegistry are pickled by collection and
+	# name only, a worker process unpickles the one of its own registry, which
+	# is loaded from the index file once per process
+	def __reduce_ex__(self, protocol):
+		ref = getattr(self, "_registry_ref", None)
+		if ref is None:
+			return super(Layout, self).__reduce_ex__(protocol)
+		from AssayLib.LayoutRegistry import _registry_layout
+		return (_registry_layout, ref)
+
 	def all_coords(self):
 		return self._coords
 
@@ -93,25 +127,26 @@ class Layout(object):
 
 	############################################################################
 	# called by build_from_maps to parse map into coordinates
+	# all cells of the maps are flattened in row-major order into one array
+	# of each map, with their row and column indices; cells with both gene
+	# and category are kept, in the same order
 	@staticmethod
 	def _parse_maps(gene_map, cate_map):
-		coords_list, genes_list, cates_list = [], [], []
-		for row_id, row in enumerate(gene_map):
-			for col_id, gene in enumerate(row):
-				cate = cate_map[row_id][col_id]
-				if (gene and cate):
-					coords_list.append([row_id, col_id])
-					genes_list.append(gene)
-					cates_list.append(cate)
-				elif not (gene or cate):
-					continue
-				else:
-					e = "'gene' or 'category' missing at (row %d, col %d)"
-					raise AsRuntimeError(e % (row_id, col_id))
-		coords = numpy.asarray(coords_list, dtype = int)
-		genes = numpy.asarray(genes_list, dtype = str)
-		cates = numpy.asarray(cates_list, dtype = str)
-		return coords, genes, cates
+		lens = numpy.array([len(row) for row in gene_map], dtype = int)
+		genes = numpy.array([i for row in gene_map for i in row], dtype = str)
+		cates = numpy.array([i for row in cate_map for i in row], dtype = str)
+		rows = numpy.repeat(numpy.arange(len(lens)), lens)
+		cols = numpy.arange(lens.sum()) -\
+			numpy.repeat(numpy.cumsum(lens) - lens, lens)
+		has_gene = (genes != "")
+		has_cate = (cates != "")
+		missing = numpy.flatnonzero(has_gene != has_cate)
+		if len(missing):
+			e = "'gene' or 'category' missing at (row %d, col %d)"
+			raise AsRuntimeError(e % (rows[missing[0]], cols[missing[0]]))
+		keep = has_gene & has_cate
+		coords = numpy.stack([rows[keep], cols[keep]], axis = 1)
+		return coords, genes[keep], cates[keep]
 
 	############################################################################
 	# save built layout into layout file
@@ -120,31 +155,83 @@ class Layout(object):
 			for c, g, t in zip(self._coords, self._genes, self._cates):
 				fh.write("%d\t%d\t%s\t%s\n" % (c[0], c[1], g, t))
 
+	############################################################################
+	# index of each distinct value of genes and categories to its cell indices
+	# (in layout order), grouped by a single sort of each field
+	@staticmethod
+	def _index_field(field):
+		values, inverse = numpy.unique(field, return_inverse = True)
+		order = numpy.argsort(inverse, kind = "stable")
+		bounds = numpy.cumsum(numpy.bincount(inverse, minlength = len(values)))
+		ret = {}
+		for value, idx in zip(values.tolist(),
+							numpy.split(order, bounds[:-1])):
+			idx.setflags(write = False)
+			ret[value] = idx
+		return ret
+
+	def _build_index(self):
+		self._index = {"gene": self._index_field(self._genes),
+					"category": self._index_field(self._cates)}
+		self._masks = {"gene": {}, "category": {}}
+		self._no_cells = numpy.zeros(0, dtype = int)
+		self._no_cells.setflags(write = False)
+
+	def _indices(self, field, key):
+		return self._index[field].get(key, self._no_cells)
+
+	def _mask(self, field, key):
+		masks = self._masks[field]
+		if not (key in masks):
+			mask = numpy.zeros(len(self._coords), dtype = bool)
+			mask[self._indices(field, key)] = True
+			mask.setflags(write = False)
+			masks[key] = mask
+		return masks[key]
+
+	############################################################################
+	# exact match selection
+	# indices_by_* returns cell indices, mask_by_* returns a T/F array
+	def indices_by_gene(self, gene):
+		return self._indices("gene", gene)
+
+	def indices_by_category(self, cate):
+		return self._indices("category", cate)
+
+	def mask_by_gene(self, gene):
+		return self._mask("gene", gene)
+
+	def mask_by_category(self, cate):
+		return self._mask("category", cate)
+
+	def has_gene(self, gene):
+		return gene in self._index["gene"]
+
+	def has_category(self, cate):
+		return cate in self._index["category"]
+
 	############################################################################
 	# select all cells have exact matched substring "key" in "field"
 	# returns an T/F array
+	# this scans the whole field on every call, use the exact match above
+	# whenever possible
 	def _mask_field_by_key(self, field, key):
 		mask = numpy.array(numpy.char.find(field, key) + 1, dtype = bool)
 		return mask
 
-	def mask_by_gene(self, gene):
-		return self._mask_field_by_key(self.all_genes(), gene)
+	def search_genes(self, key):
+		return self._mask_field_by_key(self.all_genes(), key)
 
-	def mask_by_category(self, cate):
-		return self._mask_field_by_key(self.all_categories(), cate)
+	def search_categories(self, key):
+		return self._mask_field_by_key(self.all_categories(), key)
 
 	############################################################################
-	# select all cells by a T/F array
-	def _filter_coords_mask(self, mask):
-		return self.all_coords()[mask]
-
+	# coordinates of all cells of a gene or a category
 	def coords_of_genes(self, gene):
-		mask = self._mask_field_by_key(self.all_genes(), key = gene)
-		return self._filter_coords_mask(mask)
+		return self.all_coords()[self.indices_by_gene(gene)]
 
 	def coords_of_category(self, cate):
-		mask = self._mask_field_by_key(self.all_categories(), key = cate)
-		return self._filter_coords_mask(mask)
+		return self.all_coords()[self.indices_by_category(cate)]
 
 
 
@@ -153,40 +240,47 @@ class Layout(object):
 ################################################################################
 # test
 ################################################################################
-# if __name__ == "__main__":
-# 	import unittest
-
-# 	class test(unittest.TestCase):
-# 		def test_load_and_select(self):
-# 			layout = Layout()
-# 			layout.load("../.devel/test_data/Layout.layout")
-
-# 			self.assertEqual(len(layout.all_coords()), 8)
-# 			self.assertEqual(tuple(layout.GetCoordsByGene("Gene1")[0]), (0, 0))
-# 			self.assertEqual(len(layout.GetCoordsByGene("Gene2")), 2)
-# 			self.assertEqual(tuple(layout.GetCoordsByCategory("O")[1]), (0, 1))
-# 			self.assertEqual(len(layout.GetCoordsByCategory("P")), 4)
-
-# 		def test_build(self):
-# 			layout = Layout()
-# 			layout.build_from_maps(	"../.devel/test_data/EColi.96.P2.gene_map.tsv",
-# 										"../.devel/test_data/EColi.96.P2.cate_map.tsv"
-# 				).save_layout("../.devel/test_data/EColi.96.P2.layout")
-# 			self.assertEqual(len(layout.GetCoordsByCategory("Oxidative")), 6)
-
-# 		@unittest.expectedFailure
-# 		def test_build_fail_unmatch(self):
-# 			layout = Layout()
-# 			layout.build_from_maps(	"../.devel/test_data/gene_map_bad.tsv",
-# 										"../.devel/test_data/cate_map.tsv"
-# 				).save_layout("../.devel/test_data/saved.layout")
-
-# 		@unittest.expectedFailure
-# 		def test_build_fail_missing(self):
-# 			layout = Layout()
-# 			layout.build_from_maps(	"../.devel/test_data/gene_map.tsv",
-# 										"../.devel/test_data/cate_map_bad.tsv"
-# 				).save_layout("../.devel/test_data/saved.layout")
-
-# 	suite = unittest.TestLoader().loadTestsFromTestCase(test)
-# 	unittest.TextTestRunner(verbosity = 2).run(suite)
+# run from the repository root: python3 -m AssayLib.Layout
+if __name__ == "__main__":
+	import os
+	import tempfile
+	import unittest
+
+	class test(unittest.TestCase):
+		def setUp(self):
+			self.layout = Layout("./example/EColi.96.P2.layout")
+
+		def test_load_and_select(self):
+			layout = self.layout
+			self.assertEqual(len(layout.all_coords()), 16)
+			self.assertEqual(layout.extension_size(), (8, 7))
+			self.assertEqual(tuple(layout.coords_of_genes("mutH")[0]), (0, 0))
+			self.assertEqual(len(layout.coords_of_genes("U66")), 2)
+			self.assertEqual(len(layout.coords_of_category("DNA")), 7)
+
+		def test_index_same_as_scan(self):
+			layout = self.layout
+			for values, indices, mask in [
+				(layout.all_genes(), layout.indices_by_gene,
+					layout.mask_by_gene),
+				(layout.all_categories(), layout.indices_by_category,
+					layout.mask_by_category)]:
+				for value in set(values.tolist()) | set(["NOT_THERE"]):
+					where = (values == value)
+					self.assertTrue(numpy.array_equal(indices(value),
+													numpy.flatnonzero(where)))
+					self.assertTrue(numpy.array_equal(mask(value), where))
+					self.assertFalse(mask(value).flags.writeable)
+
+		def test_save_and_load(self):
+			with tempfile.TemporaryDirectory() as tmp:
+				path = os.path.join(tmp, "saved.layout")
+				self.layout.save_layout(path)
+				loaded = Layout(path)
+			self.assertTrue(numpy.array_equal(loaded.all_coords(),
+											self.layout.all_coords()))
+			self.assertTrue(numpy.array_equal(loaded.all_genes(),
+											self.layout.all_genes()))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
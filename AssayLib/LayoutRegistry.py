@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import glob
+import numpy
+from AssayLib.Exceptions import AsRuntimeError, AsValueError
+from AssayLib.Layout import Layout
+
+
+################################################################################
+# LayoutRegistry object manages all layouts of a collection directory, e.g.
+# collections/EColi96, and hands out shared, read-only Layout objects by name
+# a layout named 'EColi.96.P3' comes from either
+#   <dir>/layout_map/EColi.96.P3.gene_map.tsv and .cate_map.tsv, compiled by
+#   Layout.build_from_maps and also saved as <dir>/EColi.96.P3.layout
+#   <dir>/EColi.96.P3.layout, if there are no maps for it
+# all compiled layouts are kept in one binary index file, <dir>/layouts.index,
+# together with the mtime and size of their sources; refresh() compiles only
+# the layouts whose sources changed since
+# get_layout_registry() keeps one registry per collection in each process, so
+# each layout is loaded once per process however many plates use it
+class LayoutRegistry(object):
+	INDEX_FILE = "layouts.index"
+	MAP_DIR = "layout_map"
+	VERSION = 1
+
+	def __init__(self, collection_dir, index_file = None,
+				write_layouts = True):
+		super(LayoutRegistry, self).__init__()
+		if not os.path.isdir(collection_dir):
+			raise AsRuntimeError("layout collection '%s' is not a directory"\
+				% collection_dir)
+		self.collection_dir = collection_dir
+		self.index_file = index_file or\
+			os.path.join(collection_dir, self.INDEX_FILE)
+		self.write_layouts = write_layouts
+		# name: (sources dict, coords, genes, cates)
+		self._records = {}
+		self._layouts = {}
+		self._load_index()
+
+	def __repr__(self):
+		return "<LayoutRegistry dir='%s' layouts='%d'>" % (self.collection_dir,
+															len(self._records))
+
+	def __contains__(self, name):
+		return name in self._records
+
+	def __len__(self):
+		return len(self._records)
+
+	def names(self):
+		return sorted(self._records)
+
+	############################################################################
+	# source files of each layout name found in the collection
+	def scan(self):
+		ret = {}
+		map_dir = os.path.join(self.collection_dir, self.MAP_DIR)
+		for gene_map in glob.glob(os.path.join(map_dir, "*.gene_map.tsv")):
+			name = os.path.basename(gene_map)[:-len(".gene_map.tsv")]
+			cate_map = os.path.join(map_dir, name + ".cate_map.tsv")
+			if os.path.isfile(cate_map):
+				ret[name] = ("maps", [gene_map, cate_map])
+		for layout in glob.glob(os.path.join(self.collection_dir, "*.layout")):
+			name = os.path.basename(layout)[:-len(".layout")]
+			if not (name in ret):
+				ret[name] = ("layout", [layout])
+		return ret
+
+	@staticmethod
+	def _stat_sources(files):
+		ret = {}
+		for f in files:
+			st = os.stat(f)
+			ret[os.path.basename(f)] = [st.st_mtime_ns, st.st_size]
+		return ret
+
+	############################################################################
+	# compile layouts with changed sources, drop layouts with no source
+	# returns the names compiled
+	def refresh(self):
+		found = self.scan()
+		changed = []
+		for name, (kind, files) in sorted(found.items()):
+			sources = self._stat_sources(files)
+			if (name in self._records) and\
+				(self._records[name][0] == sources):
+				continue
+			layout = Layout()
+			if kind == "maps":
+				layout.build_from_maps(*files)
+				if self.write_layouts:
+					layout.save_layout(os.path.join(self.collection_dir,
+													name + ".layout"))
+			else:
+				layout.load(files[0])
+			self._records[name] = (sources,) + layout.get_all()
+			self._layouts.pop(name, None)
+			changed.append(name)
+		removed = [i for i in self._records if not (i in found)]
+		for name in removed:
+			del self._records[name]
+			self._layouts.pop(name, None)
+		if changed or removed:
+			self._save_index()
+		return changed
+
+	############################################################################
+	# shared read-only Layout by name
+	def get(self, name):
+		if not (name in self._layouts):
+			if not (name in self._records):
+				raise AsValueError("no layout '%s' in collection '%s'" %\
+					(name, self.collection_dir))
+			sources, coords, genes, cates = self._records[name]
+			layout = Layout().set_all(coords, genes, cates).set_readonly()
+			layout._registry_ref = (os.path.abspath(self.collection_dir),
+									name)
+			self._layouts[name] = layout
+		return self._layouts[name]
+
+	############################################################################
+	# index file is an uncompressed npz, arrays named <name>/coords,
+	# <name>/genes and <name>/cates, sources of all layouts in '__meta__'
+	def _load_index(self):
+		if not os.path.isfile(self.index_file):
+			return
+		try:
+			with numpy.load(self.index_file) as npz:
+				meta = json.loads(str(npz["__meta__"]))
+				if meta.get("version") != self.VERSION:
+					return
+				for name, sources in meta["sources"].items():
+					self._records[name] = (sources,
+											npz[name + "/coords"],
+											npz[name + "/genes"],
+											npz[name + "/cates"])
+		except (OSError, ValueError, KeyError):
+			# an unreadable index is rebuilt by refresh
+			self._records = {}
+
+	def _save_index(self):
+		arrays = {}
+		for name, (sources, coords, genes, cates) in self._records.items():
+			arrays[name + "/coords"] = coords
+			arrays[name + "/genes"] = genes
+			arrays[name + "/cates"] = cates
+		meta = dict(version = self.VERSION,
+					sources = {k: v[0] for k, v in self._records.items()})
+		arrays["__meta__"] = numpy.array(json.dumps(meta))
+		tmp_file = "%s.%d.tmp" % (self.index_file, os.getpid())
+		with open(tmp_file, "wb") as fh:
+			numpy.savez(fh, **arrays)
+		os.replace(tmp_file, self.index_file)
+
+
+################################################################################
+# one registry per collection directory per process, refreshed when created
+_registries = {}
+
+def get_layout_registry(collection_dir):
+	key = os.path.abspath(collection_dir)
+	if not (key in _registries):
+		registry = LayoutRegistry(collection_dir)
+		registry.refresh()
+		_registries[key] = registry
+	return _registries[key]
+
+# unpickles a registry layout, see Layout.__reduce_ex__
+def _registry_layout(collection_dir, name):
+	return get_layout_registry(collection_dir).get(name)
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.LayoutRegistry
+if __name__ == "__main__":
+	import shutil
+	import pickle
+	import tempfile
+	import unittest
+
+	class test(unittest.TestCase):
+		def setUp(self):
+			self.tmp = tempfile.mkdtemp()
+			self.dir = os.path.join(self.tmp, "EColi96")
+			shutil.copytree("./collections/EColi96", self.dir,
+							ignore = shutil.ignore_patterns(LayoutRegistry.INDEX_FILE))
+
+		def tearDown(self):
+			shutil.rmtree(self.tmp, ignore_errors = True)
+
+		def test_compiled_once(self):
+			registry = LayoutRegistry(self.dir)
+			self.assertEqual(len(registry.refresh()), len(registry.scan()))
+			self.assertEqual(registry.refresh(), [])
+			# a new registry reads the index, nothing is compiled again
+			self.assertEqual(LayoutRegistry(self.dir).refresh(), [])
+
+		def test_changed_source(self):
+			registry = LayoutRegistry(self.dir)
+			registry.refresh()
+			gene_map = os.path.join(self.dir, LayoutRegistry.MAP_DIR,
+									"EColi.96.P3.gene_map.tsv")
+			st = os.stat(gene_map)
+			os.utime(gene_map, ns = (st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+			self.assertEqual(LayoutRegistry(self.dir).refresh(), ["EColi.96.P3"])
+
+		def test_shared(self):
+			# registries of the module used by unpickling, not of __main__
+			from AssayLib.LayoutRegistry import get_layout_registry
+			registry = get_layout_registry(self.dir)
+			layout = registry.get("EColi.96.P3")
+			self.assertIs(layout, registry.get("EColi.96.P3"))
+			self.assertIs(pickle.loads(pickle.dumps(layout)), layout)
+			ref = Layout(os.path.join(self.dir, "EColi.96.P3.layout"))
+			self.assertTrue(numpy.array_equal(layout.all_genes(),
+											ref.all_genes()))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
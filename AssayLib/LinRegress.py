@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import numpy
+
+
+################################################################################
+# this module only defines functions
+################################################################################
+# batched closed-form linear regression, y = slope * x + intercept
+# X, Y and MASK are arrays of shape (..., n, k): each of the k columns is one
+# regression over its n points, only points with MASK True are used
+# any leading axes are batch axes, e.g. (sample, time, well) tensors of a plate
+# or (plate, sample, time, well) of many plates are all regressed in one call
+# returns an array of shape (..., k, 5), the last axis is
+#   slope, intercept, r, p, stderr
+# same as tuple(scipy.stats.linregress(x[m], y[m])) on each column, including
+# the special cases of scipy: r is nan if both variances are zero, and with
+# only two points p is 0 (or 1 if y's are equal) and stderr is 0
+# scipy is imported on the first call, not with this module
+LINREG_FIELDS = ("slope", "intercept", "r", "p", "stderr")
+
+def batched_linregress(X, Y, MASK = None):
+	from scipy import special
+	X = numpy.asarray(X, dtype = float)
+	Y = numpy.asarray(Y, dtype = float)
+	if MASK is None:
+		w = numpy.ones(X.shape, dtype = float)
+	else:
+		w = numpy.asarray(MASK, dtype = float)
+	TINY = 1.0e-20
+
+	with numpy.errstate(divide = "ignore", invalid = "ignore"):
+		n = w.sum(axis = -2)
+		xmean = (X * w).sum(axis = -2) / n
+		ymean = (Y * w).sum(axis = -2) / n
+		# centered and masked, masked points contribute nothing to the sums
+		dx = (X - xmean[..., None, :]) * w
+		dy = (Y - ymean[..., None, :]) * w
+		ssxm = (dx * dx).sum(axis = -2) / n
+		ssym = (dy * dy).sum(axis = -2) / n
+		ssxym = (dx * dy).sum(axis = -2) / n
+
+		r = ssxym / numpy.sqrt(ssxm * ssym)
+		zero_var = (ssxm == 0) | (ssym == 0)
+		r[zero_var] = numpy.where(ssxym[zero_var] == 0, numpy.nan, 0.0)
+		numpy.clip(r, -1.0, 1.0, out = r)
+
+		slope = ssxym / ssxm
+		intercept = ymean - slope * xmean
+
+		df = n - 2
+		t = r * numpy.sqrt(df / ((1.0 - r + TINY) * (1.0 + r + TINY)))
+		# two-sided p value of Student's t distribution
+		p = 2 * special.stdtr(df, -numpy.abs(t))
+		stderr = numpy.sqrt((1 - r ** 2) * ssym / ssxm / df)
+
+	# special case of only two points
+	two = (n == 2)
+	if two.any():
+		y_first, y_last = _first_and_last_masked(Y, w)
+		p[two] = numpy.where(y_first[two] == y_last[two], 1.0, 0.0)
+		stderr[two] = 0.0
+	return numpy.stack([slope, intercept, r, p, stderr], axis = -1)
+
+################################################################################
+# first and last masked value of each column, used for the two-point case
+def _first_and_last_masked(Y, w):
+	valid = (w != 0)
+	nrow = Y.shape[-2]
+	first = numpy.argmax(valid, axis = -2)
+	last = nrow - 1 - numpy.argmax(valid[..., ::-1, :], axis = -2)
+	y_first = numpy.take_along_axis(Y, first[..., None, :], axis = -2)[..., 0, :]
+	y_last = numpy.take_along_axis(Y, last[..., None, :], axis = -2)[..., 0, :]
+	return y_first, y_last
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+if __name__ == "__main__":
+	import unittest
+	from scipy import stats
+
+	class test(unittest.TestCase):
+		def assertSameAsScipy(self, X, Y, M):
+			regs = batched_linregress(X, Y, M)
+			for x, y, m, reg in zip(X.T, Y.T, M.T, regs):
+				ref = tuple(stats.linregress(x[m], y[m]))
+				self.assertTrue(numpy.allclose(reg, ref, equal_nan = True),
+								(reg, ref))
+
+		def test_same_as_scipy(self):
+			rng = numpy.random.default_rng(0)
+			X = rng.random((25, 4))
+			Y = X * 3 + rng.random((25, 4))
+			M = rng.random((25, 4)) > 0.1
+			self.assertSameAsScipy(X, Y, M)
+
+		def test_special_cases(self):
+			X = numpy.array([[1., 1., 1.], [2., 2., 2.], [3., 3., 3.]])
+			# two points (one masked), two equal y's, and a constant y
+			Y = numpy.array([[1., 5., 4.], [2., 5., 4.], [9., 6., 4.]])
+			M = numpy.array([[True, True, True], [True, True, True],
+							[False, False, True]])
+			self.assertSameAsScipy(X, Y, M)
+
+		def test_batch_axes(self):
+			rng = numpy.random.default_rng(1)
+			X = rng.random((2, 3, 25, 4))
+			Y = X * 2 + rng.random((2, 3, 25, 4))
+			regs = batched_linregress(X, Y)
+			self.assertEqual(regs.shape, (2, 3, 4, 5))
+			self.assertTrue(numpy.allclose(regs[1, 2],
+											batched_linregress(X[1, 2], Y[1, 2])))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
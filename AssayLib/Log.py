@@ -1,25 +1,147 @@
 #!/usr/bin/env python3
 
+import numpy
+from contextlib import contextmanager
+from AssayLib.Exceptions import AsValueError
+from AssayLib.ArrayFormatting import format_array2d
+
 
 ################################################################################
 # manages the log file
 # called only by the AssayPlate module
+#
+# messages are leveled, only those with level <= the log level are written:
+#   SUMMARY: e-line models of each sample
+#   DEBUG:   the corrected GFP table used for P
+#   TRACE:   all intermediate OD/GFP tables (everything, the default)
+# a message can be a string, or a callable returning the string which is only
+# called if its level is enabled, so that disabled messages cost nothing
+# messages are buffered and written when flush() is called, by AssayPlate and
+# samples at the end of each analysis stage, or when buffer_size is exceeded
+#
+# with dump_arrays, the tables of write_tables() are saved as binary arrays in
+# a side file <log>.arrays instead of formatted as text, see read_array_dump()
 class Log(object):
+	SUMMARY = 10
+	DEBUG = 20
+	TRACE = 30
+	LEVELS = {"summary": SUMMARY, "debug": DEBUG, "trace": TRACE}
+
 	# by default, the log file will be saved as ./log
 	# by default of the AssayPlate, the log file will be saved as
 	# path/to/output/dir/log
-	def __init__(self, file = "log", dir = "."):
+	def __init__(self, file = "log", dir = ".", level = "trace",
+				dump_arrays = False, buffer_size = 1 << 20):
 		super(Log, self).__init__()
 		self.log_file = dir + "/" + file
+		self.level = self.get_level(level)
+		self.buffer_size = buffer_size
+		self._buffer = []
+		self._buffered = 0
 		self._fh = open(self.log_file, "w")
+		self._dump_fh = None
+		self._dumped = 0
+		if dump_arrays:
+			self._dump_fh = open(self.log_file + ".arrays", "wb")
 
 	def __del__(self):
-		self._fh.close()
+		self.close()
 
 	def fh(self):
 		return self._fh
 
+	############################################################################
+	# level can be a name in Log.LEVELS or a number
+	@classmethod
+	def get_level(cls, level):
+		if isinstance(level, str):
+			if not (level in cls.LEVELS):
+				raise AsValueError("unknown log level '%s', choose from: %s" %\
+					(level, ", ".join(cls.LEVELS)))
+			return cls.LEVELS[level]
+		return int(level)
+
+	def enabled(self, level = SUMMARY):
+		return level <= self.level
+
+	# context in which no message is enabled, e.g. for stages computed on the
+	# side (see ParameterSweep)
+	@contextmanager
+	def muted(self):
+		level = self.level
+		self.level = 0
+		try:
+			yield self
+		finally:
+			self.level = level
+
 	# protected write message to file, only if message contains something
-	def write(self, message = None):
+	def write(self, message = None, level = SUMMARY):
+		if not self.enabled(level):
+			return
+		if callable(message):
+			message = message()
 		if message:
-			self._fh.write(message)
+			self._buffer.append(message)
+			self._buffered += len(message)
+			if self._buffered >= self.buffer_size:
+				self.flush()
+
+	############################################################################
+	# write named tables under a header line, each table is (name, array2d,
+	# fmt), as
+	#   header
+	#   name:
+	#   table...
+	# tables are formatted right away (they may be modified in place later),
+	# but only if the level is enabled
+	# with dump_arrays, the arrays go to the side file and only a reference to
+	# each record is written
+	def write_tables(self, header, tables, level = TRACE):
+		if not self.enabled(level):
+			return
+		if self._dump_fh is None:
+			body = "\n".join(["%s:\n%s" % (name, format_array2d(arr, fmt))
+							for name, arr, fmt in tables])
+		else:
+			body = "\n".join([self._dump_array(header.lstrip(">"), name, arr)
+							for name, arr, fmt in tables])
+		self.write("%s\n%s\n" % (header, body), level)
+
+	def _dump_array(self, header, name, arr):
+		arr = numpy.asarray(arr)
+		numpy.save(self._dump_fh, numpy.array("%s:%s" % (header, name)))
+		numpy.save(self._dump_fh, arr)
+		self._dumped += 1
+		return "%s: array #%d %s %s in %s.arrays" % (name, self._dumped - 1,
+			arr.dtype.str, str(arr.shape), self.log_file)
+
+	def flush(self):
+		if self._buffer:
+			self._fh.write("".join(self._buffer))
+			self._buffer = []
+			self._buffered = 0
+		self._fh.flush()
+		if self._dump_fh is not None:
+			self._dump_fh.flush()
+
+	def close(self):
+		if (getattr(self, "_fh", None) is None) or self._fh.closed:
+			return
+		self.flush()
+		self._fh.close()
+		if self._dump_fh is not None:
+			self._dump_fh.close()
+
+
+################################################################################
+# read back the side file of Log(dump_arrays = True), yields (tag, array) in
+# the order written, tag is like 'C1:BLANK_CORRECTION:OD'
+def read_array_dump(path):
+	with open(path, "rb") as fh:
+		while True:
+			try:
+				tag = numpy.load(fh)
+			except (EOFError, ValueError):
+				break
+			yield str(tag), numpy.load(fh)
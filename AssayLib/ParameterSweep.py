@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import numpy
+from AssayLib.Exceptions import AsRuntimeError, AsValueError
+from AssayLib.EColiSample import EColiSample
+from AssayLib.ELineCorre import ELineCorre
+from AssayLib.ELineSelector import ELineSelectorPrototype, ELineSelectMask,\
+	get_eline_selector
+
+
+################################################################################
+# (model, sd_factor, time, well) P of blank corrected OD and GFP (time, well),
+# for (model, 3) e-line models (slope, intercept, intercept sd) and sd_factors
+# same arithmetic as the OD correction and P of EColiSample: the e-line
+# background is subtracted in the GFP type, GFP below the threshold is set
+# to the threshold (in the GFP type)
+def corrected_P(OD, GFP, models, sd_factors):
+	models = numpy.asarray(models, dtype = float)
+	slope = models[:, 0, numpy.newaxis, numpy.newaxis]
+	inter = models[:, 1, numpy.newaxis, numpy.newaxis]
+	bg_GFP = OD * slope
+	bg_GFP += inter
+	GFP_bg = (GFP - bg_GFP).astype(GFP.dtype)[:, numpy.newaxis]
+	threshold = numpy.asarray(sd_factors, dtype = float)[numpy.newaxis, :] *\
+		models[:, 2, numpy.newaxis]
+	threshold = threshold[..., numpy.newaxis, numpy.newaxis]
+	GFP_c = numpy.where(GFP_bg < threshold, threshold.astype(GFP.dtype), GFP_bg)
+	with numpy.errstate(divide = "ignore"):
+		P = GFP_c / OD
+		P[P == numpy.inf] = numpy.nan
+	return P
+
+
+################################################################################
+# ParameterSweep object computes P, I and XELI of all samples of a plate for
+# all combinations of a grid of sd_factor values and e-line selections
+# a selection is an ELineSelector (object or name, not the interactive "gui"),
+# or a fixed selection of e-line wells as a bool mask or indices (see
+# ELineSelectMask); selections can be given as a dict, labeled by its keys
+# blank corrected data and e-line regressions are taken from the stage graph
+# of each sample if memoized by a previous analysis; otherwise they are
+# computed on the side, with the log muted and no e-line plot, and not kept,
+# so that a later analysis still logs and plots them; then for each sample
+# the e-line models of all selections are made, and the OD correction, P, I
+# and XELI are each one broadcasted operation over the (selection,
+# sd_factor) axes
+# results are identical to analyzing with each combination, but no table is
+# written and nothing is logged; memory is (selections x sd_factors) times
+# the P and I tables of each sample
+class ParameterSweep(object):
+	def __init__(self, samples, untreated, sd_factors, selections = None):
+		super(ParameterSweep, self).__init__()
+		self.samples = list(samples)
+		for s in self.samples:
+			if not isinstance(s, EColiSample):
+				raise AsRuntimeError("parameter sweep only supports EColiSample")
+		if not any([i is untreated for i in self.samples]):
+			raise AsRuntimeError("cannot canculate I with no assign of untreated sample")
+		self.untreated = untreated
+		self.sd_factors = numpy.asarray(sd_factors, dtype = float).ravel()
+		if not len(self.sd_factors):
+			raise AsValueError("parameter sweep requires at least one sd_factor")
+		self.labels, self.selectors = self._get_selectors(selections)
+
+	def __repr__(self):
+		return "<ParameterSweep selections='%d' sd_factors='%d'>" %\
+			(len(self.labels), len(self.sd_factors))
+
+	############################################################################
+	# labels and selector objects of the selections; None means the current
+	# selector of each sample, labeled "current"
+	@staticmethod
+	def _get_selectors(selections):
+		if selections is None:
+			return ["current"], [None]
+		if isinstance(selections, dict):
+			items = list(selections.items())
+		else:
+			items = [(None, i) for i in selections]
+		labels, selectors = [], []
+		for i, (label, sel) in enumerate(items):
+			if isinstance(sel, (str, ELineSelectorPrototype)):
+				sel = get_eline_selector(sel)
+				if sel.needs_plot():
+					raise AsValueError("interactive e-line selector '%s' cannot be swept" % sel.name)
+				label = sel.name if label is None else label
+			else:
+				sel = ELineSelectMask(sel)
+				label = "mask%d" % i if label is None else label
+			labels.append(str(label))
+			selectors.append(sel)
+		if len(set(labels)) != len(labels):
+			raise AsValueError("parameter sweep: duplicated selection labels")
+		return labels, selectors
+
+	############################################################################
+	# (selection, 3) array of slope, intercept and intercept sd of a sample
+	def _models(self, sample, all_regs):
+		nr, nc = sample.eline_corre.auto_fit_subplots(len(all_regs))
+		ret = []
+		for sel in self.selectors:
+			sel = sample.eline_corre.selector if sel is None else sel
+			if len(all_regs) == 1:
+				slope_i, inter_i = [0], [0]
+			elif sel.needs_plot():
+				raise AsValueError("interactive e-line selector '%s' cannot be swept" % sel.name)
+			else:
+				slope_i, inter_i = sel.select(all_regs, nr, nc,
+										sample.eline_corre.plot_path,
+										sample.name())
+			ret.append(ELineCorre.eline_model(all_regs, slope_i, inter_i))
+		return numpy.array(ret, dtype = float)
+
+	############################################################################
+	# blank corrected data and e-line regressions of a sample, from its stage
+	# graph if memoized, otherwise computed with the log muted; stages not
+	# memoized before are forgotten again, and the regressions are not
+	# plotted (as the eline_regress stage does)
+	@staticmethod
+	def _blanked_and_regressions(sample):
+		graph = sample.stages
+		computed = [i for i in ("extract", "blank") if not graph.is_cached(i)]
+		with sample.log.muted():
+			extracted = graph.run(sample, "extract")
+			blanked = graph.run(sample, "blank")
+		if graph.is_cached("eline_regress"):
+			all_regs = graph.run(sample, "eline_regress")
+		else:
+			eline_where = sample.eline_mask()
+			all_regs = ELineCorre.regress(blanked["OD"][:, eline_where],
+										blanked["GFP"][:, eline_where],
+										extracted["MASK"][:, eline_where])
+		for name in computed:
+			graph.forget(name)
+		return blanked, all_regs
+
+	def run(self):
+		result = SweepResult(self.labels, self.sd_factors,
+							[s.name() for s in self.samples],
+							self.untreated.name())
+		for s in self.samples:
+			blanked, all_regs = self._blanked_and_regressions(s)
+			models = self._models(s, all_regs)
+			result.models[s.name()] = models
+			result.P[s.name()] = corrected_P(blanked["OD"], blanked["GFP"],
+											models, self.sd_factors)
+			result.genes[s.name()] = s.layout.all_genes()
+		untreated_P = result.P[self.untreated.name()]
+		for s in self.samples:
+			if s is self.untreated:
+				continue
+			I = result.P[s.name()] / untreated_P
+			result.I[s.name()] = I
+			I = I.copy()
+			I[I < 1] = (1 / I[I < 1])
+			result.XELI[s.name()] = I.sum(axis = 2) / I.shape[2]
+		return result
+
+
+################################################################################
+# SweepResult object holds the result cube of a ParameterSweep, per sample:
+#   models[sample]: (selection, 3) e-line slope, intercept and intercept sd
+#   P[sample], I[sample]: (selection, sd_factor, time, well)
+#   XELI[sample]: (selection, sd_factor, well)
+# I and XELI are not for the untreated sample
+# axes are labeled by 'selections' (labels) and 'sd_factors' (values)
+class SweepResult(object):
+	DIMS = ("selection", "sd_factor", "time", "well")
+	KINDS = ("P", "I", "XELI")
+
+	def __init__(self, selections, sd_factors, samples, untreated):
+		super(SweepResult, self).__init__()
+		self.selections = list(selections)
+		self.sd_factors = numpy.asarray(sd_factors)
+		self.samples = list(samples)
+		self.untreated = untreated
+		self.models = {}
+		self.genes = {}
+		self.P = {}
+		self.I = {}
+		self.XELI = {}
+
+	def __repr__(self):
+		return "<SweepResult selections='%d' sd_factors='%d' samples='%d'>" %\
+			(len(self.selections), len(self.sd_factors), len(self.samples))
+
+	############################################################################
+	# index of a selection label / an sd_factor value on their axes
+	def selection_index(self, selection):
+		if not (selection in self.selections):
+			raise AsValueError("no selection '%s' in sweep, choose from: %s" %\
+				(str(selection), ", ".join(self.selections)))
+		return self.selections.index(selection)
+
+	def sd_factor_index(self, sd_factor):
+		where = numpy.flatnonzero(numpy.isclose(self.sd_factors, sd_factor))
+		if not len(where):
+			raise AsValueError("no sd_factor %s in sweep" % str(sd_factor))
+		return int(where[0])
+
+	############################################################################
+	# table of a sample for one combination, same shape as the table of an
+	# analysis with these parameters, e.g. get("XELI", "C2", "mad", 3.0)
+	def get(self, kind, sample, selection, sd_factor):
+		if not (kind in self.KINDS):
+			raise AsValueError("unknown result kind '%s'" % str(kind))
+		table = getattr(self, kind)
+		if not (sample in table):
+			raise AsValueError("no %s of sample '%s' in sweep" % (kind, sample))
+		ret = table[sample][self.selection_index(selection),
+							self.sd_factor_index(sd_factor)]
+		return ret[numpy.newaxis] if kind == "XELI" else ret
+
+	############################################################################
+	# (selection, sd_factor, sample, well) XELI of all samples except the
+	# untreated, and the sample names; requires samples of the same wells
+	def XELI_cube(self):
+		names = [i for i in self.samples if i in self.XELI]
+		if len(set([self.XELI[i].shape for i in names])) > 1:
+			raise AsRuntimeError("XELI cube requires all samples to have the same wells")
+		return numpy.stack([self.XELI[i] for i in names], axis = 2), names
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.ParameterSweep
+if __name__ == "__main__":
+	import os
+	import tempfile
+	import unittest
+	from AssayLib.AssayPlate import AssayPlate
+
+	class test(unittest.TestCase):
+		def test_same_as_analyze(self):
+			with tempfile.TemporaryDirectory() as tmp:
+				assay = AssayPlate("sweep", 96, outdir = tmp + "/",
+							layout = "./example/EColi.96.P2.layout",
+							data_file = "./example/plate_data.txt")
+				for i in range(6):
+					assay.add_sample(EColiSample, name = "C%d" % (i + 1),
+									offset = (0, i), untreated = (i == 0),
+									eline_selector = "all", eline_plot = "off")
+				assay.analyze()
+				log = os.path.join(assay.outdir, "log")
+				log_size = os.path.getsize(log)
+				self.assertGreater(log_size, 0)
+				result = assay.sweep([2.0, 3.0], ["all", "mad"])
+				# the sweep does not log
+				self.assertEqual(os.path.getsize(log), log_size)
+				for selection in ["all", "mad"]:
+					for sd_factor in [2.0, 3.0]:
+						assay.retune(sd_factor = sd_factor,
+									eline_selector = selection)
+						for sample in assay.get_samples_except_untreated():
+							for kind in ["P", "XELI"]:
+								self.assertTrue(numpy.array_equal(
+									result.get(kind, sample.name(), selection,
+												sd_factor),
+									getattr(sample, kind)(), equal_nan = True))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
@@ -56,11 +56,14 @@ class PlateGUIBasicSetup(PlateGUIModulePrototype):
 		self.type96.setChecked(True)
 		self.type384 = QtWidgets.QRadioButton("384-well assay plate", self)
 		self.type384.setGeometry(10, 144, 160, 24)
+		self.type1536 = QtWidgets.QRadioButton("1536-well assay plate", self)
+		self.type1536.setGeometry(180, 120, 170, 24)
 
 		self.type_btns = QtWidgets.QButtonGroup(self)
 		self.type_btns.setExclusive(True)
 		self.type_btns.addButton(self.type96, id = 96)
 		self.type_btns.addButton(self.type384, id = 384)
+		self.type_btns.addButton(self.type1536, id = 1536)
 
 	def run_select_file(self, accept_mode, file_mode, callbacks, option = 0,
 							option_on = False):
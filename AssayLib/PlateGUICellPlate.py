@@ -37,28 +37,38 @@ class CellPlatePrototype(QtWidgets.QFrame):
 		super(CellPlatePrototype, self).__init__(parent)
 		self._nrow = nrow
 		self._ncol = ncol
+		self._CellClass = CellClass
 		self.setStyleSheet("""QFrame{background-color:#B0B0B0;}
 							QLabel{background-color:#FFFFFF;
 							border-style:solid;
 							border-width:1;
 							border-color:#C0C0C0;}""")
-		# derived class should provide CellClass information!
-		self._setup_cells(nrow, ncol, CellClass)
+		# cells are created when first shown, see _setup_cells
+		self.cells = []
 
 	############################################################################
-	# use different CellClass to create cell objects
-	def _setup_cells(self, nrow, ncol, CellClass):
-		self.cells = [[CellClass(self, (j, i))
-						for i in range(ncol)]
-						for j in range(nrow)]
+	# nrow x ncol is the capacity, the largest plate shown; cells are created
+	# by CellClass only up to the largest part shown so far, so that a plate
+	# viewer able to show 1536-well plates only creates 96 cells for 96-well
+	# plates; existing cells are kept
+	def _setup_cells(self, nrow, ncol):
+		nrow = min(nrow, self._nrow)
+		ncol = min(ncol, self._ncol)
+		for j, row in enumerate(self.cells):
+			row.extend([self._CellClass(self, (j, i))
+						for i in range(len(row), ncol)])
+		self.cells.extend([[self._CellClass(self, (j, i)) for i in range(ncol)]
+							for j in range(len(self.cells), nrow)])
+
+	def _created_cells(self):
+		return [cell for row in self.cells for cell in row]
 
 	def get_row_col_capacity(self):
 		return self._nrow, self._ncol
 
 	def clear_all_cells(self):
-		for i in range(self._nrow):
-			for j in range(self._ncol):
-				self.cells[i][j].setText("")
+		for cell in self._created_cells():
+			cell.setText("")
 
 	############################################################################
 	# contents: should be a list, each item is a 2-element list or tuple:
@@ -77,9 +87,9 @@ class CellPlatePrototype(QtWidgets.QFrame):
 		# adjust geometry to the content
 		self.setGeometry(24, 24, show_ncol * cell_w + 4, show_nrow * cell_h + 4)
 
-		for i in range(self._nrow):
-			for j in range(self._ncol):
-				cell = self.cells[i][j]
+		self._setup_cells(show_nrow, show_ncol)
+		for i, row in enumerate(self.cells):
+			for j, cell in enumerate(row):
 				if (i >= show_nrow) or (j >= show_ncol):
 					cell.hide()
 				else:
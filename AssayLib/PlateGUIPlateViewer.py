@@ -4,6 +4,7 @@ import types
 from PyQt5 import QtWidgets
 from PyQt5 import QtCore
 from AssayLib.PlateGUICellPlate import CellPlate, InteractiveCellPlate
+from AssayLib.UtilFunctions import PLATE_SHAPES
 
 
 ################################################################################
@@ -12,8 +13,13 @@ from AssayLib.PlateGUICellPlate import CellPlate, InteractiveCellPlate
 # the labels are managed by this object,
 # while the functions manipulating or interacting with cells are just interfaces
 # which forward calls to synonym functions of the underneath CellPlate object
+# by default the capacity is the largest plate type, cells are only created
+# when shown (see CellPlatePrototype)
 class PlateGUIPlateViewer(QtWidgets.QFrame):
-	def __init__(self, parent, nrow = 16, ncol = 24):
+	def __init__(self, parent, nrow = None, ncol = None):
+		max_shape = max(PLATE_SHAPES.values())
+		nrow = nrow or max_shape[0]
+		ncol = ncol or max_shape[1]
 		super(PlateGUIPlateViewer, self).__init__(parent)
 		self._nrow = nrow
 		self._ncol = ncol
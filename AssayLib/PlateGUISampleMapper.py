@@ -6,7 +6,7 @@ from PyQt5 import QtCore
 from AssayLib.PlateGUIModulePrototype import PlateGUIModulePrototype
 from AssayLib.PlateGUIPlateViewer import PlateGUIPlateViewer, PlateGUIPlateViewerInteractive
 from AssayLib.Palettes import CategoriesPalette, SampleSeriesPalette
-from AssayLib.UtilFunctions import plate_type_to_shape
+from AssayLib.UtilFunctions import plate_type_to_shape, well_row_labels
 
 
 ################################################################################
@@ -17,8 +17,9 @@ class LayoutViewDialog(QtWidgets.QDialog):
 		self.setWindowTitle("Layout viewer")
 		self.cell_plate = PlateGUIPlateViewer(parent = self)
 		self.cell_plate.setStyleSheet("QFrame{background-color:#FFFFFF;}")
-		self.cell_plate.set_row_labels([str(i + 1) for i in range(16)])
-		self.cell_plate.set_col_labels([str(i + 1) for i in range(24)])
+		nrow, ncol = self.cell_plate.get_row_col_capacity()
+		self.cell_plate.set_row_labels([str(i + 1) for i in range(nrow)])
+		self.cell_plate.set_col_labels([str(i + 1) for i in range(ncol)])
 
 	@staticmethod
 	def _format_cell(gene, cate):
@@ -51,13 +52,19 @@ class LayoutViewDialog(QtWidgets.QDialog):
 
 
 ################################################################################
+# the plate is shown with cells of CELL_WIDTH pixels of its plate type, so that
+# plates of all types take the same space
 class PlateGUISampleMapper(PlateGUIModulePrototype):
+	CELL_WIDTH = {96: 48, 384: 24, 1536: 12}
+
 	def __init__(self, parent):
 		super(PlateGUISampleMapper, self).__init__(parent, _mid = 1,
 												geometry = (5, 183, 660, 492))
 		self._setup_widgets()
 		self._mapped_samples = []
-		self._mapped_cells = numpy.zeros((16, 24), dtype = bool)
+		# cells taken by samples, reallocated in the plate shape by reset
+		self._mapped_cells = numpy.zeros(
+			self.plate_viewer.get_row_col_capacity(), dtype = bool)
 
 	def _setup_widgets(self):
 		self.add_fc_prev_button()
@@ -77,25 +84,32 @@ class PlateGUISampleMapper(PlateGUIModulePrototype):
 		self.plate_viewer = PlateGUIPlateViewerInteractive(parent = self)
 		# geometry of this widget is dynamically adjusted based on the shown
 		# elements, in function 'self.update_cell_plate'
-		self.plate_viewer.set_row_labels([chr(65 + i) for i in range(16)])
-		self.plate_viewer.set_col_labels([str(i + 1) for i in range(24)])
+		nrow, ncol = self.plate_viewer.get_row_col_capacity()
+		self.plate_viewer.set_row_labels(well_row_labels(nrow))
+		self.plate_viewer.set_col_labels([str(i + 1) for i in range(ncol)])
 
 	def show_layout_viewer(self):
 		layout = self.parentWidget().get_basic_config("layout")
 		self.layout_viewer.launch(layout)
 
 	@staticmethod
-	def _format_cell(index, anchor, coords):
-		position = coords + anchor
+	def _format_sample_text(index):
 		fmt = "<font color='%s'>%d</font>"
-		return (position, fmt % (SampleSeriesPalette[index], index + 1))
+		return fmt % (SampleSeriesPalette[index], index + 1)
+
+	@classmethod
+	def _format_cell(cls, index, anchor, coords):
+		return (coords + anchor, cls._format_sample_text(index))
 
+	# all cells of a sample have the same text, the plate coords of all cells
+	# are made at once
 	def _format_current_mapped_cells(self):
 		layout = self.parentWidget().get_basic_config("layout")
 		contents = []
 		for i, anchor in enumerate(self._mapped_samples):
-			for coords in layout.all_coords():
-				contents.append(self._format_cell(i, anchor, coords))
+			text = self._format_sample_text(i)
+			positions = (layout.all_coords() + anchor).tolist()
+			contents.extend([(tuple(p), text) for p in positions])
 		return contents
 
 	def update_cell_plate(self, clear = False):
@@ -103,16 +117,12 @@ class PlateGUISampleMapper(PlateGUIModulePrototype):
 		if clear:
 			self.plate_viewer.clear_all_cells()
 		contents = self._format_current_mapped_cells()
-		if plate_type == 96:
-			self.plate_viewer.update_appearance(show_nrow = 8, show_ncol = 12,
-												cell_w = 48,
-												offset_x = 24, offset_y = 36,
-												contents = contents)
-		else:
-			self.plate_viewer.update_appearance(show_nrow = 16, show_ncol = 24,
-												cell_w = 24,
-												offset_x = 24, offset_y = 36,
-												contents = contents)
+		show_nrow, show_ncol = plate_type_to_shape(plate_type)
+		self.plate_viewer.update_appearance(show_nrow = show_nrow,
+											show_ncol = show_ncol,
+											cell_w = self.CELL_WIDTH[plate_type],
+											offset_x = 24, offset_y = 36,
+											contents = contents)
 
 	############################################################################
 	# these methods handle the sample mapping actions
@@ -120,8 +130,10 @@ class PlateGUISampleMapper(PlateGUIModulePrototype):
 	############################################################################
 	# reset the whole plate to no samples
 	def reset_mapper(self):
+		plate_type = self.parentWidget().get_basic_config("plate_type")
 		self._mapped_samples = []
-		self._mapped_cells.fill(0)
+		self._mapped_cells = numpy.zeros(plate_type_to_shape(plate_type),
+										dtype = bool)
 		self.update_cell_plate(clear = True)
 
 	############################################################################
@@ -132,15 +144,13 @@ class PlateGUISampleMapper(PlateGUIModulePrototype):
 	def _mark_cell_taken(self, r, c):
 		self._mapped_cells[r, c] = True
 
+	# all cells of the layout are checked and marked by one fancy-indexing
 	def _is_any_cell_taken(self, anchor, layout):
-		for coords in layout.all_coords():
-			(r, c) = coords + anchor
-			if self._is_cell_taken(r, c):
-				return True
+		rows, cols = (layout.all_coords() + anchor).T
+		if self._is_cell_taken(rows, cols).any():
+			return True
 		# assign taken now, after the check is done
-		for coords in layout.all_coords():
-			(r, c) = coords + anchor
-			self._mark_cell_taken(r, c)
+		self._mark_cell_taken(rows, cols)
 		return False
 
 	def _is_new_selection_placable(self, anchor, layout):
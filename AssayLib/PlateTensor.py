@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+import numpy
+from AssayLib.Exceptions import AsRuntimeError
+from AssayLib.EColiSample import EColiSample
+from AssayLib.LinRegress import batched_linregress
+from AssayLib.Log import Log
+
+
+################################################################################
+# PlateTensor object runs the EColiSample analysis for all samples of a plate
+# in one pass
+# since all samples share one layout, their data are stacked into
+# (sample, time, well) tensors, and blank correction, OD correction, P, I and
+# XELI are each a single broadcasted numpy operation across the whole plate
+# the e-line model is still fitted (and selected) per sample, on views into
+# the tensors
+# results are identical to running run_P_analysis and run_XELI_analysis on
+# each sample; each sample gets views of the plate tensors as its own data,
+# and the same result tables and log messages are written
+# the outputs of each stage are also memoized in the stage graph of each
+# sample, so that later uses of the stages (bootstrap, retune) do not run
+# them again
+# the log is ordered by stage rather than by sample
+class PlateTensor(object):
+	def __init__(self, samples, untreated):
+		super(PlateTensor, self).__init__()
+		self.samples = list(samples)
+		self._check_samples(self.samples)
+		if not any([i is untreated for i in self.samples]):
+			raise AsRuntimeError("cannot canculate I with no assign of untreated sample")
+		self.untreated_index = [i is untreated for i in self.samples].index(True)
+		first = self.samples[0]
+		self.layout = first.layout
+		self.raw_data = first.raw_data
+		self.log = first.log
+		self._OD = None
+		self._GFP = None
+		self._MASK = None
+		self._P = None
+		self._I = None
+		self._XELI = None
+
+	def __repr__(self):
+		return "<PlateTensor samples='%d'>" % len(self.samples)
+
+	############################################################################
+	# stacking requires all samples to be EColiSample, sharing the same layout,
+	# raw data and category names
+	@staticmethod
+	def _check_samples(samples):
+		if not samples:
+			raise AsRuntimeError("plate tensor analysis requires at least one sample")
+		first = samples[0]
+		for s in samples:
+			if not isinstance(s, EColiSample):
+				raise AsRuntimeError("plate tensor analysis only supports EColiSample")
+			if not ((s.layout is first.layout) and\
+				(s.raw_data is first.raw_data)):
+				raise AsRuntimeError("plate tensor analysis requires all samples to share layout and data")
+			if (s._blank, s._eline) != (first._blank, first._eline):
+				raise AsRuntimeError("plate tensor analysis requires all samples to share 'BLANK' and 'ELINE' categories")
+
+	def OD(self):
+		return self._OD
+
+	def GFP(self):
+		return self._GFP
+
+	def MASK(self):
+		return self._MASK
+
+	def P(self):
+		return self._P
+
+	def I(self):
+		return self._I
+
+	def XELI(self):
+		return self._XELI
+
+	############################################################################
+	# per-sample parameters as (sample, 1, 1) arrays, to broadcast with tensors
+	def _per_sample(self, getter):
+		return numpy.asarray([getter(s) for s in self.samples],
+							dtype = float).reshape(-1, 1, 1)
+
+	# log tables of a stage for each sample, and flush at the stage end
+	def _log_each(self, stage, tables_func, level = Log.TRACE):
+		for s in self.samples:
+			s.log_tables(stage, tables_func(s), level)
+		self.log.flush()
+
+	############################################################################
+	# gather all samples in one fancy-indexing into a (sample, time, well)
+	# tensor, made contiguous so that each sample view is contiguous as well
+	def _stack(self, dset, plate_coords):
+		data = self.raw_data.cells_data(dset, plate_coords[..., 0],
+										plate_coords[..., 1])
+		return numpy.ascontiguousarray(data.transpose(1, 0, 2))
+
+	def extract_data(self):
+		layout_coords = self.layout.all_coords()
+		plate_coords = numpy.stack([s.layout2plate_coords(layout_coords)
+									for s in self.samples])
+		self._OD = self._stack("OD", plate_coords)
+		self._GFP = self._stack("GFP", plate_coords)
+		self._MASK = self._stack("MASK", plate_coords)
+		for i, s in enumerate(self.samples):
+			s._OD, s._GFP, s._MASK = self._OD[i], self._GFP[i], self._MASK[i]
+			# OD and GFP tensors are corrected in place by the next stages
+			s.stages.prime("extract", dict(OD = self._OD[i].copy(),
+				GFP = self._GFP[i].copy(), MASK = self._MASK[i]))
+		self._log_each("DATA_EXTRACT", lambda s: s.OD_GFP_tables())
+
+	def _blank_correction(self):
+		where_blank = self.layout.mask_by_category(self.samples[0]._blank)
+		if not where_blank.any():
+			raise AsRuntimeError("background correction requires at least one 'BLANK' category in layout")
+		OD_blank = self._OD[:, :, where_blank].mean(axis = 2, keepdims = True)
+		numpy.subtract(self._OD, OD_blank, out = self._OD)
+		GFP_blank = self._GFP[:, :, where_blank].mean(axis = 2, keepdims = True)
+		numpy.subtract(self._GFP, GFP_blank, out = self._GFP,
+						casting = "unsafe")
+		for i, s in enumerate(self.samples):
+			s.stages.prime("blank", dict(OD = self._OD[i],
+										GFP = self._GFP[i].copy()))
+		self._log_each("BLANK_CORRECTION", lambda s: s.OD_GFP_tables())
+
+	############################################################################
+	# regressions of all e-line wells of all samples are done in one call
+	# the e-line model is still selected per sample, maybe interactively
+	def _eline_correction(self):
+		eline_where = self.samples[0].eline_mask()
+		OD_el = self._OD[:, :, eline_where]
+		GFP_el = self._GFP[:, :, eline_where]
+		MASK_el = self._MASK[:, :, eline_where]
+		all_regs = batched_linregress(OD_el, GFP_el, MASK_el)
+		for i, s in enumerate(self.samples):
+			selected = s.eline_corre.feed(OD_el[i], GFP_el[i], MASK_el[i],
+										all_regs = all_regs[i])
+			self.log.write(s._set_eline_model(*selected), Log.SUMMARY)
+			s.stages.prime("eline_regress", all_regs[i])
+			s.stages.prime("eline_model", dict(slope = s.model_slope,
+				inter = s.model_inter, inter_sd = s.model_inter_sd,
+				all_regs = s.eline_corre.all_regs,
+				slope_index = s.eline_corre.slope_index,
+				inter_index = s.eline_corre.inter_index))
+		self.log.flush()
+
+	def _OD_correction(self):
+		slope = self._per_sample(lambda s: s.model_slope)
+		inter = self._per_sample(lambda s: s.model_inter)
+		bg_GFP = self._OD * slope
+		bg_GFP += inter
+		numpy.subtract(self._GFP, bg_GFP, out = self._GFP, casting = "unsafe")
+		threshold = self._per_sample(lambda s: s._sd_factor * s.model_inter_sd)
+		numpy.copyto(self._GFP, numpy.broadcast_to(threshold, self._GFP.shape),
+					casting = "unsafe", where = (self._GFP < threshold))
+		for i, s in enumerate(self.samples):
+			s.stages.prime("OD_correction", self._GFP[i])
+		self._log_each("OD_CORRECTION", lambda s: [("GFP", s.GFP(), "%.2f")],
+			Log.DEBUG)
+
+	def _calculate_and_save_P(self):
+		with numpy.errstate(divide = "ignore"):
+			self._P = self._GFP / self._OD
+			self._P[self._P == numpy.inf] = numpy.nan
+		for i, s in enumerate(self.samples):
+			s._P = self._P[i]
+			s.stages.prime("P", self._P[i])
+			s._save_result_table("P", s._P)
+
+	def _calculate_and_save_I_and_XELI(self):
+		self._I = self._P / self._P[self.untreated_index]
+		I = self._I.copy()
+		I[I < 1] = (1 / I[I < 1])
+		self._XELI = I.sum(axis = 1, keepdims = True) / I.shape[1]
+		for i, s in enumerate(self.samples):
+			if i == self.untreated_index:
+				continue
+			s._I = self._I[i]
+			s._save_result_table("I", s._I)
+			s._XELI = self._XELI[i]
+			s._save_result_table("XELI", s._XELI)
+
+	############################################################################
+	# single call for the whole analysis, P and then I and XELI
+	def run_P_analysis(self):
+		self.extract_data()
+		self._blank_correction()
+		self._eline_correction()
+		self._OD_correction()
+		self._calculate_and_save_P()
+
+	def run(self):
+		self.run_P_analysis()
+		self._calculate_and_save_I_and_XELI()
+		return self
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.PlateTensor
+if __name__ == "__main__":
+	import tempfile
+	import unittest
+	from AssayLib.AssayPlate import AssayPlate
+
+	class test(unittest.TestCase):
+		def test_same_as_sample_mode(self):
+			results = {}
+			with tempfile.TemporaryDirectory() as tmp:
+				for mode in ["sample", "tensor"]:
+					assay = AssayPlate(mode, 96, outdir = tmp + "/",
+								layout = "./example/EColi.96.P2.layout",
+								data_file = "./example/plate_data.txt",
+								log_level = "summary")
+					for i in range(6):
+						assay.add_sample(EColiSample, name = "C%d" % (i + 1),
+										offset = (0, i), untreated = (i == 0),
+										eline_selector = "all",
+										eline_plot = "off")
+					assay.analyze(mode = mode)
+					results[mode] = ([s.P() for s in assay.samples],
+						[s.XELI() for s in assay.get_samples_except_untreated()])
+			for sample_mode, tensor_mode in zip(results["sample"],
+												results["tensor"]):
+				for a, b in zip(sample_mode, tensor_mode):
+					self.assertTrue(numpy.array_equal(a, b, equal_nan = True))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import struct
+import zipfile
+import numpy
+from AssayLib.Exceptions import AsRuntimeError, AsValueError
+from AssayLib.ArrayFormatting import write_table_with_genes
+
+
+################################################################################
+# results backends of AssayPlate
+#   tsv:  each sample writes <sample>.P.tsv, <sample>.I.tsv and
+#         <sample>.XELI.tsv (default), and <sample>.XELI_CI.tsv if
+#         bootstrapped
+#   npz:  all samples go into one <outdir>/results.npz
+#   hdf5: all samples go into one <outdir>/results.h5, requires h5py
+# in a store, each array is named <sample>/<field>, fields are
+#   P, I, XELI:         result tables, I and XELI not for the untreated sample
+#   XELI_CI:            bootstrap interval of XELI, if made
+#   genes, categories:  the layout vectors (the two header lines of the tsv's)
+#   offset:             sample offset on the plate
+#   and anything from sample.result_params(), e.g. the e-line regressions
+# run metadata (plate name, size, data file, sample order, untreated sample,
+# ...) is saved as json, in the '__meta__' member (npz) or root attribute
+# 'meta' (hdf5)
+RESULTS_BACKENDS = ("tsv", "npz", "hdf5")
+RESULTS_EXTENSIONS = {"npz": ".npz", "hdf5": ".h5"}
+RESULTS_VERSION = 1
+RESULT_TABLES = ("P", "I", "XELI", "XELI_CI")
+META_KEY = "__meta__"
+
+def check_results_backend(backend):
+	if not (backend in RESULTS_BACKENDS):
+		raise AsValueError("unknown results backend '%s', choose from: %s" %\
+			(str(backend), ", ".join(RESULTS_BACKENDS)))
+	return backend
+
+def _import_h5py():
+	try:
+		import h5py
+	except ImportError:
+		raise AsRuntimeError("the hdf5 results backend requires h5py")
+	return h5py
+
+
+################################################################################
+# PlateResultsStore object collects results of all samples of a plate in
+# memory, and writes them into one container file by save()
+# with compress, npz members are deflated and hdf5 datasets are chunked and
+# gzip'ed; uncompressed stores can be memory-mapped by PlateResults
+class PlateResultsStore(object):
+	def __init__(self, path, backend = "npz", compress = True, meta = None):
+		super(PlateResultsStore, self).__init__()
+		if check_results_backend(backend) == "tsv":
+			raise AsValueError("PlateResultsStore: 'tsv' is not a store backend")
+		if backend == "hdf5":
+			# fail before the analysis rather than when saving
+			_import_h5py()
+		self.path = path
+		self.backend = backend
+		self.compress = compress
+		self.meta = dict(meta or {})
+		self._samples = []
+		self._arrays = {}
+
+	def __repr__(self):
+		return "<PlateResultsStore path='%s' samples='%d'>" % (self.path,
+															len(self._samples))
+
+	def _add(self, sample_name, field, array):
+		if not (sample_name in self._samples):
+			self._samples.append(sample_name)
+		self._arrays["%s/%s" % (sample_name, field)] = numpy.asarray(array)
+
+	############################################################################
+	# called by samples in place of saving a tsv file
+	def add_table(self, sample, kind, array2d):
+		self._add(sample.name(), kind, array2d)
+
+	############################################################################
+	# everything else of a sample, called by AssayPlate after the analysis
+	def add_sample(self, sample):
+		self._add(sample.name(), "genes", sample.layout.all_genes())
+		self._add(sample.name(), "categories", sample.layout.all_categories())
+		self._add(sample.name(), "offset", sample.offset)
+		for field, value in sample.result_params().items():
+			self._add(sample.name(), field, value)
+
+	def save(self):
+		meta = dict(self.meta, version = RESULTS_VERSION,
+					samples = self._samples, created = time.time())
+		if self.backend == "npz":
+			self._save_npz(meta)
+		else:
+			self._save_hdf5(meta)
+		return self.path
+
+	def _save_npz(self, meta):
+		arrays = dict(self._arrays)
+		arrays[META_KEY] = numpy.array(json.dumps(meta))
+		with open(self.path, "wb") as fh:
+			if self.compress:
+				numpy.savez_compressed(fh, **arrays)
+			else:
+				numpy.savez(fh, **arrays)
+
+	def _save_hdf5(self, meta):
+		h5py = _import_h5py()
+		kw = dict(compression = "gzip", chunks = True) if self.compress else {}
+		with h5py.File(self.path, "w") as h5:
+			h5.attrs["meta"] = json.dumps(meta)
+			for key, arr in self._arrays.items():
+				if arr.dtype.kind == "U":
+					arr = numpy.char.encode(arr, "utf-8")
+				h5.create_dataset(key, data = arr,
+								**(kw if arr.ndim else {}))
+
+
+################################################################################
+# PlateResults object reads a store back
+# uncompressed members (npz stored members, contiguous hdf5 datasets) are
+# read-only memory maps, compressed npz members are decompressed on first
+# access, chunked hdf5 datasets are returned as h5py datasets
+class PlateResults(object):
+	def __init__(self, path):
+		super(PlateResults, self).__init__()
+		self.path = path
+		self._cache = {}
+		if path.endswith(RESULTS_EXTENSIONS["hdf5"]):
+			self.backend = "hdf5"
+			self._h5 = _import_h5py().File(path, "r")
+			self.meta = json.loads(self._h5.attrs["meta"])
+		else:
+			self.backend = "npz"
+			self._zip = zipfile.ZipFile(path, "r")
+			self._members = {i.filename[:-4]: i for i in self._zip.infolist()}
+			self.meta = json.loads(str(self._read_npz_member(META_KEY)))
+
+	def __repr__(self):
+		return "<PlateResults path='%s' samples='%d'>" % (self.path,
+														len(self.samples()))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		self._cache = {}
+		if self.backend == "hdf5":
+			self._h5.close()
+		else:
+			self._zip.close()
+
+	def samples(self):
+		return list(self.meta["samples"])
+
+	def untreated(self):
+		return self.meta.get("untreated")
+
+	def fields(self, sample):
+		prefix = sample + "/"
+		if self.backend == "hdf5":
+			return list(self._h5[sample].keys()) if sample in self._h5 else []
+		return [i[len(prefix):] for i in self._members if i.startswith(prefix)]
+
+	def has(self, sample, field):
+		return field in self.fields(sample)
+
+	############################################################################
+	# array of a field of a sample, e.g. get("C2", "XELI")
+	def get(self, sample, field):
+		key = "%s/%s" % (sample, field)
+		if not (key in self._cache):
+			if self.backend == "hdf5":
+				self._cache[key] = self._read_hdf5_member(key)
+			else:
+				if not (key in self._members):
+					raise AsValueError("no '%s' in results '%s'" % (key,
+																	self.path))
+				self._cache[key] = self._read_npz_member(key)
+		return self._cache[key]
+
+	def table(self, sample, kind):
+		return self.get(sample, kind)
+
+	def genes(self, sample):
+		return [str(i) for i in self.get(sample, "genes")]
+
+	def categories(self, sample):
+		return [str(i) for i in self.get(sample, "categories")]
+
+	############################################################################
+	# a stored (not deflated) npy member is memory-mapped at its offset in the
+	# zip file; the local file header is read to skip the name and extra fields
+	def _read_npz_member(self, key):
+		info = self._members[key]
+		if info.compress_type == zipfile.ZIP_STORED:
+			with open(self.path, "rb") as fh:
+				fh.seek(info.header_offset)
+				head = struct.unpack("<4s5HI2I2H", fh.read(30))
+				fh.seek(info.header_offset + 30 + head[-2] + head[-1])
+				version = numpy.lib.format.read_magic(fh)
+				if version == (1, 0):
+					header = numpy.lib.format.read_array_header_1_0(fh)
+				else:
+					header = numpy.lib.format.read_array_header_2_0(fh)
+				shape, fortran, dtype = header
+				offset = fh.tell()
+			if shape and not dtype.hasobject:
+				return numpy.memmap(self.path, dtype = dtype, mode = "r",
+									offset = offset, shape = shape,
+									order = "F" if fortran else "C")
+		with self._zip.open(info) as fh:
+			return numpy.lib.format.read_array(fh)
+
+	def _read_hdf5_member(self, key):
+		if not (key in self._h5):
+			raise AsValueError("no '%s' in results '%s'" % (key, self.path))
+		ds = self._h5[key]
+		if ds.dtype.kind == "S":
+			return numpy.char.decode(ds[()], "utf-8")
+		offset = ds.id.get_offset()
+		if (ds.chunks is None) and (offset is not None) and ds.shape:
+			return numpy.memmap(self.path, dtype = ds.dtype, mode = "r",
+								offset = offset, shape = ds.shape)
+		return ds
+
+	############################################################################
+	# write the same <sample>.<kind>.tsv files as the tsv backend
+	def export_tsv(self, outdir):
+		os.makedirs(outdir, exist_ok = True)
+		ret = []
+		for sample in self.samples():
+			for kind in RESULT_TABLES:
+				if not self.has(sample, kind):
+					continue
+				path = "%s/%s.%s.tsv" % (outdir, sample, kind)
+				write_table_with_genes(path, self.genes(sample),
+										self.categories(sample),
+										numpy.asarray(self.table(sample, kind)))
+				ret.append(path)
+		return ret
+
+def open_plate_results(path):
+	return PlateResults(path)
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.ResultsStore
+if __name__ == "__main__":
+	import filecmp
+	import tempfile
+	import unittest
+	from AssayLib.AssayPlate import AssayPlate
+	from AssayLib.EColiSample import EColiSample
+
+	class test(unittest.TestCase):
+		def setUp(self):
+			self.tmp = tempfile.TemporaryDirectory()
+
+		def tearDown(self):
+			self.tmp.cleanup()
+
+		def run_plate(self, backend):
+			assay = AssayPlate(backend, 96, outdir = self.tmp.name + "/",
+						results_backend = backend, results_compress = False,
+						layout = "./example/EColi.96.P2.layout",
+						data_file = "./example/plate_data.txt")
+			assay.add_sample(EColiSample, name = "S1", offset = (0, 0),
+							untreated = True, eline_selector = "all")
+			assay.add_sample(EColiSample, name = "S2", offset = (0, 1),
+							eline_selector = "all")
+			assay.analyze()
+			return assay
+
+		def test_npz_export(self):
+			tsv = self.run_plate("tsv").output_dir()
+			npz = self.run_plate("npz")
+			export = self.tmp.name + "/export"
+			with PlateResults(npz.results_path()) as res:
+				self.assertEqual(res.untreated(), "S1")
+				self.assertIsInstance(res.table("S2", "P"), numpy.memmap)
+				paths = res.export_tsv(export)
+			self.assertTrue(paths)
+			for path in paths:
+				name = os.path.basename(path)
+				self.assertTrue(filecmp.cmp(path, os.path.join(tsv, name),
+											shallow = False), name)
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
 
 import numpy
-from AssayLib.Exceptions import PrerequestError
+from AssayLib.Exceptions import PrerequestError, AsValueError
 from AssayLib.Layout import Layout
-from AssayLib.ArrayFormatting import vector2string, array2d2string
+from AssayLib.Log import Log
+from AssayLib.DataParser import _GrowingArray
+from AssayLib.StageGraph import StageGraph
+from AssayLib.ArrayFormatting import format_array2d, write_table_with_genes,\
+	append_table_rows
 
 
 ################################################################################
 # abstracted sample class prototype that inherited by other sample classes
 # this class defines some common API's, one method binding method and
 # several virtual functions that should be implemented by any derived classes
+# the analysis stages are also declared as a StageGraph (self.stages) by
+# _build_stages(), with raw data, layout, offset and the analysis parameters
+# as graph parameters; derived classes running their analysis by the graph
+# only recompute the stages downstream of a changed parameter
 class SamplePrototype(object):
 	def __init__(self, name, layout, log, assay_data, outdir, offset = (0, 0),
-				_id = None, **kw):
+				results = None, timer = None, _id = None, **kw):
 		super(SamplePrototype, self).__init__()
 		if (_id == None):
 			raise RuntimeError("use plate API to create sample rather than bare call this constructor")
+		self.stages = StageGraph()
+		self._build_stages(self.stages)
+		self.set_timer(timer)
 		self._set_id(_id)
 		self.set_name(name)
 		# if no layout assigned, use plate layout; if neither, raise error
@@ -24,11 +35,18 @@ class SamplePrototype(object):
 		self.log = log
 		self.raw_data = assay_data
 		self.set_output_dir(outdir)
+		# a PlateResultsStore, or None to save results as tsv files
+		self.results = results
 		self._OD = None
 		self._GFP = None
 		self._MASK = None
 		self._P = None
 		self._I = None
+		self._XELI = None
+		self._XELI_CI = None
+		# growing arrays and running sums of the incremental analysis
+		self._rows = None
+		self._I_sum = None
 
 	def __repr__(self):
 		return "<Sample name='%s' id=%d>" % (self.name(), self.id())
@@ -49,14 +67,96 @@ class SamplePrototype(object):
 	def output_dir(self):
 		return self.outdir
 
+	############################################################################
+	# raw data, layout and offset are also parameters of the stage graph
+	@property
+	def raw_data(self):
+		return self._raw_data
+
+	@raw_data.setter
+	def raw_data(self, data):
+		self._raw_data = data
+		self.stages.set_param("data", data)
+
+	@property
+	def layout(self):
+		return self._layout
+
+	@layout.setter
+	def layout(self, layout):
+		self._layout = layout
+		self.stages.set_param("layout", layout)
+
+	@property
+	def offset(self):
+		return self._offset
+
+	@offset.setter
+	def offset(self, offset):
+		self._offset = offset
+		self.stages.set_param("offset", None if offset is None else\
+			tuple([int(i) for i in offset]))
+
+	############################################################################
+	# change analysis parameters by their set_<name> methods, e.g.
+	# set_params(sd_factor = 3.0) calls set_sd_factor(3.0)
+	def set_params(self, **kw):
+		for name, value in kw.items():
+			setter = getattr(self, "set_" + name, None)
+			if setter is None:
+				raise AsValueError("%s: unknown parameter '%s'" % (self.name(),
+																name))
+			setter(value)
+
+	############################################################################
+	# stage graph, derived classes add their stages after these
+	#   extract: OD, GFP and MASK of the sample, see extract_data
+	def _build_stages(self, graph):
+		graph.add_stage("extract", SamplePrototype._stage_extract,
+						params = ("data", "layout", "offset"))
+
+	def _stage_extract(self, data, layout, offset):
+		self.extract_data()
+		return dict(OD = self._OD, GFP = self._GFP, MASK = self._MASK)
+
+	############################################################################
+	# a StageTimer recording the bound methods and the stage graph of this
+	# sample, or None for no timing
+	def set_timer(self, timer):
+		self.timer = timer
+		self.stages.timer = timer
+
 	def set_output_dir(self, outdir):
 		self.outdir = outdir
 
 	def save_table_with_genes(self, path, array2d):
-		with open(path, "w") as fh:
-			fh.write(vector2string(self.layout.all_genes(), "%s") + "\n")
-			fh.write(vector2string(self.layout.all_categories(), "%s") + "\n")
-			fh.write(array2d2string(array2d, "%2f") + "\n")
+		write_table_with_genes(path, self.layout.all_genes(),
+								self.layout.all_categories(), array2d)
+
+	# save a result table as <outdir>/<name>.<suffix>.tsv, or add it to the
+	# results store if there is one
+	def _save_result_table(self, suffix, array2d):
+		if not (self.results is None):
+			self.results.add_table(self, suffix, array2d)
+			return
+		self.save_table_with_genes(self._result_table_path(suffix), array2d)
+
+	# same as above for a table only grown by rows from 'start' on since it was
+	# saved, these rows are appended to the tsv; a results store keeps the
+	# whole table in memory, and is written by AssayPlate
+	def _append_result_rows(self, suffix, array2d, start):
+		if not (self.results is None):
+			self.results.add_table(self, suffix, array2d)
+			return
+		append_table_rows(self._result_table_path(suffix), array2d[start:])
+
+	def _result_table_path(self, suffix):
+		return "%s/%s.%s.tsv" % (self.output_dir(), self.name(), suffix)
+
+	# parameters of the analysis other than the result tables, kept by results
+	# stores, as a dict of arrays; derived classes add their own
+	def result_params(self):
+		return {}
 
 	############################################################################
 	# query functions for fetch data
@@ -87,42 +187,116 @@ class SamplePrototype(object):
 		return self._I
 
 	def XELI(self):
-		if (self.XELI is None):
+		if (self._XELI is None):
 			raise PrerequestError("prerequest not completed (XELI)")
-		return self.XELI
+		return self._XELI
+
+	# (2, well) lower and upper bounds, see AssayPlate.bootstrap
+	def XELI_CI(self):
+		if (self._XELI_CI is None):
+			raise PrerequestError("prerequest not completed (XELI_CI)")
+		return self._XELI_CI
 
 	############################################################################
 	# this method saves the P results, which is correcred GFP / OD
 	# P is an important intermediate result of each sample object
-	def _calculate_and_save_P(self):
+	def _calculate_P(self):
 		with numpy.errstate(divide = "ignore"):
-			self._P = self.GFP() / self.OD()
-			self._P[self._P == numpy.inf] = numpy.nan
-		self.save_table_with_genes("%s/%s.P.tsv" % (self.output_dir(),
-													self.name()),
-								self._P)
+			P = self.GFP() / self.OD()
+			P[P == numpy.inf] = numpy.nan
+		return P
+
+	def _calculate_and_save_P(self):
+		self._P = self._calculate_P()
+		self._save_result_table("P", self._P)
 
 	############################################################################
 	# calculate I, I is the division of sample P to the untreated P
 	# from this step on, no longer needs log, since everthing is reported
 	def _calculate_and_save_I(self, untreated_P):
 		self._I = self.P() / untreated_P
-		self.save_table_with_genes("%s/%s.I.tsv" % (self.output_dir(),
-													self.name()),
-													self._I)
+		self._save_result_table("I", self._I)
 
 	############################################################################
 	# calculated XELI
-	def _calculate_and_save_XELI(self):
-		I = self._I.copy()
+	# XELI is the mean of I folded to >= 1 (I < 1 replaced by 1 / I)
+	@staticmethod
+	def _fold_I(I):
+		I = I.copy()
 		I[I < 1] = (1 / I[I < 1])
-		self.XELI = I.sum(axis = 0, keepdims = True) / I.shape[0]
-		self.save_table_with_genes("%s/%s.XELI.tsv" % (self.output_dir(),
-														self.name()), self.XELI)
+		return I
+
+	def _calculate_and_save_XELI(self):
+		self._XELI = self._fold_I(self._I).sum(axis = 0, keepdims = True) /\
+			self._I.shape[0]
+		self._save_result_table("XELI", self._XELI)
+
 	def run_XELI_analysis(self, untreated_P):
 		self._calculate_and_save_I(untreated_P)
 		self._calculate_and_save_XELI()
 
+	# confidence interval of XELI, saved next to it as <name>.XELI_CI.tsv
+	def save_XELI_CI(self, ci):
+		self._XELI_CI = ci
+		self._save_result_table("XELI_CI", self._XELI_CI)
+
+	############################################################################
+	# incremental analysis, for raw data growing by new reads (time points)
+	# after a full analysis, start_incremental() keeps the per-read arrays in
+	# growing buffers, and the running sum of folded I's
+	# run_P_update (a bound entry, like run_P_analysis) then extracts and
+	# corrects only the new reads, with the e-line model etc. unchanged, and
+	# appends them by _append_and_save_P; run_XELI_update appends their I's
+	# and adds them to the running sums, XELI is updated in O(wells) per read
+	# only the new rows of P and I are appended to their tables, the XELI table
+	# of one row is written again
+	# the per-read sum is in the same order as the full sum, so results are
+	# the same as a full analysis with the same model
+	def start_incremental(self):
+		self._rows = {}
+		for name in ("OD", "GFP", "MASK", "P", "I"):
+			arr = getattr(self, "_" + name)
+			if not (arr is None):
+				self._rows[name] = _GrowingArray(arr.shape[1:], arr.dtype)
+				self._rows[name].extend(arr)
+		if not (self._I is None):
+			self._I_sum = self._fold_I(self._I).sum(axis = 0, keepdims = True)
+
+	def stop_incremental(self):
+		self._rows = None
+		self._I_sum = None
+
+	def is_incremental(self):
+		return not (self._rows is None)
+
+	def n_analyzed_reads(self):
+		if not self.is_incremental():
+			raise PrerequestError("prerequest not completed (start_incremental)")
+		return len(self._rows["P"])
+
+	def _append_and_save_P(self):
+		start = len(self._rows["P"])
+		P = self._calculate_P()
+		for name, arr in (("OD", self._OD), ("GFP", self._GFP),
+						("MASK", self._MASK), ("P", P)):
+			self._rows[name].extend(arr)
+		self._OD = self._rows["OD"].view()
+		self._GFP = self._rows["GFP"].view()
+		self._MASK = self._rows["MASK"].view()
+		self._P = self._rows["P"].view()
+		self._append_result_rows("P", self._P, start)
+
+	def run_XELI_update(self, untreated_P):
+		start = len(self._rows["I"])
+		I = self.P()[start:] / untreated_P[start:]
+		self._rows["I"].extend(I)
+		for row in self._fold_I(I):
+			self._I_sum += row
+		self._I = self._rows["I"].view()
+		self._XELI = self._I_sum / self._I.shape[0]
+		self._append_result_rows("I", self._I, start)
+		self._save_result_table("XELI", self._XELI)
+
 	############################################################################
 	# handle layout offset
 	def layout2plate_coords(self, layout_coords):
@@ -133,42 +307,72 @@ class SamplePrototype(object):
 	# used for log
 	def cat_OD_GFP_tables(self):
 		m = "OD:\n%s\nGFP:\n%s"
-		return m % (array2d2string(self.OD()),
-					array2d2string(self.GFP(), "%d"))
+		return m % (format_array2d(self.OD()),
+					format_array2d(self.GFP(), "%d"))
+
+	# same tables for Log.write_tables
+	def OD_GFP_tables(self):
+		return [("OD", self.OD(), "%.4f"), ("GFP", self.GFP(), "%d")]
+
+	# log message of an analysis stage, e.g. '>C1:BLANK_CORRECTION\n...\n'
+	def stage_header(self, stage):
+		return ">%s:%s" % (self.name(), stage)
+
+	def stage_message(self, stage, body):
+		return "%s\n%s\n" % (self.stage_header(stage), body)
+
+	# log tables of an analysis stage, formatted only if level is enabled
+	def log_tables(self, stage, tables, level = Log.TRACE):
+		self.log.write_tables(self.stage_header(stage), tables, level)
 
 	############################################################################
 	# called by extract_data for internal use
 	# take a set of coords and extract a set of cells defined by these coords
 	# MUST be plate coords, not layout local coords
-	# the result will be horizontally stacked into a single ndarray
-	def _extract_by_coords_set(self, dset, coords):
-		ex = [self.raw_data.cell_data(dset, c).reshape(-1, 1) for c in coords]
-		return numpy.hstack(ex).copy()
+	# the cells are gathered by a single fancy-indexing into a (time, cell)
+	# ndarray, which is a new array owned by this sample
+	def _extract_by_coords_set(self, dset, coords, start = 0):
+		coords = numpy.asarray(coords, dtype = int).reshape(-1, 2)
+		return self.raw_data.cells_data(dset, coords[:, 0], coords[:, 1],
+										start = start)
 
 	############################################################################
 	# extract data from raw data
-	# data is copied to make the original data intact
-	# extracted data will be saved as self._OD and self._GFP, both are ndarrays
+	# raw data is shared read-only among samples, the extracted self._OD and
+	# self._GFP are the only copies of the data, corrections are allowed to
+	# modify them in place
 	# self._MASK is a boolean ndarray, this is for internal use only to mask
 	# bad values only doing something like linear regression
-	def extract_data(self):
+	# only reads from 'start' on are extracted, used by the incremental update
+	def extract_data(self, start = 0):
 		layout_coords = self.layout.all_coords()
 		plate_coords = self.layout2plate_coords(layout_coords)
-		self._OD = self._extract_by_coords_set("OD", plate_coords)
-		self._GFP = self._extract_by_coords_set("GFP", plate_coords)
-		self._MASK = self._extract_by_coords_set("MASK", plate_coords)
-		m = ">%s:DATA_EXTRACT\n%s\n"
-		self.log.write(m % (self.name(), self.cat_OD_GFP_tables()))
+		self._OD = self._extract_by_coords_set("OD", plate_coords, start)
+		self._GFP = self._extract_by_coords_set("GFP", plate_coords, start)
+		self._MASK = self._extract_by_coords_set("MASK", plate_coords, start)
+		self.log_tables("DATA_EXTRACT", self.OD_GFP_tables())
 
 	############################################################################
 	# binds func to cls.entry method call
-	# all bound func is recommended (not required) to return a string for log
+	# all bound func is recommended (not required) to return a message for log,
+	# either a string (logged at Log.SUMMARY level) or a (level, message) tuple,
+	# message can be a callable only called if the level is enabled
+	# the log is flushed after each bound stage
+	# with a timer (see set_timer), each call is recorded as stage 'entry'
 	# equals cls.entry = func
 	@classmethod
 	def _bind_method(cls, entry, func):
 		def wrap(self):
-			message = func(self)
-			self.log.write(message)
+			if self.timer is None:
+				message = func(self)
+			else:
+				with self.timer.measure(self, entry):
+					message = func(self)
+			level = Log.SUMMARY
+			if isinstance(message, tuple):
+				level, message = message
+			self.log.write(message, level)
+			self.log.flush()
 		setattr(cls, entry, wrap)
 
 	############################################################################
@@ -191,11 +395,17 @@ class SamplePrototype(object):
 	def onRunPAnalysis(cls, func):
 		cls._bind_method("run_P_analysis", func)
 
+	# same as above but only on new reads, see start_incremental
+	@classmethod
+	def onRunPUpdate(cls, func):
+		cls._bind_method("run_P_update", func)
+
 def _not_implemented(self):
 	raise NotImplementedError("derived class must implement this method")
 SamplePrototype.onBlankCorrection(_not_implemented)
 SamplePrototype.onODCorrection(_not_implemented)
 SamplePrototype.onRunPAnalysis(_not_implemented)
+SamplePrototype.onRunPUpdate(_not_implemented)
 
 
 
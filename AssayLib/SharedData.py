@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import weakref
+import tempfile
+import numpy
+from AssayLib.Exceptions import AsRuntimeError
+from AssayLib.DataParser import _PlateData
+
+
+################################################################################
+# SharedPlateData object puts the arrays of a _PlateData into memory-mapped
+# .npy files, by default in /dev/shm (memory, not disk) if available
+#   <dir>/xeli_plate_XXXX/values.npy and mask.npy
+# data() is the _PlateData mapping these files; it is pickled as a small
+# PlateDataHandle, so samples, plates or the data itself sent to worker
+# processes (e.g. by multiprocessing or concurrent.futures) attach to the same
+# memory instead of getting a copy each; extraction of samples then gathers
+# directly from the mapped arrays
+# data loaded from a PlateDataCache is memory-mapped already and is shared
+# the same way without this object
+# the files are removed by close(), when the owner is done with the workers;
+# workers still holding the data keep their mappings valid; if not closed, the
+# files are removed when the object is garbage collected or at exit
+class SharedPlateData(object):
+	ARRAYS = ("values", "mask")
+	DEFAULT_DIR = "/dev/shm"
+
+	def __init__(self, data, dir = None):
+		super(SharedPlateData, self).__init__()
+		if dir is None and os.path.isdir(self.DEFAULT_DIR):
+			dir = self.DEFAULT_DIR
+		self.path = tempfile.mkdtemp(prefix = "xeli_plate_", dir = dir)
+		self._remove = weakref.finalize(self, shutil.rmtree, self.path, True)
+		try:
+			for name, arr in zip(self.ARRAYS, (data._values, data._mask)):
+				numpy.save(os.path.join(self.path, name + ".npy"), arr)
+			self._data = _PlateData(*[numpy.load(os.path.join(self.path,
+											name + ".npy"), mmap_mode = "r")
+										for name in self.ARRAYS],
+									channels = data.channels(),
+									dtypes = data.channel_dtypes(),
+									aliases = data.aliases())
+		except BaseException:
+			self._remove()
+			raise
+
+	def __repr__(self):
+		return "<SharedPlateData path='%s'>" % self.path
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def data(self):
+		if self._data is None:
+			raise AsRuntimeError("shared plate data '%s' is closed" % self.path)
+		return self._data
+
+	def handle(self):
+		return self.data().handle()
+
+	def close(self):
+		self._data = None
+		self._remove()
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.SharedData
+if __name__ == "__main__":
+	import gc
+	import pickle
+	import unittest
+	from AssayLib.DataParser import DataParser
+
+	class test(unittest.TestCase):
+		def setUp(self):
+			self.data = DataParser("./example/plate_data.txt", 96).parse()
+
+		def test_pickled_as_handle(self):
+			with SharedPlateData(self.data) as shared:
+				dumped = pickle.dumps(shared.data())
+				self.assertLess(len(dumped), 1024)
+				loaded = pickle.loads(dumped)
+				for dset in ["OD", "GFP", "MASK"]:
+					self.assertTrue(numpy.array_equal(loaded.dataset(dset),
+													self.data.dataset(dset)))
+			self.assertFalse(os.path.exists(shared.path))
+			with self.assertRaises(AsRuntimeError):
+				shared.data()
+
+		def test_removed_when_collected(self):
+			shared = SharedPlateData(self.data)
+			path = shared.path
+			self.assertTrue(os.path.isdir(path))
+			del shared
+			gc.collect()
+			self.assertFalse(os.path.exists(path))
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
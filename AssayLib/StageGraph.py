@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import numbers
+from collections import OrderedDict
+from AssayLib.Exceptions import AsRuntimeError, AsValueError
+
+
+################################################################################
+# StageGraph object runs analysis stages declared as a DAG, and memoizes the
+# output of each stage
+# a stage is a function func(owner, *inputs, **params), where inputs are the
+# outputs of its input stages and params are named parameters of the graph;
+# outputs are made read-only and must not be modified by later stages
+# the memo key of a stage is its parameter tokens together with the keys of
+# its input stages, so a change of a parameter invalidates exactly the stages
+# depending on it, directly or through their inputs
+# a parameter token is the repr of plain values (numbers, strings, tuples of
+# them), other objects (raw data, layouts, selectors) are compared by identity,
+# setting a different object gives a new token
+# each stage keeps the outputs of its last cache_size keys, so going back and
+# forth between a few parameter values (a sweep, or interactive re-tuning)
+# does not recompute either
+# with a timer (a StageTimer), each computed stage is recorded by its name,
+# with the owner as the sample; memoized stages are not recorded
+class StageGraph(object):
+	def __init__(self, cache_size = 4):
+		super(StageGraph, self).__init__()
+		self.cache_size = max(1, int(cache_size))
+		self._stages = OrderedDict()
+		self._params = {}
+		self._tokens = {}
+		self._n_objects = 0
+		self._memo = {}
+		self.hits = {}
+		self.misses = {}
+		self.timer = None
+
+	def __repr__(self):
+		return "<StageGraph stages='%s'>" % ",".join(self._stages)
+
+	def __contains__(self, name):
+		return name in self._stages
+
+	def stages(self):
+		return list(self._stages)
+
+	############################################################################
+	# inputs are names of stages already added, so the graph is acyclic
+	def add_stage(self, name, func, inputs = (), params = ()):
+		if name in self._stages:
+			raise AsValueError("stage '%s' already exists" % name)
+		for i in inputs:
+			if not (i in self._stages):
+				raise AsValueError("stage '%s': unknown input stage '%s'" %\
+					(name, i))
+		self._stages[name] = (func, tuple(inputs), tuple(params))
+		self._memo[name] = OrderedDict()
+		self.hits[name] = 0
+		self.misses[name] = 0
+		return self
+
+	############################################################################
+	# parameters
+	def set_param(self, name, value):
+		if (name in self._params) and (self._params[name] is value):
+			return
+		self._params[name] = value
+		self._tokens[name] = self._make_token(value)
+
+	def set_params(self, **kw):
+		for name, value in kw.items():
+			self.set_param(name, value)
+
+	def param(self, name):
+		if not (name in self._params):
+			raise AsRuntimeError("stage parameter '%s' is not set" % name)
+		return self._params[name]
+
+	def _make_token(self, value):
+		if self._is_plain(value):
+			return repr(value)
+		self._n_objects += 1
+		return "<%s #%d>" % (type(value).__name__, self._n_objects)
+
+	@classmethod
+	def _is_plain(cls, value):
+		if (value is None) or isinstance(value, (str, bytes, bool,
+												numbers.Number)):
+			return True
+		if isinstance(value, tuple):
+			return all([cls._is_plain(i) for i in value])
+		return False
+
+	############################################################################
+	# memo key of a stage, from its parameter tokens and input keys
+	def key(self, name, _keys = None):
+		_keys = {} if _keys is None else _keys
+		if not (name in _keys):
+			func, inputs, params = self._stages[name]
+			for p in params:
+				self.param(p)
+			_keys[name] = (name, tuple([self._tokens[p] for p in params]),
+							tuple([self.key(i, _keys) for i in inputs]))
+		return _keys[name]
+
+	############################################################################
+	# output of stage 'name', computing it and its inputs only if not memoized
+	def run(self, owner, name, _keys = None):
+		_keys = {} if _keys is None else _keys
+		if not (name in self._stages):
+			raise AsValueError("unknown stage '%s'" % name)
+		key = self.key(name, _keys)
+		memo = self._memo[name]
+		if key in memo:
+			memo.move_to_end(key)
+			self.hits[name] += 1
+			return memo[key]
+		func, inputs, params = self._stages[name]
+		args = [self.run(owner, i, _keys) for i in inputs]
+		kw = {p: self._params[p] for p in params}
+		if self.timer is None:
+			output = func(owner, *args, **kw)
+		else:
+			with self.timer.measure(owner, name):
+				output = func(owner, *args, **kw)
+		output = self._readonly(output)
+		self.misses[name] += 1
+		memo[key] = output
+		while len(memo) > self.cache_size:
+			memo.popitem(last = False)
+		return output
+
+	############################################################################
+	# memoize 'output' as the output of stage 'name' with the current
+	# parameters, as if computed by run(); for outputs computed elsewhere
+	# (e.g. by PlateTensor for the whole plate)
+	def prime(self, name, output):
+		if not (name in self._stages):
+			raise AsValueError("unknown stage '%s'" % name)
+		memo = self._memo[name]
+		memo[self.key(name)] = self._readonly(output)
+		while len(memo) > self.cache_size:
+			memo.popitem(last = False)
+		return output
+
+	def is_cached(self, name):
+		return self.key(name) in self._memo[name]
+
+	# drop the memoized output of stage 'name' with the current parameters
+	def forget(self, name):
+		self._memo[name].pop(self.key(name), None)
+
+	def clear(self):
+		for memo in self._memo.values():
+			memo.clear()
+
+	############################################################################
+	# arrays in an output (also in a tuple or dict of outputs) are made
+	# read-only in place
+	@classmethod
+	def _readonly(cls, output):
+		if isinstance(output, dict):
+			for i in output.values():
+				cls._readonly(i)
+		elif isinstance(output, (tuple, list)):
+			for i in output:
+				cls._readonly(i)
+		elif hasattr(output, "flags") and output.flags.writeable:
+			output.flags.writeable = False
+		return output
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.StageGraph
+if __name__ == "__main__":
+	import tempfile
+	import unittest
+
+	class test(unittest.TestCase):
+		def test_downstream_only(self):
+			graph = StageGraph()
+			graph.add_stage("a", lambda o, x: x * 2, params = ("x",))
+			graph.add_stage("b", lambda o, a, y: a + y, inputs = ("a",),
+							params = ("y",))
+			graph.set_params(x = 1, y = 1)
+			self.assertEqual(graph.run(None, "b"), 3)
+			graph.set_param("y", 2)
+			self.assertEqual(graph.run(None, "b"), 4)
+			self.assertEqual(graph.misses["a"], 1)
+			# going back to a recent value is memoized
+			graph.set_param("y", 1)
+			self.assertEqual(graph.run(None, "b"), 3)
+			self.assertEqual(graph.misses["b"], 2)
+
+		def test_sd_factor(self):
+			from AssayLib.AssayPlate import AssayPlate
+			from AssayLib.EColiSample import EColiSample
+			with tempfile.TemporaryDirectory() as tmp:
+				assay = AssayPlate("stages", 96, outdir = tmp + "/",
+							layout = "./example/EColi.96.P2.layout",
+							data_file = "./example/plate_data.txt",
+							log_level = "summary")
+				for i in range(2):
+					assay.add_sample(EColiSample, name = "C%d" % (i + 1),
+									offset = (0, i), untreated = (i == 0),
+									eline_selector = "all", eline_plot = "off")
+				assay.analyze()
+				sample = assay.samples[1]
+				before = dict(sample.stages.misses)
+				sample.set_params(sd_factor = 3.0)
+				assay.analyze()
+			recomputed = [name for name in sample.stages.stages()
+						if sample.stages.misses[name] > before[name]]
+			self.assertEqual(recomputed, ["OD_correction", "P"])
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
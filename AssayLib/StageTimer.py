@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+import io
+import time
+import cProfile
+import pstats
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from AssayLib.Exceptions import AsValueError
+
+
+################################################################################
+# tracemalloc is shared by all timers tracing memory and all TracemallocHook's:
+# each of them takes a reference by _start_tracing() and gives it back by
+# _stop_tracing(), tracemalloc is started by the first reference (if not
+# tracing already) and stopped when the last one is given back, but only if it
+# was started here
+_tracing_refs = 0
+_started_tracing = False
+
+def _start_tracing(frames = 1):
+	global _tracing_refs, _started_tracing
+	if not tracemalloc.is_tracing():
+		tracemalloc.start(frames)
+		_started_tracing = True
+	_tracing_refs += 1
+
+def _stop_tracing():
+	global _tracing_refs, _started_tracing
+	_tracing_refs -= 1
+	if (_tracing_refs == 0) and _started_tracing:
+		_started_tracing = False
+		tracemalloc.stop()
+
+
+################################################################################
+# StageTimer object records wall time, cpu (process) time and allocated bytes
+# of analysis stages, per sample and stage
+# stages are the methods bound by SamplePrototype._bind_method (e.g.
+# "_blank_correction", "run_P_analysis") and the stages of the stage graph of
+# the samples (e.g. "blank", "eline_regress"); stages run inside other stages
+# are timed in both, so times of nested stages do not add up
+# allocated bytes are only recorded with memory = True, which starts
+# tracemalloc (slowing down all allocations) and are the peak of the memory
+# traced during the stage above the traced memory at its start; otherwise 0
+# hooks (see ProfileHook and TracemallocHook) are started and stopped around
+# the stages they are attached to
+# close() removes all hooks and gives back the tracing of the timer, so that
+# allocations are not slowed down once no timer or hook needs tracemalloc
+# a plate without timing has no StageTimer at all, so a disabled timer costs
+# one attribute test per stage
+class StageTimer(object):
+	FIELDS = ("calls", "wall", "cpu", "alloc")
+
+	def __init__(self, memory = False):
+		super(StageTimer, self).__init__()
+		self.memory = memory
+		self._records = OrderedDict()
+		self._hooks = []
+		# [traced memory at start, peak so far] of the running stages
+		self._mem_stack = []
+		# whether this timer holds a reference to tracing
+		self._tracing = bool(memory)
+		if self._tracing:
+			_start_tracing()
+
+	def __repr__(self):
+		return "<StageTimer records='%d' memory='%s'>" % (len(self._records),
+														str(self.memory))
+
+	############################################################################
+	# attach a hook to the named stages, or to all stages if stages is None
+	def add_hook(self, hook, stages = None):
+		if isinstance(stages, str):
+			stages = [stages]
+		self._hooks.append((hook, None if stages is None else set(stages)))
+		return hook
+
+	# the hook is closed
+	def remove_hook(self, hook):
+		self._hooks = [i for i in self._hooks if not (i[0] is hook)]
+		hook.close()
+
+	def close(self):
+		for hook, stages in list(self._hooks):
+			self.remove_hook(hook)
+		if self._tracing:
+			self._tracing = False
+			_stop_tracing()
+
+	############################################################################
+	# context of a stage of a sample
+	@contextmanager
+	def measure(self, sample, stage):
+		hooks = [h for h, s in self._hooks if (s is None) or (stage in s)]
+		for h in hooks:
+			h.start(sample, stage)
+		if self.memory:
+			self._mem_enter()
+		cpu0 = time.process_time()
+		wall0 = time.perf_counter()
+		try:
+			yield
+		finally:
+			wall = time.perf_counter() - wall0
+			cpu = time.process_time() - cpu0
+			alloc = self._mem_exit() if self.memory else 0
+			for h in reversed(hooks):
+				h.stop(sample, stage)
+			self._add(sample.name(), stage, wall, cpu, alloc)
+
+	def _add(self, sample, stage, wall, cpu, alloc):
+		rec = self._records.get((sample, stage))
+		if rec is None:
+			rec = self._records[sample, stage] = [0, 0.0, 0.0, 0]
+		rec[0] += 1
+		rec[1] += wall
+		rec[2] += cpu
+		rec[3] = max(rec[3], alloc)
+
+	# tracemalloc only has one peak, it is reset for each stage and the peak
+	# of a nested stage is passed on to the stages running it
+	def _mem_enter(self):
+		current, peak = tracemalloc.get_traced_memory()
+		if self._mem_stack:
+			self._mem_stack[-1][1] = max(self._mem_stack[-1][1], peak)
+		tracemalloc.reset_peak()
+		self._mem_stack.append([current, current])
+
+	def _mem_exit(self):
+		peak = tracemalloc.get_traced_memory()[1]
+		start, stack_peak = self._mem_stack.pop()
+		peak = max(peak, stack_peak)
+		if self._mem_stack:
+			self._mem_stack[-1][1] = max(self._mem_stack[-1][1], peak)
+		tracemalloc.reset_peak()
+		return peak - start
+
+	############################################################################
+	# records as {(sample, stage): {calls, wall, cpu, alloc}}, in the order
+	# the stages first ran; alloc is the largest of all calls
+	def records(self):
+		return OrderedDict([(k, dict(zip(self.FIELDS, v)))
+							for k, v in self._records.items()])
+
+	def reset(self):
+		self._records.clear()
+
+	############################################################################
+	# tab-delimited table of all records, one line per sample and stage,
+	# times in seconds; with by_stage, records of all samples are summed up
+	# per stage (alloc is still the largest)
+	def report(self, by_stage = False):
+		records = self._records
+		if by_stage:
+			records = OrderedDict()
+			for (sample, stage), v in self._records.items():
+				rec = records.setdefault(("*", stage), [0, 0.0, 0.0, 0])
+				rec[0] += v[0]
+				rec[1] += v[1]
+				rec[2] += v[2]
+				rec[3] = max(rec[3], v[3])
+		lines = ["sample\tstage\tcalls\twall\tcpu\talloc_bytes"]
+		for (sample, stage), (calls, wall, cpu, alloc) in records.items():
+			lines.append("%s\t%s\t%d\t%.6f\t%.6f\t%d" % (sample, stage, calls,
+														wall, cpu, alloc))
+		return "\n".join(lines) + "\n"
+
+
+################################################################################
+# hook profiling the stages it is attached to by cProfile, all calls of all
+# samples go to one profile; stats() returns it as a pstats.Stats object
+# a stage run inside another profiled stage is profiled by the outer one
+class ProfileHook(object):
+	def __init__(self):
+		super(ProfileHook, self).__init__()
+		self.profile = cProfile.Profile()
+		self._depth = 0
+
+	def __repr__(self):
+		return "<ProfileHook>"
+
+	def start(self, sample, stage):
+		if not self._depth:
+			self.profile.enable()
+		self._depth += 1
+
+	def stop(self, sample, stage):
+		self._depth -= 1
+		if not self._depth:
+			self.profile.disable()
+
+	def stats(self, sort = "cumulative"):
+		return pstats.Stats(self.profile).sort_stats(sort)
+
+	# the first 'n' lines of the stats as text
+	def report(self, n = 20, sort = "cumulative"):
+		stream = io.StringIO()
+		pstats.Stats(self.profile, stream = stream).sort_stats(sort).\
+			print_stats(n)
+		return stream.getvalue()
+
+	def dump(self, file):
+		self.profile.dump_stats(file)
+
+	def close(self):
+		if self._depth:
+			self._depth = 0
+			self.profile.disable()
+
+
+################################################################################
+# hook taking tracemalloc snapshots before and after each stage it is attached
+# to, the differences of each (sample, stage) are kept in 'diffs', as lists
+# of tracemalloc.StatisticDiff, grouped by key_type ("lineno", "filename" or
+# "traceback"); tracemalloc is started with 'frames' frames if not tracing,
+# the hook holds a reference to it until close() (called when the hook is
+# removed)
+class TracemallocHook(object):
+	KEY_TYPES = ("lineno", "filename", "traceback")
+
+	def __init__(self, key_type = "lineno", frames = 1):
+		super(TracemallocHook, self).__init__()
+		if not (key_type in self.KEY_TYPES):
+			raise AsValueError("unknown tracemalloc key type '%s', choose from: %s" %\
+				(str(key_type), ", ".join(self.KEY_TYPES)))
+		self.key_type = key_type
+		# whether this hook holds a reference to tracing
+		self._tracing = True
+		_start_tracing(frames)
+		self.diffs = OrderedDict()
+		self._snapshots = []
+
+	def __repr__(self):
+		return "<TracemallocHook key_type='%s'>" % self.key_type
+
+	def start(self, sample, stage):
+		self._snapshots.append(tracemalloc.take_snapshot())
+
+	def stop(self, sample, stage):
+		before = self._snapshots.pop()
+		diff = tracemalloc.take_snapshot().compare_to(before, self.key_type)
+		self.diffs.setdefault((sample.name(), stage), []).append(diff)
+
+	# the first 'n' differences of the last call of a stage of a sample
+	def top(self, sample, stage, n = 10):
+		return self.diffs[sample, stage][-1][:n]
+
+	def close(self):
+		self._snapshots = []
+		if self._tracing:
+			self._tracing = False
+			_stop_tracing()
+
+
+
+
+
+################################################################################
+# test
+################################################################################
+# run from the repository root: python3 -m AssayLib.StageTimer
+if __name__ == "__main__":
+	import unittest
+
+	class _Sample(object):
+		def name(self):
+			return "S1"
+
+	class test(unittest.TestCase):
+		def test_nested(self):
+			timer = StageTimer(memory = True)
+			with timer.measure(_Sample(), "outer"):
+				with timer.measure(_Sample(), "inner"):
+					a = bytearray(1 << 20)
+				del a
+			timer.close()
+			rec = timer.records()
+			self.assertEqual(list(rec.keys()), [("S1", "inner"), ("S1", "outer")])
+			self.assertTrue(rec["S1", "outer"]["alloc"] >= 1 << 20)
+			self.assertTrue(rec["S1", "inner"]["alloc"] >= 1 << 20)
+
+		def test_shared_tracing(self):
+			timer1 = StageTimer(memory = True)
+			timer2 = StageTimer(memory = True)
+			hook = timer2.add_hook(TracemallocHook(), "stage")
+			timer1.close()
+			self.assertTrue(tracemalloc.is_tracing())
+			with timer2.measure(_Sample(), "stage"):
+				a = bytearray(1 << 20)
+			self.assertTrue(timer2.records()["S1", "stage"]["alloc"] >= 1 << 20)
+			timer2.remove_hook(hook)
+			self.assertTrue(tracemalloc.is_tracing())
+			timer2.close()
+			self.assertFalse(tracemalloc.is_tracing())
+
+	suite = unittest.TestLoader().loadTestsFromTestCase(test)
+	unittest.TextTestRunner(verbosity = 2).run(suite)
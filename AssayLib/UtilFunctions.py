@@ -3,10 +3,25 @@
 
 ################################################################################
 # this module only defines functions
+################################################################################
+# (rows, cols) of the supported plate types
+PLATE_SHAPES = {96: (8, 12), 384: (16, 24), 1536: (32, 48)}
+
+# the plate type is the number of wells, as a number or its string (e.g. 96
+# or "96"), nothing else is converted
 def plate_type_to_shape(plate_type):
-	if ((plate_type == 96) or (plate_type == "96")):
-		return 8, 12
-	elif ((plate_type == 384) or (plate_type == "384")):
-		return 16, 24
-	else:
-		raise ValueError("bad plate size '%s'" % str(plate_type))
+	for size, shape in PLATE_SHAPES.items():
+		if (plate_type == size) or (plate_type == str(size)):
+			return shape
+	raise ValueError("bad plate size '%s'" % str(plate_type))
+
+################################################################################
+# well row labels as printed on plates: A to Z, then AA, AB, ... (1536-well
+# plates have rows A to AF)
+def well_row_label(row):
+	if row < 26:
+		return chr(65 + row)
+	return chr(64 + row // 26) + chr(65 + row % 26)
+
+def well_row_labels(nrow):
+	return [well_row_label(i) for i in range(nrow)]
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+################################################################################
+# command-line batch runner, analyzes many plates without the PlateGUI wizard
+#
+# plates are either listed in a tab-delimited manifest:
+#   ./XELIBatch.py -m manifest.tsv -o ./output/ -p 4
+# or taken from all reader exports in a directory, sharing layout and samples:
+#   ./XELIBatch.py -d ./exports/ -l ./example/EColi.96.P2.layout \
+#       --offsets "0,0;0,1;0,2;0,3;0,4;0,5" --untreated 0 -p 4
+# layouts can also be named from a layout collection, compiled once:
+#   ./XELIBatch.py -d ./exports/ -c ./collections/EColi96 -l EColi.96.P2 ...
+#
+# see AssayLib/BatchRunner.py for the manifest format
+
+import sys
+import argparse
+from AssayLib.Exceptions import AsRuntimeError
+from AssayLib.DataCache import PlateDataCache
+from AssayLib.LayoutRegistry import get_layout_registry
+from AssayLib.ELineSelector import ELINE_SELECTORS
+from AssayLib.ELinePlot import PLOT_POLICIES
+from AssayLib.ResultsStore import RESULTS_BACKENDS
+from AssayLib.Bootstrap import BOOTSTRAP_RESAMPLE
+from AssayLib.BatchRunner import BatchRunner, read_manifest,\
+	jobs_from_directory, parse_offsets
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description = "run XELI analysis on a batch of plates")
+	src = ap.add_mutually_exclusive_group(required = True)
+	src.add_argument("-m", "--manifest", type = str, metavar = "tsv",
+		help = "tab-delimited manifest, one plate per line")
+	src.add_argument("-d", "--data-dir", type = str, metavar = "dir",
+		help = "analyze all reader exports in this directory")
+	ap.add_argument("-g", "--glob", type = str, default = "*.txt",
+		metavar = "pattern",
+		help = "file pattern used with --data-dir (default: *.txt)")
+	ap.add_argument("-l", "--layout", type = str, metavar = "file",
+		help = "layout file used with --data-dir")
+	ap.add_argument("-c", "--collection", type = str, metavar = "dir",
+		help = "layout collection, e.g. ./collections/EColi96; layouts named as one in it (e.g. EColi.96.P3) are compiled once and shared")
+	ap.add_argument("-t", "--plate-type", type = int, default = 96,
+		help = "plate type used with --data-dir (default: 96)")
+	ap.add_argument("--offsets", type = str, metavar = "r,c;r,c;...",
+		help = "sample offsets used with --data-dir")
+	ap.add_argument("--untreated", type = int, default = 0, metavar = "int",
+		help = "index of the untreated sample in --offsets (default: 0)")
+	ap.add_argument("--plates", type = str, metavar = "'*'|label;label;...",
+		help = "plates of multi-plate exports used with --data-dir, '*' for all or labels, e.g. 'Plate 1;Plate 2'; each is analyzed as <file>.<label>")
+	ap.add_argument("-o", "--outdir", type = str, default = "./output/",
+		metavar = "dir", help = "output directory (default: ./output/)")
+	ap.add_argument("-p", "--processes", type = int, default = 1,
+		metavar = "int", help = "number of worker processes (default: 1)")
+	ap.add_argument("-f", "--overwrite", action = "store_true",
+		help = "overwrite existing plate output directories")
+	ap.add_argument("--parser", type = str, default = "default",
+		choices = ["default", "vectorized", "streaming"],
+		help = "DataParser parse engine (default: default)")
+	ap.add_argument("--mode", type = str, default = "sample",
+		choices = ["sample", "tensor"],
+		help = "analyze sample by sample, or all samples of a plate at once (default: sample)")
+	ap.add_argument("--cache-dir", type = str, metavar = "dir",
+		help = "keep parsed plate data in this directory to skip reparsing")
+	ap.add_argument("--cache-size", type = int, default = 1024, metavar = "MB",
+		help = "size limit of --cache-dir (default: 1024)")
+	ap.add_argument("--sd-factor", type = float, default = 2.0,
+		metavar = "float", help = "sd_factor of EColiSample (default: 2.0)")
+	ap.add_argument("-e", "--eline-selector", type = str, default = "all",
+		choices = sorted(ELINE_SELECTORS),
+		help = "how e-line regressions are selected, 'gui' is interactive (default: all)")
+	ap.add_argument("--eline-plot", type = str, default = "deferred",
+		choices = PLOT_POLICIES,
+		help = "when e-line plots are drawn, forced to 'eager' with the 'gui' selector (default: deferred)")
+	ap.add_argument("--plot-processes", type = int, default = 1,
+		metavar = "int", help = "number of processes rendering deferred e-line plots of a plate, only used with -p 1 (default: 1)")
+	ap.add_argument("--log-level", type = str, default = "summary",
+		choices = ["summary", "debug", "trace"],
+		help = "detail of plate logs, 'trace' logs all intermediate tables (default: summary)")
+	ap.add_argument("--log-arrays", action = "store_true",
+		help = "save logged tables as binary arrays in log.arrays instead of text")
+	ap.add_argument("--results", type = str, default = "tsv",
+		choices = RESULTS_BACKENDS,
+		help = "save results as tsv files, or in one npz/hdf5 store per plate (default: tsv)")
+	ap.add_argument("--results-uncompressed", action = "store_true",
+		help = "do not compress results stores, so that they can be memory-mapped")
+	ap.add_argument("-b", "--bootstrap", type = int, default = 0,
+		metavar = "int",
+		help = "number of bootstrap replicates for XELI confidence intervals, saved as <sample>.XELI_CI.tsv; 0 for none (default: 0)")
+	ap.add_argument("--bootstrap-seed", type = int, default = 0,
+		metavar = "int", help = "seed of the bootstrap resampling (default: 0)")
+	ap.add_argument("--bootstrap-resample", type = str, default = "both",
+		choices = BOOTSTRAP_RESAMPLE,
+		help = "resample time points, e-line regressions or both (default: both)")
+	ap.add_argument("--bootstrap-processes", type = int, default = 1,
+		metavar = "int", help = "number of processes evaluating bootstrap replicates of a plate, only used with -p 1 (default: 1)")
+	ap.add_argument("-r", "--report", type = str, metavar = "tsv",
+		help = "also save per-plate wall time into this file")
+	args = ap.parse_args()
+	if args.data_dir and not (args.layout and args.offsets):
+		ap.error("--data-dir requires --layout and --offsets")
+	return args
+
+
+def print_result(result):
+	line = "%s\t%s\t%.3f s" % (result.name, result.status(), result.wall_time)
+	if not result.ok():
+		line += "\t" + result.error
+	print(line, flush = True)
+
+
+def main():
+	args = get_args()
+	try:
+		if args.manifest:
+			jobs = read_manifest(args.manifest)
+		else:
+			jobs = jobs_from_directory(args.data_dir, args.plate_type,
+										args.layout,
+										parse_offsets(args.offsets),
+										untreated = args.untreated,
+										pattern = args.glob,
+										plates = args.plates)
+	except AsRuntimeError as err:
+		sys.exit("error: %s" % str(err))
+
+	plate_kw = dict(parse_func = args.parser, analysis_mode = args.mode,
+					log_level = args.log_level, log_arrays = args.log_arrays,
+					results_backend = args.results,
+					results_compress = not args.results_uncompressed)
+	# worker processes of the batch pool cannot start plot pools of their own
+	if args.processes == 1:
+		plate_kw["plot_processes"] = args.plot_processes
+	if args.collection:
+		# refresh once here, worker processes then find the index up to date
+		try:
+			get_layout_registry(args.collection)
+		except AsRuntimeError as err:
+			sys.exit("error: %s" % str(err))
+		plate_kw["layout_collection"] = args.collection
+	if args.cache_dir:
+		plate_kw["data_cache"] = PlateDataCache(args.cache_dir,
+											max_bytes = args.cache_size << 20)
+
+	bootstrap_kw = None
+	if args.bootstrap > 0:
+		bootstrap_kw = dict(n_replicates = args.bootstrap,
+							seed = args.bootstrap_seed,
+							resample = args.bootstrap_resample)
+		if args.processes == 1:
+			bootstrap_kw["processes"] = args.bootstrap_processes
+
+	runner = BatchRunner(jobs, outdir = args.outdir,
+						processes = args.processes,
+						overwrite = args.overwrite,
+						plate_kw = plate_kw,
+						bootstrap_kw = bootstrap_kw,
+						sd_factor = args.sd_factor,
+						eline_selector = args.eline_selector,
+						eline_plot = args.eline_plot)
+	runner.run(report = print_result)
+	print(runner.summary())
+	if args.report:
+		runner.save_report(args.report)
+	return 1 if runner.failed() else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
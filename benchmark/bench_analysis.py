@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+################################################################################
+# per-plate latency of AssayPlate.analyze, sample by sample vs. whole-plate
+# tensor mode, on a synthetic plate tiled with samples
+# the e-line model uses all ELINE wells without plotting, so that only the
+# numeric analysis and the result output are measured
+# run from the repository root:
+#   python3 -m benchmark.bench_analysis [-t 384] [-r 100,300] [-n 5] [-l trace]
+
+import os
+import time
+import argparse
+import tempfile
+import numpy
+from AssayLib.AssayPlate import AssayPlate
+from AssayLib.EColiSample import EColiSample
+from benchmark.synthetic import random_plate, write_synergy_export,\
+	tiled_layout, tile_offsets
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = str, default = "100,300",
+		help = "comma-separated read counts (default: 100,300)")
+	ap.add_argument("-n", "--repeat", type = int, default = 5)
+	ap.add_argument("-l", "--log-level", type = str, default = "trace",
+		choices = ["summary", "debug", "trace"])
+	return ap.parse_args()
+
+
+def run_plate(tmp, data_file, layout_file, plate_type, mode, log_level):
+	assay = AssayPlate("plate_" + mode, plate_type, analysis_mode = mode,
+						log_level = log_level,
+						outdir = os.path.join(tmp, ""), overwrite = True,
+						layout = layout_file, data_file = data_file)
+	offsets = tile_offsets(assay.data().plate_shape(), assay.plate_layout())
+	for i, offset in enumerate(offsets):
+		assay.add_sample(EColiSample, name = "C%d" % (i + 1),
+						offset = offset, untreated = (i == 0),
+						eline_selector = "all", eline_plot = "off")
+	t0 = time.perf_counter()
+	assay.analyze()
+	return time.perf_counter() - t0, assay
+
+
+def main():
+	args = get_args()
+	modes = ["sample", "tensor"]
+	print("wells\treads\tsamples\t%s\tspeedup" % "\t".join(modes))
+	with tempfile.TemporaryDirectory() as tmp:
+		layout_file = tiled_layout(tmp)
+		for n_reads in [int(i) for i in args.reads.split(",")]:
+			data_file = os.path.join(tmp, "plate_%d.txt" % n_reads)
+			OD, GFP = random_plate(args.plate_type, n_reads)
+			write_synergy_export(data_file, OD, GFP)
+			times, plates = [], []
+			for mode in modes:
+				t = [run_plate(tmp, data_file, layout_file, args.plate_type,
+								mode, args.log_level) for i in range(args.repeat)]
+				times.append(min([i[0] for i in t]))
+				plates.append(t[-1][1])
+			for a, b in zip(*[p.get_samples_except_untreated() for p in plates]):
+				assert numpy.array_equal(a.XELI(), b.XELI(), equal_nan = True)
+			print("%d\t%d\t%d\t%s\t%.2fx" % (args.plate_type, n_reads,
+				len(plates[0].samples), "\t".join(["%.4f" % i for i in times]),
+				times[0] / times[1]))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+################################################################################
+# throughput of XELI bootstrap replicates (AssayPlate.bootstrap) by chunk size
+# and number of processes, on a synthetic plate tiled with samples
+# intervals of all settings are checked to be the same, as they only depend
+# on the seed
+# run from the repository root:
+#   python3 -m benchmark.bench_bootstrap [-t 384] [-r 100] [-b 2000]
+#       [-c 1,16,64,256] [-p 1,2,4]
+
+import os
+import time
+import argparse
+import tempfile
+import numpy
+from AssayLib.AssayPlate import AssayPlate
+from AssayLib.EColiSample import EColiSample
+from benchmark.synthetic import random_plate, write_synergy_export,\
+	tiled_layout, tile_offsets
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = int, default = 100)
+	ap.add_argument("-b", "--replicates", type = int, default = 2000)
+	ap.add_argument("-c", "--chunk-sizes", type = str, default = "1,16,64,256")
+	ap.add_argument("-p", "--processes", type = str, default = "1,2,4")
+	return ap.parse_args()
+
+
+def main():
+	args = get_args()
+	print("wells\treads\treplicates\tchunk\tprocesses\ttime\treplicates/s")
+	with tempfile.TemporaryDirectory() as tmp:
+		layout_file = tiled_layout(tmp, n_eline = 6)
+		data_file = os.path.join(tmp, "plate.txt")
+		OD, GFP = random_plate(args.plate_type, args.reads)
+		write_synergy_export(data_file, OD, GFP)
+		assay = AssayPlate("plate", args.plate_type, log_level = "summary",
+							outdir = os.path.join(tmp, ""), overwrite = True,
+							layout = layout_file, data_file = data_file)
+		offsets = tile_offsets(assay.data().plate_shape(), assay.plate_layout())
+		for i, offset in enumerate(offsets):
+			assay.add_sample(EColiSample, name = "C%d" % (i + 1),
+							offset = offset, untreated = (i == 0),
+							eline_selector = "all", eline_plot = "off")
+		assay.analyze()
+		first = None
+		for processes in [int(i) for i in args.processes.split(",")]:
+			for chunk in [int(i) for i in args.chunk_sizes.split(",")]:
+				t0 = time.perf_counter()
+				ci = assay.bootstrap(args.replicates, seed = 1,
+									chunk_size = chunk, processes = processes)
+				t = time.perf_counter() - t0
+				if first is None:
+					first = ci
+				for k in ci:
+					assert numpy.array_equal(ci[k], first[k], equal_nan = True)
+				print("%d\t%d\t%d\t%d\t%d\t%.3f\t%.0f" % (args.plate_type,
+					args.reads, args.replicates, chunk, processes, t,
+					args.replicates / t))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+################################################################################
+# peak memory and time of building _PlateData and extracting all samples of a
+# plate, before (copy + per-well hstack) and after (shared read-only raw data +
+# single fancy-index gather) the zero-copy extraction
+# run from the repository root:
+#   python3 -m benchmark.bench_extract [-t 384] [-r 1000]
+
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy
+from AssayLib.DataParser import _PlateData
+from AssayLib.Layout import Layout
+from benchmark.synthetic import random_plate, tiled_layout, tile_offsets
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = int, default = 1000)
+	return ap.parse_args()
+
+
+################################################################################
+# the extraction before: every array copied into _PlateData, every well
+# reshaped into a column, hstack'ed and copied again
+def extract_before(OD, GFP, MASK, coords_list):
+	raw = [numpy.copy(OD), numpy.copy(GFP), numpy.copy(MASK)]
+	ret = []
+	for coords in coords_list:
+		for arr in raw:
+			ex = [arr[:, r, c].reshape(-1, 1) for r, c in coords]
+			ret.append(numpy.hstack(ex).copy())
+	return ret
+
+def extract_after(OD, GFP, MASK, coords_list):
+	data = _PlateData.from_OD_GFP(OD, GFP, MASK)
+	ret = []
+	for coords in coords_list:
+		for dset in ("OD", "GFP", "MASK"):
+			ret.append(data.cells_data(dset, coords[:, 0], coords[:, 1]))
+	return ret
+
+
+def measure(func, *args):
+	tracemalloc.start()
+	tracemalloc.reset_peak()
+	t0 = time.perf_counter()
+	ret = func(*args)
+	t = time.perf_counter() - t0
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return t, peak, ret
+
+
+def main():
+	args = get_args()
+	OD, GFP = random_plate(args.plate_type, args.reads)
+	MASK = (GFP != 100000)
+	with tempfile.TemporaryDirectory() as tmp:
+		layout = Layout(tiled_layout(tmp))
+	offsets = tile_offsets(OD.shape[1:], layout)
+	coords_list = [layout.all_coords() + i for i in offsets]
+	raw_mb = (OD.nbytes + GFP.nbytes + MASK.nbytes) / 1e6
+
+	print("wells: %d, reads: %d, samples: %d, raw data: %.1f MB" %\
+		(OD.shape[1] * OD.shape[2], args.reads, len(coords_list), raw_mb))
+	print("method\ttime (s)\tpeak (MB)")
+	results = []
+	for name, func in (("before", extract_before), ("after", extract_after)):
+		# inputs are copied outside of the measurement, _PlateData of "after"
+		# sets them read-only
+		t, peak, ret = measure(func, OD.copy(), GFP.copy(), MASK.copy(),
+								coords_list)
+		results.append(ret)
+		print("%s\t%.4f\t%.1f" % (name, t, peak / 1e6))
+	for a, b in zip(*results):
+		assert numpy.array_equal(a, b)
+
+
+if __name__ == "__main__":
+	main()
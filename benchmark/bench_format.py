@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+################################################################################
+# formatting of result and log tables, array2d2string (one '%' per cell) vs.
+# write_array2d (one '%' per chunk of rows, streamed to the file handle)
+# tables are (time, well) like the OD/GFP log tables of a 384-well sample, and
+# (1, well) like a XELI result
+# run from the repository root:
+#   python3 -m benchmark.bench_format [-w 384] [-r 1,100,600] [-n 5]
+
+import io
+import time
+import argparse
+import numpy
+from AssayLib.ArrayFormatting import array2d2string, write_array2d
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-w", "--wells", type = int, default = 384)
+	ap.add_argument("-r", "--rows", type = str, default = "1,100,600",
+		help = "comma-separated table rows (default: 1,100,600)")
+	ap.add_argument("-n", "--repeat", type = int, default = 5)
+	return ap.parse_args()
+
+
+def best_time(func, repeat):
+	best = None
+	for i in range(repeat):
+		t0 = time.perf_counter()
+		ret = func()
+		t = time.perf_counter() - t0
+		best = t if best is None else min(best, t)
+	return best, ret
+
+
+def by_string(A, fmt):
+	fh = io.StringIO()
+	fh.write(array2d2string(A, fmt) + "\n")
+	return fh.getvalue()
+
+def by_writer(A, fmt):
+	fh = io.StringIO()
+	write_array2d(fh, A, fmt)
+	return fh.getvalue()
+
+
+def main():
+	args = get_args()
+	rng = numpy.random.default_rng(0)
+	print("rows\twells\tfmt\tarray2d2string\twrite_array2d\tspeedup")
+	for nrow in [int(i) for i in args.rows.split(",")]:
+		tables = [(rng.random((nrow, args.wells)) * 2, "%2f"),
+				(rng.random((nrow, args.wells)) * 2, "%.4f"),
+				(rng.integers(0, 100000, (nrow, args.wells)), "%d")]
+		for A, fmt in tables:
+			t_old, ref = best_time(lambda: by_string(A, fmt), args.repeat)
+			t_new, out = best_time(lambda: by_writer(A, fmt), args.repeat)
+			assert out == ref
+			print("%d\t%d\t%s\t%.4f\t%.4f\t%.2fx" % (nrow, args.wells, fmt,
+				t_old, t_new, t_old / t_new))
+
+
+if __name__ == "__main__":
+	main()
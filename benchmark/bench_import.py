@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+################################################################################
+# import time of the numeric core modules, each in a fresh interpreter, and a
+# check that none of them pulls in Qt or matplotlib
+# GUI and plotting are only imported when first used (interactive e-line
+# selection, e-line plot rendering), so batch workers need neither a display
+# nor their startup time
+# exits with 1 if any forbidden module is loaded
+# run from the repository root:
+#   python3 -m benchmark.bench_import [-n 5]
+
+import sys
+import json
+import argparse
+import subprocess
+
+
+CORE_MODULES = ["AssayLib.DataParser", "AssayLib.Layout",
+				"AssayLib.SamplePrototype", "AssayLib.EColiSample",
+				"AssayLib.AssayPlate", "AssayLib.BatchRunner"]
+FORBIDDEN = ["PyQt5", "matplotlib", "matplotlib.pyplot"]
+
+_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import %s
+t = time.perf_counter() - t0
+print(json.dumps([t, [i for i in %r if i in sys.modules]]))
+"""
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", "--repeat", type = int, default = 5)
+	return ap.parse_args()
+
+
+def probe(module):
+	out = subprocess.run([sys.executable, "-c", _PROBE % (module, FORBIDDEN)],
+						check = True, stdout = subprocess.PIPE,
+						universal_newlines = True).stdout
+	return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+	args = get_args()
+	failed = False
+	print("module\tbest_ms\tforbidden")
+	for module in CORE_MODULES:
+		runs = [probe(module) for i in range(args.repeat)]
+		loaded = runs[-1][1]
+		failed = failed or bool(loaded)
+		print("%s\t%.1f\t%s" % (module, min([i[0] for i in runs]) * 1000,
+			",".join(loaded) or "-"))
+	return 1 if failed else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+################################################################################
+# Layout lookups, substring search over the whole field (search_categories,
+# search_genes, the matching used before the index) vs. exact match through
+# the index (mask_by_category, mask_by_gene)
+# each round looks up BLANK, ELINE and every gene once, as a plate of samples
+# sharing the layout would, repeated for 'plates' plates
+# run from the repository root:
+#   python3 -m benchmark.bench_layout [-r 32] [-c 48] [-p 100]
+
+import time
+import argparse
+import tempfile
+from AssayLib.Layout import Layout
+from benchmark.synthetic import tiled_layout
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-r", "--rows", type = int, default = 32,
+		help = "layout rows (default: 32)")
+	ap.add_argument("-c", "--cols", type = int, default = 48,
+		help = "layout columns (default: 48)")
+	ap.add_argument("-p", "--plates", type = int, default = 100)
+	return ap.parse_args()
+
+
+def lookup_all(layout, genes, by_cate, by_gene, plates):
+	t0 = time.perf_counter()
+	for i in range(plates):
+		masks = [by_cate("BLANK"), by_cate("ELINE")]
+		masks.extend([by_gene(g) for g in genes])
+	return time.perf_counter() - t0, masks
+
+
+def main():
+	args = get_args()
+	with tempfile.TemporaryDirectory() as tmp:
+		layout = Layout(tiled_layout(tmp, args.rows, args.cols))
+	genes = sorted(set(layout.all_genes().tolist()))
+	t_old, old = lookup_all(layout, genes, layout.search_categories,
+							layout.search_genes, args.plates)
+	t_new, new = lookup_all(layout, genes, layout.mask_by_category,
+							layout.mask_by_gene, args.plates)
+	# exact matches are always a subset of substring matches, the rest are
+	# genes like g1_1 also matching g1_10, g1_11, ...
+	assert all([(a[b]).all() for a, b in zip(old, new)])
+	wrong = sum([int(a.sum() != b.sum()) for a, b in zip(old, new)])
+	print("wells\tlookups\tsearch\tindex\tspeedup\tsubstring_mismatches")
+	print("%d\t%d\t%.4f\t%.4f\t%.1fx\t%d" % (len(layout.all_coords()),
+		args.plates * (len(genes) + 2), t_old, t_new, t_old / t_new, wrong))
+
+
+if __name__ == "__main__":
+	main()
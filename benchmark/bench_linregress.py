@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+################################################################################
+# e-line regressions, scipy.stats.linregress per well vs. batched_linregress
+# over all wells of all samples (and plates) in one call
+# run from the repository root:
+#   python3 -m benchmark.bench_linregress [-p 10] [-s 8] [-e 4] [-r 300]
+
+import time
+import argparse
+import numpy
+from scipy import stats
+from AssayLib.LinRegress import batched_linregress
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-p", "--plates", type = int, default = 10)
+	ap.add_argument("-s", "--samples", type = int, default = 8)
+	ap.add_argument("-e", "--elines", type = int, default = 4)
+	ap.add_argument("-r", "--reads", type = int, default = 300)
+	return ap.parse_args()
+
+
+def loop_linregress(OD, GFP, MASK):
+	shape = OD.shape[:-2] + OD.shape[-1:] + (5,)
+	OD = OD.reshape((-1,) + OD.shape[-2:])
+	GFP = GFP.reshape((-1,) + GFP.shape[-2:])
+	MASK = MASK.reshape((-1,) + MASK.shape[-2:])
+	ret = [[tuple(stats.linregress(od[m], gfp[m]))
+			for od, gfp, m in zip(o.T, g.T, k.T)]
+			for o, g, k in zip(OD, GFP, MASK)]
+	return numpy.asarray(ret, dtype = float).reshape(shape)
+
+
+def main():
+	args = get_args()
+	rng = numpy.random.default_rng(0)
+	shape = (args.plates, args.samples, args.reads, args.elines)
+	OD = rng.uniform(0.3, 0.6, shape)
+	GFP = 9000 + 3000 * OD + rng.normal(0, 50, shape)
+	MASK = rng.random(shape) > 0.01
+
+	times = []
+	for func in (loop_linregress, batched_linregress):
+		t0 = time.perf_counter()
+		regs = func(OD, GFP, MASK)
+		times.append(time.perf_counter() - t0)
+		if func is loop_linregress:
+			ref = regs
+	assert numpy.allclose(ref, regs, rtol = 1e-8, equal_nan = True)
+	print("regressions\tloop (s)\tbatched (s)\tspeedup")
+	print("%d\t%.4f\t%.4f\t%.1fx" % (OD.size // args.reads, times[0], times[1],
+									times[0] / times[1]))
+
+
+if __name__ == "__main__":
+	main()
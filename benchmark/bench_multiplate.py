@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+################################################################################
+# DataParser.parse_plates on a synthetic multi-plate export, vs. the same
+# plates split into one export each and parsed one by one (vectorized engine)
+# reported are the time to scan the export (no plate converted yet), to get
+# the first plate, and to get all plates; plates are checked to be the same
+# run from the repository root:
+#   python3 -m benchmark.bench_multiplate [-t 384] [-r 100] [-p 2,8,32] [-n 5]
+
+import os
+import time
+import argparse
+import tempfile
+import numpy
+from AssayLib.DataParser import DataParser
+from benchmark.synthetic import random_plate, write_synergy_export,\
+	write_multi_plate_export
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = int, default = 100)
+	ap.add_argument("-p", "--plates", type = str, default = "2,8,32",
+		help = "comma-separated numbers of plates (default: 2,8,32)")
+	ap.add_argument("-n", "--repeat", type = int, default = 5)
+	return ap.parse_args()
+
+
+def best_time(func, repeat):
+	best = None
+	for i in range(repeat):
+		t0 = time.perf_counter()
+		ret = func()
+		t = time.perf_counter() - t0
+		best = t if (best is None) else min(best, t)
+	return best, ret
+
+
+def main():
+	args = get_args()
+	print("wells\treads\tplates\tscan\tfirst\tall\tsplit_files\tspeedup")
+	with tempfile.TemporaryDirectory() as tmp:
+		for n_plates in [int(i) for i in args.plates.split(",")]:
+			plates = [random_plate(args.plate_type, args.reads, seed = i)
+					for i in range(n_plates)]
+			multi = os.path.join(tmp, "multi_%d.txt" % n_plates)
+			write_multi_plate_export(multi, plates)
+			singles = []
+			for i, (OD, GFP) in enumerate(plates):
+				singles.append(os.path.join(tmp, "single_%d.txt" % i))
+				write_synergy_export(singles[-1], OD, GFP)
+
+			parser = DataParser(multi, args.plate_type)
+			t_scan, seq = best_time(parser.parse_plates, args.repeat)
+			t_first, first = best_time(lambda: parser.parse_plates()[0],
+										args.repeat)
+			t_all, seq = best_time(lambda: list(parser.parse_plates()),
+									args.repeat)
+			t_split, split = best_time(lambda: [DataParser(f, args.plate_type,
+				parse_func = "vectorized").parse() for f in singles],
+				args.repeat)
+			for a, b in zip(seq, split):
+				for dset in ("OD", "GFP", "MASK"):
+					assert numpy.array_equal(a.dataset(dset), b.dataset(dset))
+			print("%d\t%d\t%d\t%.4f\t%.4f\t%.4f\t%.4f\t%.2fx" % (args.plate_type,
+				args.reads, n_plates, t_scan, t_first, t_all, t_split,
+				t_split / t_all))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+################################################################################
+# compare the DataParser parse engines on synthetic 384-well kinetic exports
+# run from the repository root:
+#   python3 -m benchmark.bench_parser [-r 100,300,600] [-n 5]
+
+import os
+import time
+import argparse
+import tempfile
+import numpy
+from AssayLib.DataParser import DataParser
+from benchmark.synthetic import random_plate, write_synergy_export
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = str, default = "100,300,600",
+		help = "comma-separated read counts (default: 100,300,600)")
+	ap.add_argument("-n", "--repeat", type = int, default = 5)
+	ap.add_argument("--overflow-rate", type = float, default = 0.01)
+	return ap.parse_args()
+
+
+def best_time(func, repeat):
+	best = None
+	for i in range(repeat):
+		t0 = time.perf_counter()
+		ret = func()
+		t = time.perf_counter() - t0
+		best = t if (best is None) else min(best, t)
+	return best, ret
+
+
+def main():
+	args = get_args()
+	engines = sorted(DataParser.parse_engines)
+	print("wells\treads\t%s\tspeedup" % "\t".join(engines))
+	with tempfile.TemporaryDirectory() as tmp:
+		for n_reads in [int(i) for i in args.reads.split(",")]:
+			path = os.path.join(tmp, "plate_%d.txt" % n_reads)
+			OD, GFP = random_plate(args.plate_type, n_reads)
+			write_synergy_export(path, OD, GFP, args.overflow_rate)
+			times, parsed = [], []
+			for engine in engines:
+				parser = DataParser(path, args.plate_type, parse_func = engine)
+				t, data = best_time(parser.parse, args.repeat)
+				times.append(t)
+				parsed.append(data)
+			ref = parsed[0]
+			for data in parsed[1:]:
+				assert numpy.array_equal(ref._values, data._values)
+				assert numpy.array_equal(ref._mask, data._mask)
+				assert ref.channels() == data.channels()
+				assert ref.channel_dtypes() == data.channel_dtypes()
+			print("%d\t%d\t%s\t%.2fx" % (args.plate_type, n_reads,
+				"\t".join(["%.4f" % i for i in times]),
+				times[engines.index("default")] / times[engines.index("vectorized")]))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+################################################################################
+# latency of AssayPlate.retune after changing one parameter, vs. a fresh
+# plate (parse and analyze) with the same parameter, on a synthetic plate tiled
+# with samples; the retuned results are checked against the fresh ones
+# both include writing the result tables
+# sd_factor only reruns the GFP threshold and P (then I and XELI),
+# eline_selector also reruns the e-line model selection and background
+# run from the repository root:
+#   python3 -m benchmark.bench_retune [-t 384] [-r 300] [-n 5]
+
+import os
+import time
+import argparse
+import tempfile
+import numpy
+from AssayLib.AssayPlate import AssayPlate
+from AssayLib.EColiSample import EColiSample
+from benchmark.synthetic import random_plate, write_synergy_export,\
+	tiled_layout, tile_offsets
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = int, default = 300)
+	ap.add_argument("-n", "--repeat", type = int, default = 5)
+	return ap.parse_args()
+
+
+def new_plate(tmp, data_file, layout_file, plate_type, **kw):
+	assay = AssayPlate("plate", plate_type, log_level = "summary",
+						outdir = os.path.join(tmp, ""), overwrite = True,
+						layout = layout_file, data_file = data_file)
+	offsets = tile_offsets(assay.data().plate_shape(), assay.plate_layout())
+	for i, offset in enumerate(offsets):
+		assay.add_sample(EColiSample, name = "C%d" % (i + 1),
+						offset = offset, untreated = (i == 0),
+						eline_plot = "off", **kw)
+	return assay
+
+
+def timed(func, *args, **kw):
+	t0 = time.perf_counter()
+	ret = func(*args, **kw)
+	return time.perf_counter() - t0, ret
+
+
+def main():
+	args = get_args()
+	params = [("sd_factor", [3.0, 2.0]), ("eline_selector", ["mad", "all"])]
+	print("wells\treads\tparameter\tfresh\tretune\tspeedup")
+	with tempfile.TemporaryDirectory() as tmp:
+		layout_file = tiled_layout(tmp)
+		data_file = os.path.join(tmp, "plate.txt")
+		OD, GFP = random_plate(args.plate_type, args.reads)
+		write_synergy_export(data_file, OD, GFP)
+		assay = new_plate(tmp, data_file, layout_file, args.plate_type,
+						eline_selector = "all")
+		assay.analyze()
+		for name, values in params:
+			fresh, retune = [], []
+			for i in range(args.repeat):
+				for value in values:
+					retune.append(timed(assay.retune, **{name: value})[0])
+					t, plate = timed(new_plate, tmp, data_file, layout_file,
+						args.plate_type, **dict({"eline_selector": "all"},
+												**{name: value}))
+					fresh.append(t + timed(plate.analyze)[0])
+					for a, b in zip(assay.get_samples_except_untreated(),
+									plate.get_samples_except_untreated()):
+						assert numpy.array_equal(a.XELI(), b.XELI(),
+												equal_nan = True)
+			print("%d\t%d\t%s\t%.4f\t%.4f\t%.2fx" % (args.plate_type,
+				args.reads, name, min(fresh), min(retune),
+				min(fresh) / min(retune)))
+
+
+if __name__ == "__main__":
+	main()
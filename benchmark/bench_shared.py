@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+################################################################################
+# sending plate data to a process pool: pickled copies vs. SharedPlateData
+# handles, on a synthetic plate
+# each task gets the plate data and extracts the cells of one sample from it,
+# as SamplePrototype.extract_data does; reported are the pickled size of the
+# data and the wall time of all tasks, results are checked to be the same
+# run from the repository root:
+#   python3 -m benchmark.bench_shared [-t 384] [-r 300] [-s 64] [-p 2]
+
+import time
+import pickle
+import argparse
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+from AssayLib.DataParser import _PlateData
+from AssayLib.SharedData import SharedPlateData
+from benchmark.synthetic import random_plate
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = int, default = 300)
+	ap.add_argument("-s", "--samples", type = int, default = 64)
+	ap.add_argument("-p", "--processes", type = int, default = 2)
+	return ap.parse_args()
+
+
+def extract_sum(args):
+	data, rows, cols = args
+	return float(data.cells_data("OD", rows, cols).sum() +\
+		data.cells_data("GFP", rows, cols).sum())
+
+
+def run(data, tasks, processes):
+	t0 = time.perf_counter()
+	with ProcessPoolExecutor(max_workers = processes) as pool:
+		ret = list(pool.map(extract_sum, [(data, r, c) for r, c in tasks]))
+	return time.perf_counter() - t0, ret
+
+
+def main():
+	args = get_args()
+	OD, GFP = random_plate(args.plate_type, args.reads)
+	data = _PlateData.from_OD_GFP(OD, GFP, numpy.ones(OD.shape, dtype = bool))
+	nr, nc = OD.shape[1:]
+	rng = numpy.random.default_rng(0)
+	tasks = [(rng.integers(0, nr, 96), rng.integers(0, nc, 96))
+			for i in range(args.samples)]
+	print("data\tpickled_bytes\ttime")
+	t, expected = run(data, tasks, args.processes)
+	print("copy\t%d\t%.3f" % (len(pickle.dumps(data)), t))
+	with SharedPlateData(data) as shared:
+		t, ret = run(shared.data(), tasks, args.processes)
+		print("shared\t%d\t%.3f" % (len(pickle.dumps(shared.data())), t))
+	assert ret == expected
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+################################################################################
+# end-of-run parse latency, parsing the complete export after the run
+# (vectorized engine) vs. following it with StreamingDataParser while it is
+# written, where only the lines appended since the previous poll are left to
+# parse when the run ends
+# the export is written in 'steps' appends, one poll after each
+# run from the repository root:
+#   python3 -m benchmark.bench_streaming [-t 384] [-r 600] [-s 24]
+
+import os
+import time
+import argparse
+import tempfile
+import numpy
+from AssayLib.DataParser import DataParser, StreamingDataParser
+from benchmark.synthetic import random_plate, write_synergy_export
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = int, default = 600)
+	ap.add_argument("-s", "--steps", type = int, default = 24,
+		help = "number of appends the export is written in (default: 24)")
+	return ap.parse_args()
+
+
+def main():
+	args = get_args()
+	with tempfile.TemporaryDirectory() as tmp:
+		full = os.path.join(tmp, "full.txt")
+		OD, GFP = random_plate(args.plate_type, args.reads)
+		write_synergy_export(full, OD, GFP, overflow_rate = 0.01)
+		t0 = time.perf_counter()
+		ref = DataParser(full, args.plate_type, parse_func = "vectorized").parse()
+		t_full = time.perf_counter() - t0
+
+		with open(full, "rb") as fh:
+			raw = fh.read()
+		growing = os.path.join(tmp, "growing.txt")
+		open(growing, "wb").close()
+		parser = StreamingDataParser(growing, args.plate_type)
+		bounds = numpy.linspace(0, len(raw), args.steps + 1).astype(int)
+		poll_times = []
+		for start, end in zip(bounds[:-1], bounds[1:]):
+			with open(growing, "ab") as fh:
+				fh.write(raw[start:end])
+			t0 = time.perf_counter()
+			parser.poll()
+			poll_times.append(time.perf_counter() - t0)
+		data = parser.data()
+		for dset in ["OD", "GFP", "MASK"]:
+			assert numpy.array_equal(data.dataset(dset), ref.dataset(dset))
+
+	print("wells\treads\tsteps\tfull_parse\tlast_poll\tall_polls\tbuffer_rows")
+	print("%d\t%d\t%d\t%.4f\t%.4f\t%.4f\t%d" % (args.plate_type, args.reads,
+		args.steps, t_full, poll_times[-1], sum(poll_times),
+		parser._reads.capacity()))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+################################################################################
+# benchmark suite of the whole pipeline on synthetic plates with known XELI
+# (see synthetic.synthetic_assay), for each plate type and read count:
+#   generate:          synthetic data and writing the reader export
+#   parse_<engine>:    DataParser.parse with each parse engine, no cache
+#   eline_regress:     batched regression of the e-line wells of all samples
+#   analyze_<mode>:    AssayPlate.analyze in each mode, including the tsv
+#                      result tables (the plate and its samples are set up
+#                      before timing); the wall time of each sample stage
+#                      of one more run is kept as stage_wall (sample mode)
+#   results_store:     adding all samples to an npz results store and saving
+# each stage is timed 'repeat' times, the best is kept; peak memory is the
+# tracemalloc peak of one more, traced run (not timed, as tracing slows down
+# allocations); throughput is in well-reads per second
+# the XELI error of each analysis mode against the true XELI is reported too
+# results are written as JSON to -o; with -c, times are compared to an older
+# JSON file of the same suite, and the exit status is 1 if any stage is slower
+# by more than the tolerance
+# run from the repository root:
+#   python3 -m benchmark.bench_suite [-t 96,384,1536] [-r 25,100,300] [-n 3]
+#       [-o bench_suite.json] [-c old.json] [--tolerance 0.2]
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import datetime
+import subprocess
+import tracemalloc
+import numpy
+from AssayLib.AssayPlate import AssayPlate
+from AssayLib.EColiSample import EColiSample
+from AssayLib.DataParser import DataParser
+from AssayLib.ELineCorre import ELineCorre
+from AssayLib.ResultsStore import PlateResultsStore
+from AssayLib.UtilFunctions import plate_type_to_shape
+from benchmark.synthetic import synthetic_assay,\
+	write_synergy_export, tiled_layout, tile_categories, tile_grid
+
+
+TILE = (8, 6)
+N_ELINE = 4
+MODES = ("sample", "tensor")
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-types", type = str, default = "96,384,1536",
+		help = "comma-separated plate types (default: 96,384,1536)")
+	ap.add_argument("-r", "--reads", type = str, default = "25,100,300",
+		help = "comma-separated read counts (default: 25,100,300)")
+	ap.add_argument("-n", "--repeat", type = int, default = 3)
+	ap.add_argument("--overflow-rate", type = float, default = 0.0)
+	ap.add_argument("-o", "--output", type = str, default = "bench_suite.json",
+		help = "JSON output file (default: bench_suite.json)")
+	ap.add_argument("-c", "--compare", type = str, default = None,
+		metavar = "json", help = "compare with an older output of the suite")
+	ap.add_argument("--tolerance", type = float, default = 0.2,
+		help = "relative slowdown reported as regression (default: 0.2)")
+	return ap.parse_args()
+
+
+################################################################################
+# best time of 'repeat' runs of func(setup()), and peak memory of one more
+def measure(func, repeat, setup = None):
+	times = []
+	for i in range(repeat):
+		arg = setup() if setup else None
+		t0 = time.perf_counter()
+		func(arg)
+		times.append(time.perf_counter() - t0)
+	arg = setup() if setup else None
+	tracemalloc.start()
+	try:
+		func(arg)
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	return dict(time = min(times), times = times, peak_bytes = peak)
+
+
+def git_commit():
+	try:
+		return subprocess.run(["git", "rev-parse", "HEAD"],
+			cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+			stdout = subprocess.PIPE, stderr = subprocess.DEVNULL,
+			check = True, universal_newlines = True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def new_plate(tmp, data_file, layout_file, plate_type, **kw):
+	assay = AssayPlate("plate", plate_type, log_level = "summary",
+						outdir = os.path.join(tmp, ""), overwrite = True,
+						layout = layout_file, data_file = data_file,
+						parse_func = "vectorized", **kw)
+	offsets = tile_grid(assay.data().plate_shape(), TILE)
+	for i, offset in enumerate(offsets):
+		assay.add_sample(EColiSample, name = "C%d" % (i + 1),
+						offset = offset, untreated = (i == 0),
+						eline_selector = "all", eline_plot = "off")
+	return assay
+
+
+# mean and max relative XELI error of the genes of all treated samples
+def xeli_error(assay, truth):
+	err = []
+	for s in assay.get_samples_except_untreated():
+		true = truth[s.name()]
+		where = ~numpy.isnan(true)
+		err.append(numpy.abs(s.XELI()[0, where] - true[where]) / true[where])
+	err = numpy.concatenate(err)
+	return dict(xeli_mean_rel_error = float(err.mean()),
+				xeli_max_rel_error = float(err.max()))
+
+
+# wall time of each sample stage, summed up over samples (see StageTimer)
+def stage_wall(timer):
+	ret = {}
+	for (sample, stage), rec in timer.records().items():
+		ret[stage] = ret.get(stage, 0.0) + rec["wall"]
+	return ret
+
+
+# OD and GFP (sample, time, e-line well) of all tiles of a plate
+def eline_tensors(data):
+	where = (tile_categories(TILE[0], TILE[1], N_ELINE) == "ELINE")
+	rows, cols = numpy.nonzero(where)
+	offsets = tile_grid(data.plate_shape(), TILE)
+	ret = []
+	for dset in ("OD", "GFP", "MASK"):
+		ret.append(numpy.stack([data.cells_data(dset, rows + r, cols + c)
+								for r, c in offsets]))
+	return ret
+
+
+################################################################################
+# all stages of one plate type and read count
+def run_case(tmp, plate_type, n_reads, args):
+	nr, nc = plate_type_to_shape(plate_type)
+	layout_file = tiled_layout(tmp, TILE[0], TILE[1], N_ELINE)
+	data_file = os.path.join(tmp, "plate_%d_%d.txt" % (plate_type, n_reads))
+	size = nr * nc * n_reads
+	case = dict(plate_type = plate_type, reads = n_reads, wells = nr * nc,
+				samples = len(tile_grid((nr, nc), TILE)))
+	ret = []
+
+	def add(stage, m, **extra):
+		m.update(case, stage = stage, throughput = size / m["time"], **extra)
+		ret.append(m)
+
+	def generate(arg):
+		OD, GFP, truth = synthetic_assay(plate_type, n_reads, TILE, N_ELINE)
+		write_synergy_export(data_file, OD, GFP, args.overflow_rate)
+		return truth
+	add("generate", measure(generate, args.repeat))
+	truth = generate(None)
+
+	file_size = os.path.getsize(data_file)
+	for engine in sorted(DataParser.parse_engines):
+		parser = DataParser(data_file, plate_type, parse_func = engine)
+		m = measure(lambda arg: parser.parse(), args.repeat)
+		add("parse_" + engine, m, bytes_per_s = file_size / m["time"])
+	data = parser.parse()
+
+	OD, GFP, MASK = eline_tensors(data)
+	add("eline_regress", measure(lambda arg:
+		ELineCorre.regress(OD, GFP, MASK), args.repeat))
+
+	for mode in MODES:
+		setup = lambda: new_plate(tmp, data_file, layout_file, plate_type,
+								analysis_mode = mode)
+		m = measure(lambda assay: assay.analyze(), args.repeat, setup)
+		assay = setup()
+		timer = assay.enable_timing()
+		assay.analyze()
+		add("analyze_" + mode, m, stage_wall = stage_wall(timer),
+			**xeli_error(assay, truth))
+
+	path = os.path.join(tmp, "results.npz")
+	def store(arg):
+		results = PlateResultsStore(path, backend = "npz")
+		for sample in assay.all_samples():
+			results.add_sample(sample)
+		results.save()
+	add("results_store", measure(store, args.repeat))
+	return ret
+
+
+################################################################################
+# compare with an older result file, by stage, plate type and read count
+# returns the number of regressions
+def compare(results, old_file, tolerance):
+	with open(old_file, "r") as fh:
+		old = json.load(fh)
+	key = lambda i: (i["stage"], i["plate_type"], i["reads"])
+	print("\ncompared to %s (commit %s)" % (old_file,
+		old["meta"].get("commit")))
+	old = {key(i): i for i in old["results"]}
+	print("stage\twells\treads\told\tnew\tratio")
+	n = 0
+	for i in results:
+		if not (key(i) in old):
+			continue
+		ratio = i["time"] / old[key(i)]["time"]
+		flag = ""
+		if ratio > 1 + tolerance:
+			flag = "\tREGRESSION"
+			n += 1
+		print("%s\t%d\t%d\t%.4f\t%.4f\t%.2f%s" % (i["stage"], i["wells"],
+			i["reads"], old[key(i)]["time"], i["time"], ratio, flag))
+	return n
+
+
+def main():
+	args = get_args()
+	results = []
+	print("stage\twells\treads\ttime\twell-reads/s\tpeak_MiB")
+	with tempfile.TemporaryDirectory() as tmp:
+		for plate_type in [int(i) for i in args.plate_types.split(",")]:
+			for n_reads in [int(i) for i in args.reads.split(",")]:
+				for i in run_case(tmp, plate_type, n_reads, args):
+					print("%s\t%d\t%d\t%.4f\t%.3g\t%.1f" % (i["stage"],
+						i["wells"], i["reads"], i["time"], i["throughput"],
+						i["peak_bytes"] / 2 ** 20))
+					results.append(i)
+	meta = dict(commit = git_commit(),
+				date = datetime.datetime.now().isoformat(timespec = "seconds"),
+				python = platform.python_version(), numpy = numpy.__version__,
+				platform = platform.platform(), args = vars(args))
+	with open(args.output, "w") as fh:
+		json.dump(dict(meta = meta, results = results), fh, indent = 1)
+	if args.compare and compare(results, args.compare, args.tolerance):
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+################################################################################
+# latency of AssayPlate.sweep over a grid of sd_factor values and e-line
+# selections, vs. looping over the grid with a new plate and analyze() for
+# each combination, on a synthetic plate tiled with samples
+# selections are "all", "mad" and the e-line wells without each one of the
+# first two; XELI of every combination is checked against the loop
+# the loop also writes result tables, the sweep writes nothing
+# run from the repository root:
+#   python3 -m benchmark.bench_sweep [-t 384] [-r 100] [-s 1,1.5,2,2.5,3] [-n 3]
+
+import os
+import time
+import argparse
+import tempfile
+import numpy
+from AssayLib.AssayPlate import AssayPlate
+from AssayLib.EColiSample import EColiSample
+from AssayLib.ELineSelector import ELineSelectMask
+from benchmark.synthetic import random_plate, write_synergy_export,\
+	tiled_layout, tile_offsets
+
+
+N_ELINE = 6
+
+
+def get_args():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-t", "--plate-type", type = int, default = 384)
+	ap.add_argument("-r", "--reads", type = int, default = 100)
+	ap.add_argument("-s", "--sd-factors", type = str, default = "1,1.5,2,2.5,3",
+		help = "comma-separated sd_factor values (default: 1,1.5,2,2.5,3)")
+	ap.add_argument("-n", "--repeat", type = int, default = 3)
+	return ap.parse_args()
+
+
+def new_plate(tmp, data_file, layout_file, plate_type, **kw):
+	assay = AssayPlate("plate", plate_type, log_level = "summary",
+						outdir = os.path.join(tmp, ""), overwrite = True,
+						layout = layout_file, data_file = data_file)
+	offsets = tile_offsets(assay.data().plate_shape(), assay.plate_layout())
+	for i, offset in enumerate(offsets):
+		assay.add_sample(EColiSample, name = "C%d" % (i + 1),
+						offset = offset, untreated = (i == 0),
+						eline_plot = "off", **kw)
+	return assay
+
+
+def selections():
+	ret = {"all": "all", "mad": "mad"}
+	for i in range(2):
+		mask = numpy.ones(N_ELINE, dtype = bool)
+		mask[i] = False
+		ret["no_%d" % i] = mask
+	return ret
+
+
+def as_selector(sel):
+	return sel if isinstance(sel, str) else ELineSelectMask(sel)
+
+
+def main():
+	args = get_args()
+	sd_factors = [float(i) for i in args.sd_factors.split(",")]
+	sels = selections()
+	print("wells\treads\tcombinations\tloop\tsweep\tspeedup")
+	with tempfile.TemporaryDirectory() as tmp:
+		layout_file = tiled_layout(tmp, n_eline = N_ELINE)
+		data_file = os.path.join(tmp, "plate.txt")
+		OD, GFP = random_plate(args.plate_type, args.reads)
+		write_synergy_export(data_file, OD, GFP)
+		t_loop, t_sweep = [], []
+		for i in range(args.repeat):
+			t0 = time.perf_counter()
+			assay = new_plate(tmp, data_file, layout_file, args.plate_type,
+							eline_selector = "all")
+			result = assay.sweep(sd_factors, sels)
+			t_sweep.append(time.perf_counter() - t0)
+
+			t0 = time.perf_counter()
+			loop = {}
+			for label, sel in sels.items():
+				for sd in sd_factors:
+					plate = new_plate(tmp, data_file, layout_file,
+									args.plate_type, sd_factor = sd,
+									eline_selector = as_selector(sel))
+					plate.analyze()
+					loop[label, sd] = plate
+			t_loop.append(time.perf_counter() - t0)
+
+		for (label, sd), plate in loop.items():
+			for s in plate.get_samples_except_untreated():
+				assert numpy.array_equal(result.get("XELI", s.name(), label, sd),
+										s.XELI(), equal_nan = True)
+		print("%d\t%d\t%d\t%.4f\t%.4f\t%.2fx" % (args.plate_type, args.reads,
+			len(loop), min(t_loop), min(t_sweep), min(t_loop) / min(t_sweep)))
+
+
+if __name__ == "__main__":
+	main()
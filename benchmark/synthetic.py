@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+################################################################################
+# synthetic plate data in the Synergy reader export format, for benchmarks
+# only the parts of the export used by DataParser are mimicked: header, the
+# 'Layout' block, an OD (Read 1:600) and a GFP (Read 2:485/20,528/20) section
+
+import os
+import numpy
+from AssayLib.UtilFunctions import plate_type_to_shape, well_row_label
+
+
+def well_ids(nr, nc):
+	return ["%s%d" % (well_row_label(r), c + 1)
+			for r in range(nr) for c in range(nc)]
+
+def read_time(i, interval = 300, delay = 31):
+	t = i * interval + delay
+	return "%d:%02d:%02d" % (t // 3600, t % 3600 // 60, t % 60)
+
+
+################################################################################
+# generate a random OD (time, row, col) and GFP (time, row, col) pair
+# OD grows logistically, GFP follows OD with a random per-well expression level
+def random_plate(plate_type, n_reads, seed = 0):
+	nr, nc = plate_type_to_shape(plate_type)
+	rng = numpy.random.default_rng(seed)
+	t = numpy.linspace(0, 1, n_reads).reshape(-1, 1, 1)
+	od0 = rng.uniform(0.25, 0.45, (1, nr, nc))
+	od = od0 + 0.2 / (1 + numpy.exp(-8 * (t - 0.4)))
+	od = od + rng.normal(0, 0.002, od.shape)
+	level = rng.uniform(5000, 30000, (1, nr, nc))
+	gfp = 9000 + level * od + rng.normal(0, 80, od.shape)
+	return od, numpy.rint(gfp).astype(int)
+
+
+################################################################################
+# write OD and GFP arrays into a reader export at 'path'
+# a fraction 'overflow_rate' of the GFP reads are written as OVRFLW
+def write_synergy_export(path, OD, GFP, overflow_rate = 0.0, seed = 0):
+	write_multi_plate_export(path, [(OD, GFP)], overflow_rate, seed)
+
+# export of several plates, as written by a stacker run: one header, then each
+# plate with its 'Plate Number' line, Layout block and read sections
+def write_multi_plate_export(path, plates, overflow_rate = 0.0, seed = 0):
+	rng = numpy.random.default_rng(seed)
+	with open(path, "w", encoding = "cp1252", newline = "\r\n") as fh:
+		fh.write("\n\nSoftware Version\t2.00.18\n\n\n")
+		for i, (OD, GFP) in enumerate(plates):
+			fh.write("\n" if i == 0 else "\n\n\n")
+			_write_plate(fh, "Plate %d" % (i + 1), OD, GFP, overflow_rate, rng)
+
+def _write_plate(fh, label, OD, GFP, overflow_rate, rng):
+	n_reads, nr, nc = OD.shape
+	wells = well_ids(nr, nc)
+	od_text = numpy.char.mod("%.3f", OD.reshape(n_reads, -1))
+	gfp_text = numpy.char.mod("%d", GFP.reshape(n_reads, -1)).astype("<U8")
+	gfp_text[rng.random(gfp_text.shape) < overflow_rate] = "OVRFLW"
+
+	fh.write("Plate Number\t%s\n" % label)
+	fh.write("Reader Type:\tSynergy H1\n\nStart Kinetic\t%d Reads\n\n" % n_reads)
+	fh.write("Layout\n\t%s\n" % "\t".join([str(i + 1) for i in range(nc)]))
+	for r in range(nr):
+		spl = ["SPL%d" % (c * nr + r + 1) for c in range(nc)]
+		fh.write("%s\t%s\tWell ID\n" % (well_row_label(r), "\t".join(spl)))
+	for name, delay, table in (("1:600", 31, od_text),
+							("2:485/20,528/20", 41, gfp_text)):
+		fh.write("\nRead %s\n\nTime\tTM-0 Read %s\t%s\n" % (name, name,
+															"\t".join(wells)))
+		for i, row in enumerate(table):
+			fh.write("%s\t37.0\t%s\n" % (read_time(i, delay = delay),
+										"\t".join(row)))
+	fh.write("\n")
+
+
+################################################################################
+# tile layouts: a tile of 'nr' x 'nc' cells is the layout of one sample, the
+# first cell is BLANK, next 'n_eline' cells in the first column are ELINE, all
+# others are genes; samples tile the whole plate
+def tile_categories(nr = 8, nc = 6, n_eline = 2):
+	cates = numpy.full((nr, nc), "GENE", dtype = object)
+	cates[1:n_eline + 1, 0] = "ELINE"
+	cates[0, 0] = "BLANK"
+	return cates
+
+# write the layout of a tile into 'out_dir'
+def tiled_layout(out_dir, nr = 8, nc = 6, n_eline = 2):
+	path = os.path.join(out_dir, "tile_%dx%d.layout" % (nr, nc))
+	cates = tile_categories(nr, nc, n_eline)
+	with open(path, "w") as fh:
+		for r in range(nr):
+			for c in range(nc):
+				if cates[r, c] == "BLANK":
+					gene = "BLANK"
+				elif cates[r, c] == "ELINE":
+					gene = "U66"
+				else:
+					gene = "g%d_%d" % (r, c)
+				fh.write("%d\t%d\t%s\t%s\n" % (r, c, gene, cates[r, c]))
+	return path
+
+def tile_grid(plate_shape, tile_shape):
+	lr, lc = tile_shape
+	return [numpy.array([r, c]) for r in range(0, plate_shape[0] - lr + 1, lr)
+			for c in range(0, plate_shape[1] - lc + 1, lc)]
+
+def tile_offsets(plate_shape, layout):
+	return tile_grid(plate_shape, layout.extension_size())
+
+
+################################################################################
+# plate of samples with known XELI, tiled as by tiled_layout(nr, nc, n_eline)
+# samples are named C1, C2, ... in the order of tile_grid, C1 is untreated
+# the model follows the analysis of EColiSample, all times are fractions of
+# the whole run (0 to 1):
+#   OD:  blank (medium) OD plus logistic growth from 0.05, random capacity,
+#        rate and midpoint per well
+#   GFP: blank GFP, plus e-line (promoterless) background slope * OD +
+#        intercept, plus P * OD for genes
+#   P:   an expression level per gene, rising slowly over time, the same in
+#        all samples; in treated samples times a fold change, which is
+#        exp(effect * (1 - exp(-t / 0.2))), for a 'responsive' fraction of
+#        the genes with effect ~ N(0, effect_sd), otherwise 1
+# so the true XELI of a gene is the time average of exp(|log fold change|)
+# noise of OD and GFP reads is normal with sd od_noise and gfp_noise
+# returns OD (time, row, col), GFP (time, row, col) and the true XELI of the
+# treated samples, {name: (well,)} in layout order, nan if not a gene
+def synthetic_assay(plate_type, n_reads, tile = (8, 6), n_eline = 2, seed = 0,
+					responsive = 0.25, effect_sd = 1.0, od_noise = 0.001,
+					gfp_noise = 20):
+	nr, nc = plate_type_to_shape(plate_type)
+	rng = numpy.random.default_rng(seed)
+	t = numpy.linspace(0, 1, n_reads).reshape(-1, 1, 1)
+	cates = tile_categories(tile[0], tile[1], n_eline)
+	offsets = tile_grid((nr, nc), tile)
+	if not offsets:
+		raise ValueError("tile %s does not fit in plate size '%s'" %\
+			(str(tile), str(plate_type)))
+
+	capacity = rng.uniform(0.4, 0.8, (1, nr, nc))
+	rate = rng.uniform(8, 14, (1, nr, nc))
+	midpoint = rng.uniform(0.3, 0.5, (1, nr, nc))
+	growth = 0.05 + capacity / (1 + numpy.exp(-rate * (t - midpoint)))
+	blank_OD = 0.04 + rng.normal(0, od_noise, (n_reads, 1, 1))
+	blank_GFP = 9000 + 300 * t + rng.normal(0, gfp_noise, (n_reads, 1, 1))
+
+	# e-line background and P of each well; blank wells only have the blank
+	bg_slope = numpy.zeros((1, nr, nc))
+	bg_inter = numpy.zeros((1, nr, nc))
+	P = numpy.zeros((n_reads, nr, nc))
+	is_blank = numpy.zeros((nr, nc), dtype = bool)
+	level = rng.uniform(5000, 30000, tile) * (1 + 0.3 * t)
+	ramp = 1 - numpy.exp(-t / 0.2)
+	truth = {}
+	for i, (r, c) in enumerate(offsets):
+		cells = (slice(r, r + tile[0]), slice(c, c + tile[1]))
+		is_blank[cells] = (cates == "BLANK")
+		bg_slope[(slice(None),) + cells] = 2000 + rng.normal(0, 50, tile)
+		bg_inter[(slice(None),) + cells] = 100 + rng.normal(0, 20, tile)
+		gene = (cates == "GENE")
+		effect = numpy.zeros(tile)
+		if i:
+			hit = gene & (rng.random(tile) < responsive)
+			effect[hit] = rng.normal(0, effect_sd, hit.sum())
+			xeli = numpy.exp(numpy.abs(effect * ramp)).mean(axis = 0)
+			truth["C%d" % (i + 1)] = numpy.where(gene, xeli, numpy.nan).ravel()
+		P[(slice(None),) + cells] = numpy.where(gene,
+			level * numpy.exp(effect * ramp), 0)
+
+	growth[:, is_blank] = 0
+	bg_slope[:, is_blank] = 0
+	bg_inter[:, is_blank] = 0
+	OD = blank_OD + growth + rng.normal(0, od_noise, growth.shape)
+	GFP = blank_GFP + (bg_slope + P) * growth + bg_inter +\
+		rng.normal(0, gfp_noise, growth.shape)
+	return OD, numpy.rint(GFP).astype(int), truth
@@ -1,28 +1,14 @@
 #!/usr/bin/env python3
 
-from AssayLib.Layout import Layout
-
-layout = Layout()
-layout.build_from_maps( gene_map = "./collections/EColi96/layout_map/EColi.96.P1.gene_map.tsv",
-						cate_map = "./collections/EColi96/layout_map/EColi.96.P1.cate_map.tsv")
-layout.save_layout("./collections/EColi96/EColi.96.P1.layout")
-
-layout.build_from_maps( gene_map = "./collections/EColi96/layout_map/EColi.96.P2.gene_map.tsv",
-						cate_map = "./collections/EColi96/layout_map/EColi.96.P2.cate_map.tsv")
-layout.save_layout("./collections/EColi96/EColi.96.P2.layout")
-
-layout.build_from_maps( gene_map = "./collections/EColi96/layout_map/EColi.96.P3.gene_map.tsv",
-						cate_map = "./collections/EColi96/layout_map/EColi.96.P3.cate_map.tsv")
-layout.save_layout("./collections/EColi96/EColi.96.P3.layout")
-
-layout.build_from_maps( gene_map = "./collections/EColi96/layout_map/EColi.96.P4.gene_map.tsv",
-						cate_map = "./collections/EColi96/layout_map/EColi.96.P4.cate_map.tsv")
-layout.save_layout("./collections/EColi96/EColi.96.P4.layout")
-
-layout.build_from_maps( gene_map = "./collections/EColi96/layout_map/EColi.96.P5.gene_map.tsv",
-						cate_map = "./collections/EColi96/layout_map/EColi.96.P5.cate_map.tsv")
-layout.save_layout("./collections/EColi96/EColi.96.P5.layout")
-
-layout.build_from_maps( gene_map = "./collections/EColi96/layout_map/EColi.96.P6.gene_map.tsv",
-						cate_map = "./collections/EColi96/layout_map/EColi.96.P6.cate_map.tsv")
-layout.save_layout("./collections/EColi96/EColi.96.P6.layout")
+from AssayLib.LayoutRegistry import LayoutRegistry
+
+# compiles every ./collections/EColi96/layout_map/*.gene_map.tsv and
+# *.cate_map.tsv pair into ./collections/EColi96/*.layout, only for the maps
+# changed since last run; compiled layouts are also kept in
+# ./collections/EColi96/layouts.index
+registry = LayoutRegistry("./collections/EColi96")
+for name in registry.refresh():
+	print("compiled: %s" % name)
+
+# shared, read-only layouts by name
+layout = registry.get("EColi.96.P3")
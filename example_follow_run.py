@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import numpy
+from AssayLib.AssayPlate import AssayPlate
+from AssayLib.EColiSample import EColiSample
+from AssayLib.DataParser import StreamingDataParser
+
+# same as example_using_script.py, but the export is followed while the
+# kinetic run is still writing it, and preliminary results are saved each time
+# new reads come in; no data file is loaded when creating the plate
+# the e-line models are fitted once by the first update(), later updates only
+# analyze the new reads; refit = True fits them again on all reads
+assay = AssayPlate("example_follow", 96, overwrite = True,
+					layout = "./example/EColi.96.P2.layout")
+
+assay.add_sample(EColiSample, name = "C1", offset = (0, 0), untreated = True,
+				eline_selector = "all")
+for i in range(1, 6):
+	assay.add_sample(EColiSample, name = "C%d" % (i + 1), offset = (0, i),
+					eline_selector = "all")
+
+parser = StreamingDataParser("./example/plate_data.txt", 96)
+# check every minute, give up if the file stops growing for 10 minutes
+for data in parser.follow(interval = 60, idle_timeout = 600):
+	# e-line regressions need a few reads
+	if len(data.dataset("OD")) < 3:
+		continue
+	n_reads = assay.update(data)
+	for sample in assay.get_samples_except_untreated():
+		print("%d reads\t%s\tmean XELI %.4f" % (n_reads, sample.name(),
+			numpy.nanmean(sample.XELI())))
+# a results store (results_backend "npz" or "hdf5") is not written by each
+# update, but once the run is over
+assay.flush_results()